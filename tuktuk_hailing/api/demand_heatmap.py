@@ -0,0 +1,254 @@
+# Copyright (c) 2024, Sunny Tuktuk and contributors
+# For license information, please see license.txt
+
+"""
+Demand heatmap tiles
+
+An hourly job bins the pickups of recent Ride Requests into geohash cells
+(about 1.2 x 0.6 km) per day of week and hour of day. The database does
+the heavy lifting in one GROUP BY over a ~100 m grid; Python only maps the
+grid points to geohashes. Each (day, hour) slot is stored as a compact
+{geohash: requests per hour} tile in one Redis hash, so the workspace map
+and the drivers' hot zones overlay get a tile with a single lookup. When the
+tiles are missing (new site, Redis flushed) the endpoint answers with no
+cells and enqueues one rebuild instead of running the query itself.
+"""
+
+import frappe
+from frappe.utils import cint, flt, now_datetime, add_to_date
+import json
+
+HEATMAP_KEY = "demand_heatmap"
+
+# Rebuilt hourly; kept a little longer so a late job never leaves a gap
+HEATMAP_TTL = 2 * 3600
+
+# Eight weeks gives every day/hour slot eight samples
+HEATMAP_WINDOW_DAYS = 56
+
+# Precision 6: cells of about 1.2 x 0.6 km
+GEOHASH_PRECISION = 6
+GEOHASH_ALPHABET = "0123456789bcdefghjkmnpqrstuvwxyz"
+
+# Grid the database groups by before cells are assigned (~110 m)
+GRID_DECIMALS = 3
+
+ALL_DAYS = "all"
+
+# Held while a rebuild requested by the endpoint is queued or running
+HEATMAP_BUILD_LOCK_KEY = "demand_heatmap_build"
+HEATMAP_BUILD_LOCK_SECONDS = 10 * 60
+
+def update_demand_heatmap():
+    """
+    Scheduled job: rebuild every heatmap tile
+    Runs hourly via scheduler
+    """
+    tiles = build_demand_tiles()
+    store_demand_tiles(tiles)
+    return len(tiles)
+
+def build_demand_tiles(now=None):
+    """{(day, hour): {geohash: requests per hour}} from recent Ride Requests"""
+    now = now or now_datetime()
+
+    rows = frappe.db.sql("""
+        SELECT
+            ROUND(pickup_latitude, %(decimals)s) AS lat,
+            ROUND(pickup_longitude, %(decimals)s) AS lng,
+            WEEKDAY(requested_at) AS day,
+            HOUR(requested_at) AS hour,
+            COUNT(*)
+        FROM `tabRide Request`
+        WHERE requested_at >= %(since)s
+            AND pickup_latitude IS NOT NULL
+            AND pickup_longitude IS NOT NULL
+        GROUP BY lat, lng, day, hour
+    """, {"decimals": GRID_DECIMALS, "since": add_to_date(now, days=-HEATMAP_WINDOW_DAYS)})
+
+    return bin_demand(rows, HEATMAP_WINDOW_DAYS / 7)
+
+def bin_demand(rows, weeks):
+    """
+    Sum grouped counts into geohash cells per slot
+
+    Args:
+        rows: [(lat, lng, weekday 0-6, hour, count), ...]
+        weeks: Length of the window, to turn counts into averages
+    Returns {(day, hour): {geohash: requests per hour}}; day ALL_DAYS averages the week
+    """
+    cells = {}
+    tiles = {}
+
+    for lat, lng, day, hour, count in rows:
+        point = (flt(lat), flt(lng))
+        if point not in cells:
+            cells[point] = encode_geohash(*point)
+        geohash = cells[point]
+
+        for slot, samples in (((cint(day), cint(hour)), weeks), ((ALL_DAYS, cint(hour)), weeks * 7)):
+            tile = tiles.setdefault(slot, {})
+            tile[geohash] = tile.get(geohash, 0) + cint(count) / samples
+
+    return {
+        slot: {geohash: round(value, 2) for geohash, value in tile.items() if round(value, 2) > 0}
+        for slot, tile in tiles.items()
+    }
+
+def store_demand_tiles(tiles):
+    """Replace all stored tiles in one transaction"""
+    try:
+        cache = frappe.cache()
+        key = cache.make_key(HEATMAP_KEY)
+
+        mapping = {
+            f"{day}:{hour}": json.dumps(tile, separators=(",", ":"))
+            for (day, hour), tile in tiles.items()
+        }
+        # Marks the tiles as built, even when there was no demand at all
+        mapping["built_at"] = str(now_datetime())
+
+        pipeline = cache.pipeline()
+        pipeline.delete(key)
+        pipeline.hset(key, mapping=mapping)
+        pipeline.expire(key, HEATMAP_TTL)
+        pipeline.execute()
+    except Exception as e:
+        frappe.log_error(f"Cache error: {str(e)}", "Demand Heatmap")
+
+def get_demand_tile(day, hour):
+    """Stored tile for a slot, or None if the tiles are not built"""
+    cache = frappe.cache()
+    key = cache.make_key(HEATMAP_KEY)
+
+    # Raw hmget: frappe's hget would prefix the key again and unpickle the value
+    tile, built_at = cache.hmget(key, [f"{day}:{hour}", "built_at"])
+
+    if built_at is None:
+        return None
+
+    # Slots without demand have no entry
+    return json.loads(tile) if tile else {}
+
+@frappe.whitelist()
+def get_demand_heatmap(bounds=None, hour=None, day=None):
+    """
+    Demand cells for the map
+
+    Args:
+        bounds: "south,west,north,east" (or a JSON list); all cells when omitted
+        hour: Hour of day 0-23 (defaults to the current hour)
+        day: Day of week 0-6, Monday first (defaults to the average of all days)
+    """
+    now = now_datetime()
+    hour = now.hour if hour in (None, "") else cint(hour) % 24
+    day = ALL_DAYS if day in (None, "", ALL_DAYS) else cint(day) % 7
+
+    try:
+        tile = get_demand_tile(day, hour)
+    except Exception:
+        tile = None
+
+    building = tile is None
+    if building:
+        # Not built yet (or Redis was flushed): the query is too slow for a web request
+        request_heatmap_build()
+        tile = {}
+
+    box = parse_bounds(bounds)
+    cells = []
+
+    for geohash, intensity in tile.items():
+        south, west, north, east = decode_geohash(geohash)
+
+        if box and (north < box[0] or south > box[2] or east < box[1] or west > box[3]):
+            continue
+
+        cells.append({
+            "geohash": geohash,
+            "lat": round((south + north) / 2, 6),
+            "lng": round((west + east) / 2, 6),
+            "bounds": [[south, west], [north, east]],
+            "intensity": intensity
+        })
+
+    cells.sort(key=lambda cell: -cell["intensity"])
+
+    return {
+        "hour": hour,
+        "day": day,
+        "cells": cells,
+        "max_intensity": cells[0]["intensity"] if cells else 0,
+        "building": building
+    }
+
+def request_heatmap_build():
+    """Enqueue a rebuild of the tiles, once for all callers until it is done"""
+    try:
+        cache = frappe.cache()
+
+        if cache.set(cache.make_key(HEATMAP_BUILD_LOCK_KEY), 1, nx=True, ex=HEATMAP_BUILD_LOCK_SECONDS):
+            frappe.enqueue("tuktuk_hailing.api.demand_heatmap.update_demand_heatmap", queue="long")
+    except Exception as e:
+        frappe.log_error(f"Heatmap build error: {str(e)}", "Demand Heatmap")
+
+def parse_bounds(bounds):
+    """(south, west, north, east) from a string or list, or None"""
+    if not bounds:
+        return None
+
+    if isinstance(bounds, str):
+        bounds = frappe.parse_json(bounds) if bounds.strip().startswith("[") else bounds.split(",")
+
+    if len(bounds) != 4:
+        frappe.throw("Bounds must be south,west,north,east")
+
+    return tuple(flt(value) for value in bounds)
+
+def encode_geohash(lat, lng, precision=GEOHASH_PRECISION):
+    """Geohash of a point"""
+    lat_range, lng_range = [-90.0, 90.0], [-180.0, 180.0]
+    geohash = []
+    bits = value = 0
+    even = True
+
+    while len(geohash) < precision:
+        coordinate, limits = (lng, lng_range) if even else (lat, lat_range)
+        middle = (limits[0] + limits[1]) / 2
+
+        if coordinate >= middle:
+            value = (value << 1) | 1
+            limits[0] = middle
+        else:
+            value <<= 1
+            limits[1] = middle
+
+        even = not even
+        bits += 1
+
+        if bits == 5:
+            geohash.append(GEOHASH_ALPHABET[value])
+            bits = value = 0
+
+    return "".join(geohash)
+
+def decode_geohash(geohash):
+    """Cell of a geohash as (south, west, north, east)"""
+    lat_range, lng_range = [-90.0, 90.0], [-180.0, 180.0]
+    even = True
+
+    for character in geohash:
+        value = GEOHASH_ALPHABET.index(character)
+
+        for shift in range(4, -1, -1):
+            limits = lng_range if even else lat_range
+            middle = (limits[0] + limits[1]) / 2
+
+            if value >> shift & 1:
+                limits[0] = middle
+            else:
+                limits[1] = middle
+
+            even = not even
+
+    return lat_range[0], lng_range[0], lat_range[1], lng_range[1]
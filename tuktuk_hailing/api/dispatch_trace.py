@@ -0,0 +1,207 @@
+# Copyright (c) 2024, Sunny Tuktuk and contributors
+# For license information, please see license.txt
+
+"""
+Dispatch funnel tracing
+
+Each step of a ride's dispatch is written to Ride Dispatch Event with the
+milliseconds since the ride was requested: Requested, Notified (with the
+wave number and how many drivers were sent the request), Accepted, Accept
+Lost (a driver who tried to take a ride another driver already had), En
+Route and the final Completed, Cancelled or Expired. An event is a single
+INSERT of a few columns; the pickup zone and hour come from the Ride Request
+when the report is built.
+
+get_dispatch_latency_report gives percentiles of the time to notify, to
+accept and to en route by hour of day and by pickup zone, so the effect of
+dispatch changes can be measured.
+"""
+
+import frappe
+from frappe.utils import cint, flt, now_datetime, add_to_date, get_datetime
+from tuktuk_hailing.api.demand_heatmap import encode_geohash, decode_geohash
+
+# Event recorded when a Ride Request reaches a status
+STATUS_EVENTS = {
+    "Pending": "Requested",
+    "Accepted": "Accepted",
+    "En Route": "En Route",
+    "Completed": "Completed",
+    "Cancelled": "Cancelled",
+    "Expired": "Expired"
+}
+
+# Funnel steps timed by the report: (event, report field)
+FUNNEL_STEPS = (
+    ("Notified", "time_to_notify_ms"),
+    ("Accepted", "time_to_accept_ms"),
+    ("En Route", "time_to_en_route_ms")
+)
+
+REPORT_PERCENTILES = (50, 90, 95)
+
+# Precision 5: zones of about 4.9 x 4.9 km
+ZONE_PRECISION = 5
+
+# Events older than this are dropped by the daily job
+RETENTION_DAYS = 90
+
+def record_dispatch_event(ride_request, event, driver=None, wave=0, drivers_notified=0, at=None):
+    """
+    Add one event to a ride's dispatch log
+
+    Args:
+        ride_request: Ride Request document (or dict with name and requested_at)
+        event: Event name, one of the Ride Dispatch Event options
+        driver: TukTuk Driver the event is about
+        wave: Notification wave number
+        drivers_notified: Drivers sent the request in this wave
+        at: Event time (defaults to now)
+    """
+    at = get_datetime(at or now_datetime())
+    requested_at = get_datetime(ride_request.get("requested_at") or at)
+
+    try:
+        frappe.db.sql("""
+            INSERT INTO `tabRide Dispatch Event`
+                (name, ride_request, event, event_at, elapsed_ms, driver, wave, drivers_notified,
+                 creation, modified, owner, modified_by)
+            VALUES
+                (%(name)s, %(ride_request)s, %(event)s, %(at)s, %(elapsed_ms)s, %(driver)s, %(wave)s, %(drivers_notified)s,
+                 %(at)s, %(at)s, %(user)s, %(user)s)
+        """, {
+            "name": frappe.generate_hash(length=10),
+            "ride_request": ride_request.get("name"),
+            "event": event,
+            "at": at,
+            "elapsed_ms": max(0, int((at - requested_at).total_seconds() * 1000)),
+            "driver": driver,
+            "wave": cint(wave),
+            "drivers_notified": cint(drivers_notified),
+            "user": frappe.session.user
+        })
+    except Exception as e:
+        # Never fail a ride because of tracing
+        frappe.log_error(f"Dispatch trace error: {str(e)}", "Dispatch Trace")
+
+def record_status_event(ride_request, old_status):
+    """Record the event for a Ride Request status change"""
+    event = STATUS_EVENTS.get(ride_request.status)
+
+    if not event or old_status == ride_request.status:
+        return
+
+    driver = ride_request.accepted_by_driver if event == "Accepted" else None
+    record_dispatch_event(ride_request, event, driver=driver)
+
+@frappe.whitelist()
+def get_dispatch_latency_report(from_date=None, to_date=None):
+    """
+    Dispatch latency percentiles by hour of day and by pickup zone
+
+    Args:
+        from_date: Start of the window (defaults to 7 days before to_date)
+        to_date: End of the window (defaults to now)
+    """
+    frappe.has_permission("Ride Dispatch Event", throw=True)
+
+    to_date = get_datetime(to_date) if to_date else now_datetime()
+    from_date = get_datetime(from_date) if from_date else add_to_date(to_date, days=-7)
+
+    # First time of each step per ride; the database does the grouping
+    rows = frappe.db.sql("""
+        SELECT
+            request.name,
+            request.pickup_latitude,
+            request.pickup_longitude,
+            HOUR(request.requested_at),
+            event.event,
+            MIN(event.elapsed_ms),
+            SUM(event.drivers_notified),
+            COUNT(*)
+        FROM `tabRide Request` request
+        JOIN `tabRide Dispatch Event` event ON event.ride_request = request.name
+        WHERE request.requested_at BETWEEN %(from_date)s AND %(to_date)s
+            AND event.event IN ('Requested', 'Notified', 'Accepted', 'Accept Lost', 'En Route')
+        GROUP BY request.name, event.event
+    """, {"from_date": from_date, "to_date": to_date})
+
+    report = summarize_dispatch(rows)
+    report.update({"from_date": str(from_date), "to_date": str(to_date)})
+
+    return report
+
+def summarize_dispatch(rows):
+    """
+    Funnel statistics overall, by hour and by zone
+
+    Args:
+        rows: [(ride, pickup lat, pickup lng, hour, event, first elapsed ms, drivers notified, events), ...]
+    """
+    rides = {}
+
+    for ride, lat, lng, hour, event, elapsed_ms, notified, count in rows:
+        if ride not in rides:
+            zone = encode_geohash(flt(lat), flt(lng), ZONE_PRECISION) if lat is not None and lng is not None else None
+            rides[ride] = {"hour": cint(hour), "zone": zone, "events": {}}
+        rides[ride]["events"][event] = (cint(elapsed_ms), cint(notified), cint(count))
+
+    by_hour, by_zone = {}, {}
+    for ride in rides.values():
+        by_hour.setdefault(ride["hour"], []).append(ride)
+        by_zone.setdefault(ride["zone"], []).append(ride)
+
+    zones = []
+    for zone, group in by_zone.items():
+        stats = get_funnel_stats(group)
+        if zone:
+            south, west, north, east = decode_geohash(zone)
+            stats.update({"lat": round((south + north) / 2, 6), "lng": round((west + east) / 2, 6)})
+        zones.append(dict(zone=zone, **stats))
+
+    zones.sort(key=lambda row: -row["rides"])
+
+    return {
+        "overall": get_funnel_stats(list(rides.values())),
+        "by_hour": [dict(hour=hour, **get_funnel_stats(by_hour[hour])) for hour in sorted(by_hour)],
+        "by_zone": zones
+    }
+
+def get_funnel_stats(rides):
+    """Counts and step latency percentiles for a group of rides"""
+    accepted = sum(1 for ride in rides if "Accepted" in ride["events"])
+    notifications = [ride["events"]["Notified"] for ride in rides if "Notified" in ride["events"]]
+
+    stats = {
+        "rides": len(rides),
+        "accepted": accepted,
+        "accept_rate": round(accepted / len(rides) * 100, 1) if rides else 0,
+        "lost_accepts": sum(ride["events"].get("Accept Lost", (0, 0, 0))[2] for ride in rides),
+        "avg_drivers_notified": round(sum(notified for _ms, notified, _count in notifications) / len(notifications), 1) if notifications else 0,
+        "avg_waves": round(sum(count for _ms, _notified, count in notifications) / len(notifications), 2) if notifications else 0
+    }
+
+    for event, field in FUNNEL_STEPS:
+        samples = [ride["events"][event][0] for ride in rides if event in ride["events"]]
+        stats[field] = {f"p{pct}": percentile(samples, pct) for pct in REPORT_PERCENTILES}
+
+    return stats
+
+def percentile(samples, pct):
+    """Nearest-rank percentile of a list of numbers (None when empty)"""
+    ordered = sorted(samples)
+    if not ordered:
+        return None
+    rank = max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered))) - 1))
+    return ordered[rank]
+
+def prune_dispatch_events():
+    """
+    Scheduled job: drop events older than RETENTION_DAYS
+    Runs daily via scheduler
+    """
+    frappe.db.delete("Ride Dispatch Event", {
+        "event_at": ["<", add_to_date(now_datetime(), days=-RETENTION_DAYS)]
+    })
+
+    frappe.db.commit()
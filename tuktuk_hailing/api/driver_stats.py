@@ -0,0 +1,88 @@
+# Copyright (c) 2024, Sunny Tuktuk and contributors
+# For license information, please see license.txt
+
+"""
+Driver hailing statistics as counters
+
+Each TukTuk Driver keeps a trip count, a sum of ratings and a rating count.
+Trips and ratings change them with a single UPDATE that adds to the stored
+values, so concurrent completions never load and save the driver document
+and cannot overwrite each other. The average is derived from the sum and
+count. A daily job rebuilds all counters from Ride Trip in one statement,
+correcting any drift (deleted trips, edits made outside the app).
+"""
+
+import frappe
+from frappe.utils import cint, flt
+
+STAT_FIELDS = ("total_hailing_trips", "hailing_rating_sum", "hailing_rating_count", "average_hailing_rating")
+
+def has_stat_fields():
+    """Whether TukTuk Driver has the counter fields (see the add_driver_stat_fields patch)"""
+    meta = frappe.get_meta("TukTuk Driver")
+    return all(meta.has_field(fieldname) for fieldname in STAT_FIELDS)
+
+def record_driver_stats(driver_id, trips=0, rating_sum=0, ratings=0):
+    """
+    Add to a driver's counters in one statement
+
+    Args:
+        driver_id: TukTuk Driver
+        trips: Change in trip count
+        rating_sum: Change in the sum of ratings
+        ratings: Change in the number of rated trips
+    """
+    if not driver_id or not (trips or rating_sum or ratings) or not has_stat_fields():
+        return
+
+    # The average comes first: MariaDB evaluates assignments left to right
+    # with already-updated values, so it must still see the old sum and count
+    frappe.db.sql("""
+        UPDATE `tabTukTuk Driver`
+        SET
+            average_hailing_rating = CASE
+                WHEN COALESCE(hailing_rating_count, 0) + %(ratings)s > 0
+                THEN ROUND((COALESCE(hailing_rating_sum, 0) + %(rating_sum)s) / (COALESCE(hailing_rating_count, 0) + %(ratings)s), 2)
+                ELSE 0
+            END,
+            total_hailing_trips = COALESCE(total_hailing_trips, 0) + %(trips)s,
+            hailing_rating_sum = COALESCE(hailing_rating_sum, 0) + %(rating_sum)s,
+            hailing_rating_count = COALESCE(hailing_rating_count, 0) + %(ratings)s
+        WHERE name = %(driver)s
+    """, {
+        "driver": driver_id,
+        "trips": cint(trips),
+        "rating_sum": flt(rating_sum),
+        "ratings": cint(ratings)
+    })
+
+def reconcile_driver_stats():
+    """
+    Scheduled job: rebuild every driver's counters from Ride Trip
+    Runs daily via scheduler
+    """
+    if not has_stat_fields():
+        return
+
+    frappe.db.sql("""
+        UPDATE `tabTukTuk Driver` driver
+        LEFT JOIN (
+            SELECT
+                driver,
+                COUNT(*) AS trips,
+                COALESCE(SUM(customer_rating), 0) AS rating_sum,
+                COUNT(NULLIF(customer_rating, 0)) AS ratings
+            FROM `tabRide Trip`
+            GROUP BY driver
+        ) stats ON stats.driver = driver.name
+        SET
+            driver.average_hailing_rating = CASE
+                WHEN stats.ratings > 0 THEN ROUND(stats.rating_sum / stats.ratings, 2)
+                ELSE 0
+            END,
+            driver.total_hailing_trips = COALESCE(stats.trips, 0),
+            driver.hailing_rating_sum = COALESCE(stats.rating_sum, 0),
+            driver.hailing_rating_count = COALESCE(stats.ratings, 0)
+    """)
+
+    frappe.db.commit()
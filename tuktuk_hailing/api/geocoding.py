@@ -0,0 +1,444 @@
+# Copyright (c) 2024, Sunny Tuktuk and contributors
+# For license information, please see license.txt
+
+"""
+Server-side geocoding with a persistent cache in front of Nominatim
+
+Clients call geocode() only after search_places found nothing locally.
+Resolved addresses are stored in Geocode Cache (keyed by the normalized
+query) and mirrored in Redis, so repeated lookups never reach Nominatim.
+Queries that Nominatim could not resolve are cached for a shorter time.
+Concurrent misses for the same query share a single upstream request, and
+all upstream requests respect Nominatim's one-request-per-second policy.
+Web requests never wait for either: they answer "pending" at once (a lookup
+that hit the throttle is finished by a background job) and the client
+retries shortly after.
+"""
+
+import frappe
+from frappe.rate_limiter import rate_limit
+from frappe.utils import cint, flt, now_datetime, add_to_date
+from tuktuk_hailing.api.place_index import normalize
+import hashlib
+import json
+import time
+
+GEOCODER_USER_AGENT = "SunnyTuktuk/1.0 (info@sunnytuktuk.com)"
+GEOCODER_TIMEOUT_SECONDS = 5
+
+# Redis copy of a cache entry; expiry is still checked against the entry
+GEOCODE_FAST_CACHE_TTL = 3600
+GEOCODE_HITS_KEY = "geocode_cache_hits"
+
+# Only one worker queries Nominatim for a given query at a time; the others
+# answer "pending" and the client retries after GEOCODE_RETRY_AFTER_SECONDS
+GEOCODE_LOCK_SECONDS = 10
+GEOCODE_RETRY_AFTER_SECONDS = 1
+
+# Background jobs (not web requests) wait this long for an upstream slot
+GEOCODE_JOB_WAIT_SECONDS = 30
+
+# A query handed to a job stays locked until the job is done, or this long
+# if the job never runs; the job renews the lock when it starts
+GEOCODE_JOB_QUEUE_SECONDS = 60
+GEOCODE_JOB_LOCK_SECONDS = GEOCODE_LOCK_SECONDS + GEOCODE_JOB_WAIT_SECONDS
+GEOCODE_POLL_INTERVAL = 0.1
+
+# Nominatim usage policy: at most one request per second per application
+GEOCODER_THROTTLE_KEY = "geocoder_throttle"
+GEOCODER_MIN_INTERVAL_MS = 1000
+
+# Longest key that still fits the Geocode Cache name column
+MAX_QUERY_KEY_LENGTH = 140
+
+# Length of the Geocode Cache query field (Data)
+MAX_QUERY_LENGTH = 140
+
+@frappe.whitelist(allow_guest=True)
+@rate_limit(limit=30, seconds=60)
+def geocode(query):
+    """
+    Resolve an address that has no local match
+    Answers from the geocode cache and only queries Nominatim on a miss
+    Rate limited to 30 requests per minute per IP
+
+    Args:
+        query: Free-text address
+    """
+    query_key = get_query_key(query)
+
+    if len(query_key) < 2:
+        return {"source": "none", "results": []}
+
+    response = get_cached_geocode(query_key)
+
+    if response is None:
+        response = resolve_geocode_miss(query.strip(), query_key)
+    else:
+        record_geocode_hit(query_key)
+
+    return response
+
+def get_query_key(query):
+    """
+    Normalized cache key for an address query
+    Case, accents, punctuation and extra whitespace do not change the key
+    """
+    query_key = normalize(query)
+
+    if len(query_key) > MAX_QUERY_KEY_LENGTH:
+        digest = hashlib.sha1(query_key.encode("utf-8")).hexdigest()
+        query_key = query_key[:MAX_QUERY_KEY_LENGTH - len(digest) - 1] + ":" + digest
+
+    return query_key
+
+def get_fast_cache_key(query_key):
+    return frappe.cache().make_key("geocode:" + query_key)
+
+def get_cached_geocode(query_key):
+    """Cached response for query_key from Redis or Geocode Cache, or None"""
+    cache = frappe.cache()
+
+    try:
+        cached = cache.get(get_fast_cache_key(query_key))
+        if cached:
+            return json.loads(cached)
+    except Exception:
+        pass  # Fall through to the database copy
+
+    entry = frappe.db.get_value(
+        "Geocode Cache",
+        query_key,
+        ["status", "place_name", "display_name", "category", "latitude", "longitude", "expires_at"],
+        as_dict=True
+    )
+
+    if not entry or (entry.expires_at and entry.expires_at <= now_datetime()):
+        return None
+
+    response = format_geocode_response(entry, "cache")
+    set_fast_cache(query_key, response, entry.expires_at)
+
+    return response
+
+def set_fast_cache(query_key, response, expires_at):
+    """Mirror a response in Redis, never beyond the entry's expiry"""
+    ttl = GEOCODE_FAST_CACHE_TTL
+
+    if expires_at:
+        ttl = min(ttl, int((expires_at - now_datetime()).total_seconds()))
+
+    if ttl <= 0:
+        return
+
+    try:
+        frappe.cache().setex(get_fast_cache_key(query_key), ttl, json.dumps(response))
+    except Exception as e:
+        frappe.log_error(f"Cache error: {str(e)}", "Geocode Cache")
+
+def format_geocode_response(entry, source):
+    """Build the geocode response in the search_places result shape"""
+    if entry.status != "Found":
+        return {
+            "source": "none",
+            "results": [],
+            "message": "Location not found"
+        }
+
+    return {
+        "source": source,
+        "results": [{
+            "place_name": entry.place_name,
+            "display_name": entry.display_name,
+            "lat": entry.latitude,
+            "lon": entry.longitude,
+            "category": entry.category,
+            "source": "nominatim"
+        }]
+    }
+
+def get_pending_response():
+    """Answer for a lookup that is still being resolved; the client retries"""
+    return {
+        "source": "none",
+        "results": [],
+        "pending": True,
+        "retry_after": GEOCODE_RETRY_AFTER_SECONDS,
+        "message": "Looking up this address, please retry"
+    }
+
+def get_geocode_lock_key(query_key):
+    return frappe.cache().make_key("geocode_lock:" + query_key)
+
+def resolve_geocode_miss(query, query_key):
+    """
+    Query Nominatim for a cache miss and store the answer, without waiting
+    Only one caller per query does the upstream request; the others answer
+    "pending". When the site-wide upstream slot is taken, the lookup and
+    its lock are handed to a background job, so retries and other callers
+    keep answering "pending" instead of queueing more jobs.
+    """
+    cache = frappe.cache()
+    lock_key = get_geocode_lock_key(query_key)
+
+    if not cache.set(lock_key, 1, nx=True, ex=GEOCODE_LOCK_SECONDS):
+        return get_pending_response()
+
+    handed_off = False
+    try:
+        if not acquire_geocoder_slot():
+            cache.set(lock_key, 1, ex=GEOCODE_JOB_QUEUE_SECONDS + GEOCODE_JOB_LOCK_SECONDS)
+            frappe.enqueue(
+                "tuktuk_hailing.api.geocoding.resolve_geocode_job",
+                queue="short",
+                query=query,
+                query_key=query_key
+            )
+            handed_off = True
+            return get_pending_response()
+
+        return fetch_and_store_geocode(query, query_key)
+    finally:
+        if not handed_off:
+            cache.delete(lock_key)
+
+def resolve_geocode_job(query, query_key):
+    """
+    Background job: resolve a lookup that found the upstream slot taken
+    Owns the query's lock taken by resolve_geocode_miss and releases it when
+    done. Waits for the slot, which web requests never do
+    """
+    cache = frappe.cache()
+    lock_key = get_geocode_lock_key(query_key)
+
+    try:
+        if get_cached_geocode(query_key) is not None:
+            return
+
+        cache.set(lock_key, 1, ex=GEOCODE_JOB_LOCK_SECONDS)
+
+        if acquire_geocoder_slot(wait_seconds=GEOCODE_JOB_WAIT_SECONDS):
+            fetch_and_store_geocode(query, query_key)
+    finally:
+        cache.delete(lock_key)
+
+def fetch_and_store_geocode(query, query_key):
+    """Query Nominatim, store the answer and return the response"""
+    settings = frappe.get_single("Hailing Settings")
+
+    try:
+        results = fetch_nominatim(query, settings)
+    except Exception as e:
+        # Network errors are not cached so the next request retries
+        frappe.log_error(f"Nominatim error: {str(e)}", "Geocoding API Error")
+        return {"source": "none", "results": [], "message": "Geocoding service unavailable"}
+
+    values = get_geocode_values(query, results, settings)
+
+    try:
+        entry = store_geocode_result(query_key, values)
+
+        # Guests reach this through a GET request, which is not auto-committed
+        frappe.db.commit()
+    except Exception as e:
+        # The answer is still good; the next lookup tries to cache it again
+        frappe.db.rollback()
+        frappe.log_error(f"Error caching geocode result: {str(e)}", "Geocode Cache")
+        return format_geocode_response(values, "nominatim")
+
+    set_fast_cache(query_key, format_geocode_response(entry, "cache"), entry.expires_at)
+
+    return format_geocode_response(entry, "nominatim")
+
+def acquire_geocoder_slot(wait_seconds=0):
+    """
+    Take the next upstream request slot (site-wide)
+
+    Args:
+        wait_seconds: How long to keep trying; web requests only try once
+    """
+    cache = frappe.cache()
+    throttle_key = cache.make_key(GEOCODER_THROTTLE_KEY)
+    deadline = time.monotonic() + wait_seconds
+
+    while not cache.set(throttle_key, 1, nx=True, px=GEOCODER_MIN_INTERVAL_MS):
+        if time.monotonic() >= deadline:
+            return False
+        time.sleep(GEOCODE_POLL_INTERVAL)
+
+    return True
+
+def fetch_nominatim(query, settings):
+    """Search Nominatim and return its result list (raises on network errors)"""
+    import requests
+
+    params = {
+        "q": query,
+        "format": "jsonv2",
+        "limit": 1,
+        "bounded": 0
+    }
+
+    if settings.geocoding_viewbox:
+        params["viewbox"] = settings.geocoding_viewbox
+
+    response = requests.get(
+        settings.geocoding_api_url or "https://nominatim.openstreetmap.org/search",
+        params=params,
+        headers={"User-Agent": GEOCODER_USER_AGENT},
+        timeout=GEOCODER_TIMEOUT_SECONDS
+    )
+    response.raise_for_status()
+
+    return response.json()
+
+def get_geocode_values(query, results, settings):
+    """Geocode Cache field values for a Nominatim answer"""
+    values = frappe._dict(query=query[:MAX_QUERY_LENGTH], provider="Nominatim")
+
+    if results:
+        result = results[0]
+        values.update({
+            "status": "Found",
+            "latitude": flt(result.get("lat")),
+            "longitude": flt(result.get("lon")),
+            "display_name": result.get("display_name"),
+            "place_name": (result.get("name") or (result.get("display_name") or query).split(",")[0])[:MAX_QUERY_LENGTH],
+            "category": result.get("type") or result.get("category"),
+            "expires_at": add_to_date(now_datetime(), days=cint(settings.geocode_cache_days) or 30)
+        })
+    else:
+        values.update({
+            "status": "Not Found",
+            "latitude": 0,
+            "longitude": 0,
+            "display_name": None,
+            "place_name": None,
+            "category": None,
+            "expires_at": add_to_date(now_datetime(), hours=cint(settings.geocode_negative_cache_hours) or 24)
+        })
+
+    return values
+
+def store_geocode_result(query_key, values):
+    """Insert or refresh the Geocode Cache entry for query_key"""
+    if frappe.db.exists("Geocode Cache", query_key):
+        entry = frappe.get_doc("Geocode Cache", query_key)
+    else:
+        entry = frappe.new_doc("Geocode Cache")
+        entry.query_key = query_key
+
+    entry.update(values)
+    entry.save(ignore_permissions=True)
+
+    return entry
+
+def record_geocode_hit(query_key):
+    """Count a cache hit in Redis; sync_geocode_cache writes the totals back"""
+    try:
+        cache = frappe.cache()
+        cache.hincrby(cache.make_key(GEOCODE_HITS_KEY), query_key, 1)
+    except Exception:
+        pass  # Hit counts only drive promotion
+
+def sync_geocode_cache():
+    """
+    Scheduled job: persist hit counts, drop expired entries and promote
+    popular results to Hailing Places when enabled
+    """
+    flush_geocode_hits()
+
+    frappe.db.delete("Geocode Cache", {"expires_at": ("<", now_datetime())})
+
+    settings = frappe.get_single("Hailing Settings")
+
+    if settings.promote_geocode_results:
+        promote_popular_geocode_results(cint(settings.geocode_promote_min_hits) or 20)
+
+    frappe.db.commit()
+
+def flush_geocode_hits():
+    """Move hit counts from Redis to Geocode Cache"""
+    cache = frappe.cache()
+    hits_key = cache.make_key(GEOCODE_HITS_KEY)
+
+    # Read and reset in one transaction so no hit is counted twice or lost
+    pipeline = cache.pipeline()
+    pipeline.hgetall(hits_key)
+    pipeline.delete(hits_key)
+    hits = pipeline.execute()[0] or {}
+
+    timestamp = now_datetime()
+
+    for query_key, count in hits.items():
+        if isinstance(query_key, bytes):
+            query_key = query_key.decode("utf-8")
+
+        frappe.db.sql("""
+            UPDATE `tabGeocode Cache`
+            SET hit_count = hit_count + %s, last_hit_at = %s
+            WHERE name = %s
+        """, (cint(count), timestamp, query_key))
+
+def promote_popular_geocode_results(min_hits):
+    """Promote found entries with at least min_hits cache hits"""
+    names = frappe.get_all(
+        "Geocode Cache",
+        filters={
+            "status": "Found",
+            "hit_count": (">=", min_hits),
+            "promoted_place": ("is", "not set")
+        },
+        pluck="name"
+    )
+
+    for name in names:
+        try:
+            promote_geocode_entry(name)
+        except Exception as e:
+            frappe.log_error(f"Error promoting {name}: {str(e)}", "Geocode Promotion Error")
+
+@frappe.whitelist()
+def promote_geocode_entry(name):
+    """
+    Create a Hailing Place from a cached geocoding result
+    Future searches for it are then answered locally
+
+    Args:
+        name: Geocode Cache entry
+    """
+    from tuktuk_hailing.tuktuk_hailing.doctype.hailing_settings.hailing_settings import is_location_in_service_area
+
+    entry = frappe.get_doc("Geocode Cache", name)
+    entry.check_permission("write")
+
+    if entry.status != "Found":
+        return {"success": False, "message": "Entry has no result to promote"}
+
+    if entry.promoted_place:
+        return {"success": True, "place": entry.promoted_place}
+
+    if not is_location_in_service_area(entry.latitude, entry.longitude):
+        return {"success": False, "message": "Location is outside the service area"}
+
+    place_name = entry.place_name or entry.query
+
+    if not frappe.db.exists("Hailing Place", place_name):
+        category = None
+        if entry.category:
+            category = frappe.db.exists("Hailing Place Category", entry.category.replace("_", " ").title())
+
+        frappe.get_doc({
+            "doctype": "Hailing Place",
+            "place_name": place_name,
+            "category": category,
+            "latitude": entry.latitude,
+            "longitude": entry.longitude,
+            "aliases": entry.query if normalize(entry.query) != normalize(place_name) else None,
+            "description": entry.display_name,
+            "is_active": 1
+        }).insert(ignore_permissions=True)
+
+    entry.db_set("promoted_place", place_name)
+
+    return {"success": True, "place": place_name}
@@ -0,0 +1,288 @@
+# Copyright (c) 2024, Sunny Tuktuk and contributors
+# For license information, please see license.txt
+
+"""
+Hailing KPI rollups
+
+Every Ride Request status change adds to three Hailing KPI Rollup rows in a
+single INSERT ... ON DUPLICATE KEY UPDATE: the current minute, the current
+day and the all-time total. The total row also keeps the current number of
+pending and active rides. Number Cards and reports read these rows by key,
+so their cost does not grow with the number of Ride Requests.
+
+A daily job rebuilds the recent day rows and the total from Ride Request,
+correcting any drift (deleted requests, edits made outside the app), and
+drops old minute rows.
+"""
+
+import frappe
+from frappe.utils import cint, flt, now_datetime, add_to_date, getdate, get_datetime
+
+COUNT_FIELDS = ("requests", "accepts", "cancellations", "completions", "revenue")
+GAUGE_FIELDS = ("pending", "active")
+ROLLUP_FIELDS = COUNT_FIELDS + GAUGE_FIELDS
+
+# Statuses counted by each gauge of the total row
+GAUGE_STATUSES = {
+    "pending": ("Pending",),
+    "active": ("Accepted", "En Route")
+}
+
+TOTAL_KEY = "Total"
+
+# Minute rows are for the live view; older ones are dropped by the daily job
+MINUTE_RETENTION_DAYS = 7
+
+# Day rows the daily job rebuilds (today and yesterday)
+REBUILD_DAYS = 2
+
+def get_rollup_key(period, period_start=None):
+    """Row key: "Minute-202610191405", "Day-20261019" or "Total" """
+    if period == "Minute":
+        return f"Minute-{period_start:%Y%m%d%H%M}"
+    if period == "Day":
+        return f"Day-{period_start:%Y%m%d}"
+    return TOTAL_KEY
+
+def get_transition_changes(old_status, new_status, fare=0):
+    """
+    Counter changes for one Ride Request status change
+
+    Args:
+        old_status: Status before the change (None for a new request)
+        new_status: Status after the change
+        fare: Actual fare, counted as revenue on completion
+    Returns (event counts for the period rows, gauge changes for the total row)
+    """
+    counts = {}
+
+    if old_status is None:
+        counts["requests"] = 1
+    if new_status == "Accepted":
+        counts["accepts"] = 1
+    elif new_status == "Cancelled":
+        counts["cancellations"] = 1
+    elif new_status == "Completed":
+        counts["completions"] = 1
+        counts["revenue"] = flt(fare)
+
+    gauges = {}
+    for gauge, statuses in GAUGE_STATUSES.items():
+        change = (1 if new_status in statuses else 0) - (1 if old_status in statuses else 0)
+        if change:
+            gauges[gauge] = change
+
+    return counts, gauges
+
+def record_status_change(old_status, new_status, fare=0, at=None):
+    """Add one Ride Request status change to the minute, day and total rows"""
+    if old_status == new_status:
+        return
+
+    counts, gauges = get_transition_changes(old_status, new_status, fare)
+
+    if not counts and not gauges:
+        return
+
+    minute = get_datetime(at or now_datetime()).replace(second=0, microsecond=0)
+    day = minute.replace(hour=0, minute=0)
+
+    rows = [(TOTAL_KEY, None, dict(counts, **gauges))]
+    if counts:
+        rows = [
+            (get_rollup_key("Minute", minute), minute, counts),
+            (get_rollup_key("Day", day), day, counts)
+        ] + rows
+
+    try:
+        write_rollup_rows(rows)
+    except Exception as e:
+        # Never fail a ride because of dashboard numbers; the daily rebuild catches up
+        frappe.log_error(f"KPI rollup error: {str(e)}", "KPI Rollups")
+
+def write_rollup_rows(rows, replace=False):
+    """
+    Add to (or with replace, overwrite) rollup rows in one statement
+
+    Args:
+        rows: [(rollup_key, period_start, {field: value}), ...]
+        replace: Set the given values instead of adding them
+    """
+    if not rows:
+        return
+
+    now = now_datetime()
+    values = []
+    params = {"now": now, "user": frappe.session.user}
+
+    for index, (key, period_start, changes) in enumerate(rows):
+        params[f"key_{index}"] = key
+        params[f"period_{index}"] = key.split("-")[0]
+        params[f"start_{index}"] = period_start
+        columns = []
+
+        for field in ROLLUP_FIELDS:
+            params[f"{field}_{index}"] = changes.get(field, 0)
+            columns.append(f"%({field}_{index})s")
+
+        values.append(
+            f"(%(key_{index})s, %(key_{index})s, %(period_{index})s, %(start_{index})s, {', '.join(columns)}, "
+            "%(now)s, %(now)s, %(user)s, %(user)s)"
+        )
+
+    if replace:
+        updates = ", ".join(f"{field} = VALUES({field})" for field in ROLLUP_FIELDS)
+    else:
+        updates = ", ".join(f"{field} = {field} + VALUES({field})" for field in ROLLUP_FIELDS)
+
+    frappe.db.sql(f"""
+        INSERT INTO `tabHailing KPI Rollup`
+            (name, rollup_key, period, period_start, {', '.join(ROLLUP_FIELDS)}, creation, modified, owner, modified_by)
+        VALUES {', '.join(values)}
+        ON DUPLICATE KEY UPDATE {updates}, modified = VALUES(modified)
+    """, params)
+
+def get_rollup(key):
+    """One rollup row as a dict; all zero when it does not exist yet"""
+    row = frappe.db.get_value("Hailing KPI Rollup", key, ROLLUP_FIELDS, as_dict=True)
+    return row or frappe._dict({field: 0 for field in ROLLUP_FIELDS})
+
+def get_card_value(field, fieldtype="Int"):
+    """Number Card result from the total row"""
+    return {
+        "value": get_rollup(TOTAL_KEY).get(field) or 0,
+        "fieldtype": fieldtype
+    }
+
+@frappe.whitelist()
+def get_total_ride_requests(filters=None):
+    """Number Card: all Ride Requests ever made"""
+    frappe.has_permission("Hailing KPI Rollup", throw=True)
+
+    return get_card_value("requests")
+
+@frappe.whitelist()
+def get_pending_requests(filters=None):
+    """Number Card: Ride Requests waiting for a driver"""
+    frappe.has_permission("Hailing KPI Rollup", throw=True)
+
+    return get_card_value("pending")
+
+@frappe.whitelist()
+def get_active_rides(filters=None):
+    """Number Card: accepted and en route rides"""
+    frappe.has_permission("Hailing KPI Rollup", throw=True)
+
+    return get_card_value("active")
+
+@frappe.whitelist()
+def get_completed_trips(filters=None):
+    """Number Card: completed rides"""
+    frappe.has_permission("Hailing KPI Rollup", throw=True)
+
+    return get_card_value("completions")
+
+@frappe.whitelist()
+def get_kpi_summary(period="Day", limit=14):
+    """
+    Recent rollup rows with the change of the latest against the one before
+
+    Args:
+        period: "Minute" or "Day"
+        limit: Number of rows, newest first
+    """
+    frappe.has_permission("Hailing KPI Rollup", throw=True)
+
+    if period not in ("Minute", "Day"):
+        frappe.throw("Period must be Minute or Day")
+
+    rows = frappe.get_all(
+        "Hailing KPI Rollup",
+        filters={"period": period},
+        fields=["period_start"] + list(COUNT_FIELDS),
+        order_by="period_start desc",
+        limit_page_length=min(cint(limit) or 14, 1440)
+    )
+
+    change = {}
+    if len(rows) >= 2:
+        for field in COUNT_FIELDS:
+            previous = flt(rows[1][field])
+            change[field] = round((flt(rows[0][field]) - previous) / previous * 100, 1) if previous else None
+
+    return {
+        "total": get_rollup(TOTAL_KEY),
+        "rows": rows,
+        "percentage_change": change
+    }
+
+def rebuild_kpi_rollups(days=REBUILD_DAYS):
+    """
+    Scheduled job: rebuild day rows and the total from Ride Request
+    Runs daily via scheduler; days=None rebuilds every day (backfill)
+    """
+    since = getdate(add_to_date(now_datetime(), days=-(days - 1))) if days else None
+
+    day_rows = {}
+
+    def add_day_counts(field, date_column, value="COUNT(*)", extra_condition=""):
+        condition = f"{date_column} IS NOT NULL {extra_condition}"
+        if since:
+            condition += f" AND {date_column} >= %(since)s"
+
+        for day, count in frappe.db.sql(f"""
+            SELECT DATE({date_column}) AS day, {value}
+            FROM `tabRide Request`
+            WHERE {condition}
+            GROUP BY day
+        """, {"since": since}):
+            day_rows.setdefault(getdate(day), {})[field] = flt(count)
+
+    add_day_counts("requests", "requested_at")
+    add_day_counts("accepts", "accepted_at")
+    add_day_counts("cancellations", "cancelled_at", extra_condition="AND status = 'Cancelled'")
+    # Ride Request has no completion time; its last change is the completion
+    add_day_counts("completions", "modified", extra_condition="AND status = 'Completed'")
+    add_day_counts("revenue", "modified", value="COALESCE(SUM(actual_fare), 0)", extra_condition="AND status = 'Completed'")
+
+    rows = [
+        (get_rollup_key("Day", day), get_datetime(day), counts)
+        for day, counts in day_rows.items()
+    ]
+
+    # Days in the window without any activity are reset too
+    if since:
+        day = since
+        while day <= getdate(now_datetime()):
+            if day not in day_rows:
+                rows.append((get_rollup_key("Day", day), get_datetime(day), {}))
+            day = add_to_date(day, days=1)
+
+    status_counts = dict(frappe.db.sql("""
+        SELECT status, COUNT(*) FROM `tabRide Request` GROUP BY status
+    """))
+    totals = frappe.db.sql("""
+        SELECT
+            COUNT(*),
+            COUNT(accepted_at),
+            SUM(status = 'Cancelled'),
+            SUM(status = 'Completed'),
+            COALESCE(SUM(CASE WHEN status = 'Completed' THEN actual_fare END), 0)
+        FROM `tabRide Request`
+    """)[0]
+
+    total = dict(zip(COUNT_FIELDS, (flt(value) for value in totals)))
+    for gauge, statuses in GAUGE_STATUSES.items():
+        total[gauge] = sum(cint(status_counts.get(status)) for status in statuses)
+
+    rows.append((TOTAL_KEY, None, total))
+
+    write_rollup_rows(rows, replace=True)
+
+    # Old minute rows are only needed for the live view
+    frappe.db.delete("Hailing KPI Rollup", {
+        "period": "Minute",
+        "period_start": ["<", add_to_date(now_datetime(), days=-MINUTE_RETENTION_DAYS)]
+    })
+
+    frappe.db.commit()
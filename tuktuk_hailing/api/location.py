@@ -4,8 +4,10 @@
 import frappe
 from frappe.utils import now, get_datetime, add_to_date
 from datetime import datetime, timedelta
+from tuktuk_hailing.api.metrics import instrument
 
 @frappe.whitelist()
+@instrument
 def update_driver_location(latitude, longitude, driver_id=None, accuracy=None, heading=None, speed=None, hailing_status="Available"):
     """
     Update driver's current location
@@ -81,6 +83,10 @@ def update_driver_location(latitude, longitude, driver_id=None, accuracy=None, h
     
     frappe.db.commit()
     
+    # Add to the running distance of the driver's active ride, if any
+    from tuktuk_hailing.api.trip_tracking import record_trip_ping
+    record_trip_ping(driver_id, latitude, longitude, accuracy)
+    
     # Broadcast location update to clients watching this driver
     frappe.publish_realtime(
         event="driver_location_update",
@@ -97,6 +103,7 @@ def update_driver_location(latitude, longitude, driver_id=None, accuracy=None, h
     return {"success": True, "timestamp": loc.timestamp}
 
 @frappe.whitelist(allow_guest=True)
+@instrument
 def get_available_drivers(customer_lat=None, customer_lng=None, max_distance_km=None):
     """
     Get list of available drivers and their locations
@@ -154,8 +161,20 @@ def get_available_drivers(customer_lat=None, customer_lng=None, max_distance_km=
                 driver['display_longitude'] = driver.longitude + (0.0005 * (1 if int(distance * 10) % 2 == 0 else -1))
                 filtered_drivers.append(driver)
         
-        # Sort by distance
-        filtered_drivers.sort(key=lambda x: x['distance_km'])
+        # Rank by driving time to the customer, which straight-line distance
+        # gets badly wrong across the road network
+        if filtered_drivers:
+            from tuktuk_hailing.api.routing import get_eta_matrix
+
+            etas = get_eta_matrix(
+                [(driver.latitude, driver.longitude) for driver in filtered_drivers],
+                [(customer_lat, customer_lng)]
+            )
+            for driver, row in zip(filtered_drivers, etas):
+                driver['road_distance_km'] = row[0]['distance_km']
+                driver['eta_minutes'] = row[0]['duration_minutes']
+
+        filtered_drivers.sort(key=lambda x: x['eta_minutes'])
         return filtered_drivers
     
     # Apply privacy radius to all drivers
@@ -166,6 +185,7 @@ def get_available_drivers(customer_lat=None, customer_lng=None, max_distance_km=
     return drivers
 
 @frappe.whitelist()
+@instrument
 def set_driver_availability(driver_id=None, available=True):
     """
     Toggle driver's availability for hailing
@@ -217,6 +237,7 @@ def set_driver_availability(driver_id=None, available=True):
     }
 
 @frappe.whitelist()
+@instrument
 def get_all_driver_locations():
     """
     Get all driver locations with their current status (not filtered by availability)
@@ -310,6 +331,7 @@ def get_all_driver_locations():
     }
 
 @frappe.whitelist()
+@instrument
 def get_driver_location(driver_id):
     """Get latest location for a specific driver"""
 
@@ -382,6 +404,7 @@ def calculate_distance(lat1, lng1, lat2, lng2):
     return distance
 
 @frappe.whitelist()
+@instrument
 def get_driver_route_to_customer(driver_id, customer_lat, customer_lng):
     """
     Get routing information from driver's current location to customer
@@ -400,41 +423,32 @@ def get_driver_route_to_customer(driver_id, customer_lat, customer_lng):
     
     # Get routing from routing API
     settings = frappe.get_single("Hailing Settings")
+    route = None
     
     if settings.routing_api_provider == "OSRM":
-        return get_osrm_route(
+        route = get_osrm_route(
             driver_location.latitude, driver_location.longitude,
             customer_lat, customer_lng,
             settings.routing_api_url
         )
+        if route.get("success"):
+            return route
     
-    return {"error": "Routing provider not configured"}
-
-def get_osrm_route(start_lat, start_lng, end_lat, end_lng, api_url):
-    """Get route from OSRM routing API"""
-    import requests
+    # Built-in road graph: the configured provider, or the fallback when OSRM fails
+    from tuktuk_hailing.api.road_graph import get_offline_route
     
-    url = f"{api_url}{start_lng},{start_lat};{end_lng},{end_lat}"
-    params = {
-        "overview": "full",
-        "geometries": "geojson"
-    }
+    offline_route = get_offline_route(
+        driver_location.latitude, driver_location.longitude,
+        customer_lat, customer_lng
+    )
     
-    try:
-        response = requests.get(url, params=params, timeout=5)
-        data = response.json()
-        
-        if data.get("code") == "Ok" and data.get("routes"):
-            route = data["routes"][0]
-            return {
-                "distance_km": round(route["distance"] / 1000, 2),
-                "duration_minutes": round(route["duration"] / 60, 1),
-                "geometry": route["geometry"],
-                "success": True
-            }
-        else:
-            return {"error": "Route not found", "success": False}
+    if offline_route:
+        return offline_route
     
-    except Exception as e:
-        frappe.log_error(f"OSRM routing error: {str(e)}", "Routing API Error")
-        return {"error": "Routing service unavailable", "success": False}
+    return route or {"error": "Routing provider not configured"}
+
+def get_osrm_route(start_lat, start_lng, end_lat, end_lng, api_url):
+    """Get route from OSRM routing API (cached, see api/routing.py)"""
+    from tuktuk_hailing.api.routing import get_route
+
+    return get_route(start_lat, start_lng, end_lat, end_lng, api_url)
@@ -0,0 +1,234 @@
+# Copyright (c) 2024, Sunny Tuktuk and contributors
+# For license information, please see license.txt
+
+"""
+Per-endpoint timing for the hailing APIs
+
+Whitelisted methods are wrapped with @instrument, which records each call's
+wall time, database queries (count and time), result cache hits and misses
+and response size. Calls are added to in-memory counters and a duration
+histogram per worker; every few seconds a worker adds what it collected to
+one Redis hash in a single pipeline, so a call costs no extra round trip.
+get_hailing_metrics renders the hash in the Prometheus text format.
+"""
+
+import frappe
+import functools
+import inspect
+import json
+import threading
+import time
+
+METRICS_KEY = "hailing_metrics"
+
+# Seconds between flushes of a worker's counters to Redis
+FLUSH_INTERVAL = 10
+
+# Upper bounds of the duration histogram buckets, in seconds
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+# Counters kept per endpoint: (field, Prometheus name, help)
+COUNTERS = (
+    ("errors", "hailing_request_errors_total", "Calls that raised an exception"),
+    ("db_queries", "hailing_db_queries_total", "Database queries run by calls"),
+    ("db_seconds", "hailing_db_seconds_total", "Time spent in database queries"),
+    ("cache_hits", "hailing_cache_hits_total", "Result cache hits"),
+    ("cache_misses", "hailing_cache_misses_total", "Result cache misses"),
+    ("response_bytes", "hailing_response_bytes_total", "JSON size of call results")
+)
+
+# {site: {endpoint: {field: value}}}, added to by every thread of the worker
+_buffers = {}
+_last_flush = {}
+_lock = threading.Lock()
+
+def instrument(fn):
+    """
+    Record timing and query counts for every call of fn
+
+    Place below @frappe.whitelist(), so the instrumented function is the one
+    that gets whitelisted. Calls made from inside another instrumented call
+    are counted as part of the outer call only.
+    """
+    endpoint = f"{fn.__module__}.{fn.__name__}"
+
+    parameters = inspect.signature(fn).parameters
+    takes_any = any(parameter.kind == parameter.VAR_KEYWORD for parameter in parameters.values())
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        # frappe.call reads the wrapper's **kwargs and passes every form_dict key; fn only gets its own
+        if not takes_any:
+            kwargs = {name: value for name, value in kwargs.items() if name in parameters}
+
+        if not getattr(frappe.local, "site", None) or getattr(frappe.local, "hailing_call", None) is not None:
+            return fn(*args, **kwargs)
+
+        call = frappe.local.hailing_call = {
+            "db_queries": 0,
+            "db_seconds": 0.0,
+            "cache_hits": 0,
+            "cache_misses": 0
+        }
+
+        # Count queries the way frappe.recorder does: wrap this request's db.sql
+        db = frappe.db
+        own_sql = "sql" in db.__dict__
+        sql = db.sql
+
+        def timed_sql(*sql_args, **sql_kwargs):
+            started = time.perf_counter()
+            try:
+                return sql(*sql_args, **sql_kwargs)
+            finally:
+                call["db_queries"] += 1
+                call["db_seconds"] += time.perf_counter() - started
+
+        db.sql = timed_sql
+        started = time.perf_counter()
+        result = None
+        error = False
+
+        try:
+            result = fn(*args, **kwargs)
+            return result
+        except Exception:
+            error = True
+            raise
+        finally:
+            seconds = time.perf_counter() - started
+
+            if own_sql:
+                db.sql = sql
+            else:
+                del db.sql
+            frappe.local.hailing_call = None
+
+            record_call(endpoint, seconds, call, result, error)
+
+    return wrapper
+
+def record_cache_lookup(hit):
+    """Count a result cache lookup towards the current instrumented call"""
+    call = getattr(frappe.local, "hailing_call", None)
+
+    if call is not None:
+        call["cache_hits" if hit else "cache_misses"] += 1
+
+def record_call(endpoint, seconds, call, result=None, error=False):
+    """Add one call to this worker's counters, flushing them when due"""
+    try:
+        response_bytes = len(json.dumps(result, default=str, separators=(",", ":"))) if result is not None else 0
+    except Exception:
+        response_bytes = 0
+
+    bucket = next((f"le:{bound}" for bound in DURATION_BUCKETS if seconds <= bound), None)
+    site = frappe.local.site
+
+    with _lock:
+        stats = _buffers.setdefault(site, {}).setdefault(endpoint, {})
+
+        for field, value in (
+            ("calls", 1),
+            ("seconds", seconds),
+            ("errors", 1 if error else 0),
+            ("response_bytes", response_bytes),
+            (bucket, 1)
+        ):
+            if field and value:
+                stats[field] = stats.get(field, 0) + value
+
+        for field, value in call.items():
+            if value:
+                stats[field] = stats.get(field, 0) + value
+
+        due = time.monotonic() - _last_flush.get(site, 0) >= FLUSH_INTERVAL
+
+    if due:
+        flush_metrics()
+
+def flush_metrics():
+    """Add this worker's counters for the current site to Redis in one pipeline"""
+    site = frappe.local.site
+
+    with _lock:
+        buffered = _buffers.pop(site, None)
+        _last_flush[site] = time.monotonic()
+
+    if not buffered:
+        return
+
+    try:
+        cache = frappe.cache()
+        key = cache.make_key(METRICS_KEY)
+
+        pipeline = cache.pipeline()
+        for endpoint, stats in buffered.items():
+            for field, value in stats.items():
+                pipeline.hincrbyfloat(key, f"{endpoint}|{field}", value)
+        pipeline.execute()
+    except Exception as e:
+        frappe.log_error(f"Metrics flush error: {str(e)}", "Hailing Metrics")
+
+def get_stored_metrics():
+    """{endpoint: {field: value}} from Redis"""
+    cache = frappe.cache()
+
+    # Raw hgetall through a pipeline: frappe's hgetall would prefix the key again and unpickle
+    stored = cache.pipeline().hgetall(cache.make_key(METRICS_KEY)).execute()[0]
+
+    metrics = {}
+    for name, value in stored.items():
+        endpoint, field = frappe.safe_decode(name).rsplit("|", 1)
+        metrics.setdefault(endpoint, {})[field] = float(value)
+
+    return metrics
+
+def render_metrics(metrics):
+    """Prometheus text exposition of {endpoint: {field: value}}"""
+    lines = [
+        "# HELP hailing_request_duration_seconds Wall time of hailing API calls",
+        "# TYPE hailing_request_duration_seconds histogram"
+    ]
+
+    for endpoint, stats in sorted(metrics.items()):
+        label = f'endpoint="{endpoint}"'
+        cumulative = 0
+
+        for bound in DURATION_BUCKETS:
+            cumulative += stats.get(f"le:{bound}", 0)
+            lines.append(f'hailing_request_duration_seconds_bucket{{{label},le="{bound}"}} {format_value(cumulative)}')
+
+        lines.append(f'hailing_request_duration_seconds_bucket{{{label},le="+Inf"}} {format_value(stats.get("calls", 0))}')
+        lines.append(f"hailing_request_duration_seconds_sum{{{label}}} {format_value(stats.get('seconds', 0))}")
+        lines.append(f"hailing_request_duration_seconds_count{{{label}}} {format_value(stats.get('calls', 0))}")
+
+    for field, name, description in COUNTERS:
+        lines.append(f"# HELP {name} {description}")
+        lines.append(f"# TYPE {name} counter")
+
+        for endpoint, stats in sorted(metrics.items()):
+            lines.append(f'{name}{{endpoint="{endpoint}"}} {format_value(stats.get(field, 0))}')
+
+    return "\n".join(lines) + "\n"
+
+def format_value(value):
+    """Integers without a decimal point, other values to microseconds"""
+    return str(int(value)) if float(value).is_integer() else str(round(value, 6))
+
+@frappe.whitelist()
+def get_hailing_metrics():
+    """
+    All endpoint metrics in the Prometheus text format
+    Scrape with a System Manager's API key and secret
+    """
+    from werkzeug.wrappers import Response
+
+    frappe.only_for("System Manager")
+
+    flush_metrics()
+
+    return Response(
+        render_metrics(get_stored_metrics()),
+        content_type="text/plain; version=0.0.4; charset=utf-8"
+    )
@@ -0,0 +1,666 @@
+# Copyright (c) 2024, Sunny Tuktuk and contributors
+# For license information, please see license.txt
+
+"""
+In-memory n-gram index over active Hailing Places
+
+Every worker process keeps one index per site. It is built on the first
+search the worker serves and kept in sync through a catalog version stored
+in Redis: each Hailing Place change bumps the version and records which
+places changed, so other workers re-read only those rows instead of
+rebuilding the whole index.
+
+An index is never changed while searches may read it: changes are applied to
+a copy that shares the untouched postings, and the copy replaces the index
+in one assignment.
+"""
+
+import frappe
+from frappe.utils import cint
+import bisect
+import heapq
+import json
+import math
+import re
+import threading
+import unicodedata
+
+# Bigrams cover the 2-character minimum query, trigrams keep postings short
+GRAM_SIZES = (2, 3)
+
+CATALOG_VERSION_KEY = "hailing_place_catalog_version"
+CATALOG_CHANGES_KEY = "hailing_place_catalog_changes"
+MAX_TRACKED_CHANGES = 500
+
+# SymSpell-style deletion dictionary: only the first FUZZY_PREFIX_LENGTH
+# characters of each word are expanded, which keeps the dictionary small
+FUZZY_PREFIX_LENGTH = 7
+FUZZY_MIN_WORD_LENGTH = 3
+MAX_FUZZY_CANDIDATE_WORDS = 50
+
+# Spatial grid for reverse lookups (~550 m cells at the equator)
+GRID_CELL_DEGREES = 0.005
+METERS_PER_DEGREE_LAT = 111320.0
+
+# Apostrophes are dropped so "Ali Barbour's" matches "ali barbours"
+APOSTROPHES = re.compile(r"['\u2019`]")
+NON_WORD = re.compile(r"[\W_]+", flags=re.UNICODE)
+
+SEARCH_KEY_SEPARATOR = " | "
+ALIAS_KEY_SEPARATOR = " / "
+MAX_NAME_KEY_LENGTH = 140
+
+PLACE_FIELDS = ["name", "place_name", "category", "latitude", "longitude", "aliases", "description", "popularity_score"]
+
+_indexes = {}
+_lock = threading.Lock()
+
+
+def normalize(text):
+    """
+    Search key for text: lowercase, accents folded, punctuation removed
+    and whitespace collapsed ("Café  d'Amour!" -> "cafe damour")
+    """
+    if not text:
+        return ""
+
+    text = str(text).lower()
+
+    if not text.isascii():
+        text = "".join(ch for ch in unicodedata.normalize("NFKD", text) if not unicodedata.combining(ch))
+
+    return " ".join(NON_WORD.sub(" ", APOSTROPHES.sub("", text)).split())
+
+
+def get_search_keys(place_name, aliases=None, category=None):
+    """
+    (name_key, search_key) stored on Hailing Place for SQL matching
+
+    search_key is "name | alias / alias | category"; normalized queries never
+    contain the separators, so a match cannot span two parts
+    """
+    name_key = normalize(place_name)[:MAX_NAME_KEY_LENGTH]
+
+    alias_keys = []
+    for alias in (aliases or "").split(","):
+        alias_key = normalize(alias)
+        if alias_key and alias_key not in alias_keys:
+            alias_keys.append(alias_key)
+
+    search_key = SEARCH_KEY_SEPARATOR.join([name_key, ALIAS_KEY_SEPARATOR.join(alias_keys), normalize(category)])
+
+    return name_key, search_key
+
+
+def get_grams(text):
+    """All n-grams of the configured sizes contained in text"""
+    grams = set()
+    for size in GRAM_SIZES:
+        for i in range(len(text) - size + 1):
+            grams.add(text[i:i + size])
+    return grams
+
+
+def tokenize(text):
+    """Split a normalized key into words"""
+    return re.findall(r"\w+", text, flags=re.UNICODE)
+
+
+def max_edit_distance(word):
+    """Typos tolerated for a word of this length"""
+    if len(word) < FUZZY_MIN_WORD_LENGTH:
+        return 0
+    if len(word) <= 4:
+        return 1
+    return 2
+
+
+def get_deletes(word, max_distance):
+    """All strings reachable by deleting up to max_distance characters"""
+    deletes = {word}
+    frontier = {word}
+    for _ in range(max_distance):
+        next_frontier = set()
+        for item in frontier:
+            for i in range(len(item)):
+                next_frontier.add(item[:i] + item[i + 1:])
+        next_frontier -= deletes
+        deletes |= next_frontier
+        frontier = next_frontier
+    return deletes
+
+
+def edit_distance(a, b, max_distance):
+    """
+    Optimal string alignment distance (Levenshtein plus transpositions)
+    Returns max_distance + 1 as soon as the distance is known to exceed it
+    """
+    if abs(len(a) - len(b)) > max_distance:
+        return max_distance + 1
+
+    previous_previous = None
+    previous = list(range(len(b) + 1))
+
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = 0 if a[i - 1] == b[j - 1] else 1
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if (i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]):
+                current[j] = min(current[j], previous_previous[j - 2] + 1)
+
+        if min(current) > max_distance:
+            return max_distance + 1
+
+        previous_previous, previous = previous, current
+
+    return previous[-1]
+
+
+def writable_set(mapping, key, owned, create=False):
+    """
+    Set at mapping[key] that may be changed in place
+
+    Args:
+        owned: Keys whose sets belong to this index (None: all of them);
+            any other set is shared with the index it was copied from and is
+            copied before it is returned
+        create: Add an empty set when key is missing
+    """
+    names = mapping.get(key)
+
+    if names is None:
+        if not create:
+            return None
+        names = mapping[key] = set()
+    elif owned is not None and key not in owned:
+        names = mapping[key] = set(names)
+    else:
+        return names
+
+    if owned is not None:
+        owned.add(key)
+    return names
+
+
+class FuzzyWordIndex:
+    """Deletion dictionary mapping misspelled words to indexed place words"""
+
+    def __init__(self):
+        self.word_places = {}
+        self.deletes = {}
+        self.sorted_words = None
+        self.owned_words = None
+        self.owned_deletes = None
+
+    def copy(self):
+        """Copy sharing every set until it is changed"""
+        fuzzy = FuzzyWordIndex()
+        fuzzy.word_places = dict(self.word_places)
+        fuzzy.deletes = dict(self.deletes)
+        fuzzy.sorted_words = self.sorted_words
+        fuzzy.owned_words = set()
+        fuzzy.owned_deletes = set()
+        return fuzzy
+
+    def add(self, name, words):
+        for word in words:
+            # Typos in house numbers are not worth the dictionary space
+            if len(word) < FUZZY_MIN_WORD_LENGTH or word.isdigit():
+                continue
+
+            if word not in self.word_places:
+                self.sorted_words = None
+                for variant in get_deletes(word[:FUZZY_PREFIX_LENGTH], 2):
+                    writable_set(self.deletes, variant, self.owned_deletes, create=True).add(word)
+            writable_set(self.word_places, word, self.owned_words, create=True).add(name)
+
+    def remove(self, name, words):
+        for word in words:
+            places = writable_set(self.word_places, word, self.owned_words)
+            if places is None:
+                continue
+
+            places.discard(name)
+            if not places:
+                del self.word_places[word]
+                self.sorted_words = None
+                for variant in get_deletes(word[:FUZZY_PREFIX_LENGTH], 2):
+                    variant_words = writable_set(self.deletes, variant, self.owned_deletes)
+                    if variant_words is not None:
+                        variant_words.discard(word)
+                        if not variant_words:
+                            del self.deletes[variant]
+
+    def lookup(self, token):
+        """
+        Indexed words within the tolerated edit distance of token
+
+        Returns:
+            dict of {word: distance}, closest MAX_FUZZY_CANDIDATE_WORDS only
+        """
+        max_distance = max_edit_distance(token)
+        if not max_distance:
+            return {token: 0} if token in self.word_places else {}
+
+        candidates = set()
+        for variant in get_deletes(token[:FUZZY_PREFIX_LENGTH], max_distance):
+            candidates |= self.deletes.get(variant, set())
+
+        matches = {}
+        for word in candidates:
+            distance = edit_distance(token, word, max_distance)
+            if distance <= max_distance:
+                matches[word] = distance
+
+        if len(matches) > MAX_FUZZY_CANDIDATE_WORDS:
+            closest = heapq.nsmallest(MAX_FUZZY_CANDIDATE_WORDS, matches.items(), key=lambda m: (m[1], m[0]))
+            matches = dict(closest)
+
+        return matches
+
+    def prefix_lookup(self, token):
+        """Indexed words starting with token (for the word still being typed)"""
+        if self.sorted_words is None:
+            self.sorted_words = sorted(self.word_places)
+
+        words = []
+        position = bisect.bisect_left(self.sorted_words, token)
+        while position < len(self.sorted_words) and len(words) < MAX_FUZZY_CANDIDATE_WORDS:
+            word = self.sorted_words[position]
+            if not word.startswith(token):
+                break
+            words.append(word)
+            position += 1
+        return words
+
+
+class PlaceIndex:
+    """N-gram postings over place names, aliases and categories"""
+
+    def __init__(self, version=None):
+        self.version = version
+        self.places = {}
+        self.postings = {}
+        self.fuzzy = FuzzyWordIndex()
+        self.grid = {}
+        self.owned_postings = None
+        self.owned_grid = None
+
+    def copy(self, version=None):
+        """Copy sharing every posting until it is changed"""
+        index = PlaceIndex(self.version if version is None else version)
+        index.places = dict(self.places)
+        index.postings = dict(self.postings)
+        index.fuzzy = self.fuzzy.copy()
+        index.grid = dict(self.grid)
+        index.owned_postings = set()
+        index.owned_grid = set()
+        return index
+
+    def add(self, row):
+        """Add or replace a place"""
+        place = frappe._dict(row)
+        place.name_key = normalize(place.place_name)
+        place.alias_key = normalize(place.aliases)
+        place.category_key = normalize(place.category)
+        place.popularity_score = place.popularity_score or 0
+        place.words = set(tokenize(place.name_key)) | set(tokenize(place.alias_key))
+
+        self.remove(place.name)
+        self.places[place.name] = place
+
+        for gram in self._place_grams(place):
+            writable_set(self.postings, gram, self.owned_postings, create=True).add(place.name)
+
+        self.fuzzy.add(place.name, place.words)
+
+        if place.latitude is not None and place.longitude is not None:
+            place.cell = grid_cell(place.latitude, place.longitude)
+            writable_set(self.grid, place.cell, self.owned_grid, create=True).add(place.name)
+
+    def remove(self, name):
+        """Drop a place and its postings (no-op if not indexed)"""
+        place = self.places.pop(name, None)
+        if not place:
+            return
+
+        for gram in self._place_grams(place):
+            names = writable_set(self.postings, gram, self.owned_postings)
+            if names is not None:
+                names.discard(name)
+                if not names:
+                    del self.postings[gram]
+
+        self.fuzzy.remove(name, place.words)
+
+        names = writable_set(self.grid, place.cell, self.owned_grid)
+        if names is not None:
+            names.discard(name)
+            if not names:
+                del self.grid[place.cell]
+
+    def _place_grams(self, place):
+        return get_grams(place.name_key) | get_grams(place.alias_key) | get_grams(place.category_key)
+
+    def candidates(self, query_key):
+        """Names whose indexed text contains every n-gram of the query"""
+        size = min(len(query_key), max(GRAM_SIZES))
+        if size < min(GRAM_SIZES):
+            return set()
+
+        postings = []
+        for i in range(len(query_key) - size + 1):
+            names = self.postings.get(query_key[i:i + size])
+            if not names:
+                return set()
+            postings.append(names)
+
+        # Intersect smallest first so the working set shrinks fastest
+        postings.sort(key=len)
+        result = set(postings[0])
+        for names in postings[1:]:
+            result &= names
+            if not result:
+                break
+
+        return result
+
+    @staticmethod
+    def match_priority(place, query_key, include_category=True):
+        """
+        Same ordering as the SQL search:
+        1 exact name, 2 name prefix, 3 name contains, 4 alias, 5 category
+        """
+        if place.name_key == query_key:
+            return 1
+        if place.name_key.startswith(query_key):
+            return 2
+        if query_key in place.name_key:
+            return 3
+        if query_key in place.alias_key:
+            return 4
+        if include_category and query_key in place.category_key:
+            return 5
+        return None
+
+    def search(self, query, limit=5, include_category=True, bounds=None, origin=None):
+        """
+        Ranked matches for query
+
+        Args:
+            query: Search term
+            limit: Maximum results
+            include_category: Also match on category name
+            bounds: (min_lat, max_lat, min_lng, max_lng) filter
+            origin: (lat, lng) to order equal-priority matches by distance
+
+        Returns:
+            List of (place, distance_km) tuples; distance_km is None without origin
+        """
+        query_key = normalize(query)
+        matches = []
+
+        for name in self.candidates(query_key):
+            place = self.places[name]
+
+            priority = self.match_priority(place, query_key, include_category)
+            if priority is None:
+                continue
+
+            if bounds and not in_bounds(place, bounds):
+                continue
+
+            matches.append((priority, place))
+
+        return rank_places(matches, limit, origin)
+
+    def fuzzy_search(self, query, limit=5, bounds=None, origin=None):
+        """
+        Typo-tolerant matches for query
+
+        Every query word of 3+ characters must be within its edit tolerance of
+        a word in the place name or aliases; the last word may also be a prefix
+        while the user is still typing. Places are ranked by total edit distance.
+
+        Returns:
+            List of (place, distance_km) tuples, same as search()
+        """
+        tokens = [t for t in tokenize(normalize(query)) if len(t) >= FUZZY_MIN_WORD_LENGTH]
+        if not tokens:
+            return []
+
+        token_places = []
+        for position, token in enumerate(tokens):
+            word_distances = self.fuzzy.lookup(token)
+
+            if position == len(tokens) - 1:
+                for word in self.fuzzy.prefix_lookup(token):
+                    word_distances.setdefault(word, 0)
+
+            place_distances = {}
+            for word, distance in word_distances.items():
+                for name in self.fuzzy.word_places.get(word, ()):
+                    if distance < place_distances.get(name, distance + 1):
+                        place_distances[name] = distance
+
+            if not place_distances:
+                return []
+            token_places.append(place_distances)
+
+        # Intersect smallest first
+        token_places.sort(key=len)
+        names = set(token_places[0])
+        for place_distances in token_places[1:]:
+            names &= place_distances.keys()
+            if not names:
+                return []
+
+        matches = []
+        for name in names:
+            place = self.places[name]
+            if bounds and not in_bounds(place, bounds):
+                continue
+
+            typos = sum(place_distances[name] for place_distances in token_places)
+            matches.append((typos, place))
+
+        return rank_places(matches, limit, origin)
+
+    def nearby(self, lat, lng, radius_m, limit=5):
+        """
+        Places within radius_m of a point, nearest first
+
+        Only the grid cells overlapping the radius are scanned.
+
+        Returns:
+            List of (place, distance_km) tuples
+        """
+        from tuktuk_hailing.api.location import calculate_distance
+
+        lng_scale = max(math.cos(math.radians(lat)), 0.01)
+        radius_deg = radius_m / METERS_PER_DEGREE_LAT
+
+        min_row, min_col = grid_cell(lat - radius_deg, lng - radius_deg / lng_scale)
+        max_row, max_col = grid_cell(lat + radius_deg, lng + radius_deg / lng_scale)
+
+        matches = []
+        for row in range(min_row, max_row + 1):
+            for col in range(min_col, max_col + 1):
+                for name in self.grid.get((row, col), ()):
+                    place = self.places[name]
+                    distance_sq = (place.latitude - lat) ** 2 + ((place.longitude - lng) * lng_scale) ** 2
+                    if distance_sq <= radius_deg ** 2:
+                        matches.append((distance_sq, place.name_key, place))
+
+        top = heapq.nsmallest(int(limit), matches, key=lambda m: m[:2])
+        return [(place, calculate_distance(lat, lng, place.latitude, place.longitude)) for _d, _k, place in top]
+
+    def catch_up(self, version):
+        """
+        Copy of this index with the changes recorded since it was built
+
+        Returns None when the change log cannot bring the index to version
+        (log trimmed, full invalidation requested) and a rebuild is needed.
+        This index is left unchanged, so searches running on it are safe.
+        """
+        if self.version is None or version < self.version:
+            return None
+
+        changes = [json.loads(entry) for entry in frappe.cache().lrange(CATALOG_CHANGES_KEY, 0, -1) or []]
+        pending = [change for change in changes if change[0] > self.version]
+
+        recorded = {change[0] for change in pending}
+        if any(v not in recorded for v in range(self.version + 1, version + 1)):
+            return None
+
+        names = set()
+        for _version, changed in pending:
+            if changed is None:
+                return None
+            names.update(changed)
+
+        index = self.copy(version)
+
+        if names:
+            rows = frappe.get_all("Hailing Place",
+                filters={"name": ["in", list(names)], "is_active": 1},
+                fields=PLACE_FIELDS
+            )
+            for name in names:
+                index.remove(name)
+            for row in rows:
+                index.add(row)
+
+        return index
+
+
+def rank_places(matches, limit, origin=None):
+    """
+    Top limit places from (rank, place) pairs, lowest rank first
+
+    Ties break on popularity and then name, or on distance from origin when
+    given. Distances are only computed for the ranks that can still reach the
+    result, using an equirectangular approximation (no trigonometry per place,
+    exact enough to order places across the service area); the exact
+    haversine distance is computed for the returned places only.
+
+    Returns:
+        List of (place, distance_km) tuples; distance_km is None without origin
+    """
+    from tuktuk_hailing.api.location import calculate_distance
+
+    limit = int(limit)
+
+    if not origin:
+        top = heapq.nsmallest(limit, matches, key=lambda m: (m[0], -m[1].popularity_score, m[1].name_key))
+        return [(place, None) for _rank, place in top]
+
+    buckets = {}
+    for rank, place in matches:
+        buckets.setdefault(rank, []).append(place)
+
+    lat, lng = origin
+    lng_scale = math.cos(math.radians(lat))
+
+    def distance_key(place):
+        return ((place.latitude - lat) ** 2 + ((place.longitude - lng) * lng_scale) ** 2, place.name_key)
+
+    nearest = []
+    for rank in sorted(buckets):
+        remaining = limit - len(nearest)
+        if remaining <= 0:
+            break
+        nearest.extend(heapq.nsmallest(remaining, buckets[rank], key=distance_key))
+
+    return [(place, calculate_distance(lat, lng, place.latitude, place.longitude)) for place in nearest]
+
+
+def grid_cell(lat, lng):
+    """Grid cell containing a coordinate"""
+    return (math.floor(lat / GRID_CELL_DEGREES), math.floor(lng / GRID_CELL_DEGREES))
+
+
+def in_bounds(place, bounds):
+    """Whether place lies inside (min_lat, max_lat, min_lng, max_lng)"""
+    min_lat, max_lat, min_lng, max_lng = bounds
+    return min_lat <= place.latitude <= max_lat and min_lng <= place.longitude <= max_lng
+
+
+def get_catalog_version():
+    """Current place-catalog version shared by all workers"""
+    cache = frappe.cache()
+    return cint(cache.get(cache.make_key(CATALOG_VERSION_KEY)))
+
+
+def record_place_change(names=None):
+    """
+    Bump the catalog version and log which places changed
+
+    Args:
+        names: Changed place names, or None to force every worker to rebuild
+    """
+    cache = frappe.cache()
+    version = cache.incr(cache.make_key(CATALOG_VERSION_KEY))
+
+    cache.rpush(CATALOG_CHANGES_KEY, json.dumps([version, list(names) if names else None]))
+    cache.ltrim(CATALOG_CHANGES_KEY, -MAX_TRACKED_CHANGES, -1)
+
+    return version
+
+
+def queue_place_change(*names):
+    """Record a place change once the current transaction commits"""
+    frappe.db.after_commit.add(lambda: record_place_change(names))
+
+
+def invalidate_place_index():
+    """Force a full rebuild, e.g. after bulk SQL writes that skip doc events"""
+    return record_place_change(None)
+
+
+def build_place_index(version=None):
+    """Load all active places into a fresh index"""
+    index = PlaceIndex(version)
+
+    rows = frappe.db.sql("""
+        SELECT name, place_name, category, latitude, longitude, aliases, description, popularity_score
+        FROM `tabHailing Place`
+        WHERE is_active = 1
+    """, as_dict=True)
+
+    for row in rows:
+        index.add(row)
+
+    return index
+
+
+def get_place_index():
+    """Index for the current site, synced to the latest catalog version"""
+    site = frappe.local.site
+    # Read the version before loading rows so concurrent edits are replayed later
+    version = get_catalog_version()
+
+    index = _indexes.get(site)
+    if index and index.version == version:
+        return index
+
+    with _lock:
+        index = _indexes.get(site)
+        if index is not None and index.version == version:
+            return index
+
+        updated = index.catch_up(version) if index is not None else None
+        # One assignment: searches hold either the old index or the new one
+        index = _indexes[site] = updated or build_place_index(version)
+
+    return index
+
+
+def warm_place_index():
+    """
+    Build the index ahead of the first search
+    Usage: bench execute tuktuk_hailing.api.place_index.warm_place_index
+    """
+    index = get_place_index()
+    print(f"✅ Indexed {len(index.places)} places ({len(index.postings)} n-grams)")
@@ -0,0 +1,113 @@
+# Copyright (c) 2024, Sunny Tuktuk and contributors
+# For license information, please see license.txt
+
+"""
+Popularity scores for Hailing Places from ride history
+
+A daily job matches the pickup and destination of recent Ride Requests to
+places - by the address text the booking form filled in from a place
+result, otherwise by the nearest place to the coordinates - and stores a
+time-decayed count on each place. Search uses it to break ties, so common
+destinations come first.
+"""
+
+import frappe
+from frappe.utils import flt, now_datetime, add_to_date
+from tuktuk_hailing.api.place_index import build_place_index, normalize, invalidate_place_index
+import math
+
+POPULARITY_WINDOW_DAYS = 90
+
+# A ride from 30 days ago counts half as much as one today
+POPULARITY_HALF_LIFE_DAYS = 30
+
+# Rides that did not happen still show where people want to go
+STATUS_WEIGHTS = {
+    "Completed": 1.0,
+    "En Route": 1.0,
+    "Accepted": 1.0
+}
+DEFAULT_STATUS_WEIGHT = 0.5
+
+# Coordinates further than this from every place are not counted
+MATCH_RADIUS_M = 75
+
+def update_place_popularity():
+    """
+    Scheduled job: recompute popularity_score for every place
+    Only places whose score changed are written
+    """
+    index = build_place_index()
+    scores = get_popularity_scores(index)
+
+    current = dict(frappe.db.sql("SELECT name, popularity_score FROM `tabHailing Place`"))
+
+    updates = {}
+    for name, stored in current.items():
+        score = round(scores.get(name, 0), 2)
+        if abs(flt(stored) - score) >= 0.01:
+            updates[name] = {"popularity_score": score}
+
+    if not updates:
+        return 0
+
+    frappe.db.bulk_update("Hailing Place", updates, update_modified=False)
+    frappe.db.commit()
+
+    # Rebuild indexes and drop cached results so the new order takes effect
+    invalidate_place_index()
+
+    return len(updates)
+
+def get_popularity_scores(index, now=None):
+    """
+    Time-decayed ride counts per place name
+
+    Args:
+        index: PlaceIndex of active places
+        now: Reference time (defaults to now)
+    """
+    now = now or now_datetime()
+    since = add_to_date(now, days=-POPULARITY_WINDOW_DAYS)
+    decay = math.log(2) / POPULARITY_HALF_LIFE_DAYS
+
+    names_by_key = {place.name_key: name for name, place in index.places.items()}
+    scores = {}
+
+    rides = frappe.db.sql("""
+        SELECT
+            requested_at, status,
+            pickup_address, pickup_latitude, pickup_longitude,
+            destination_address, destination_latitude, destination_longitude
+        FROM `tabRide Request`
+        WHERE requested_at >= %s
+    """, (since,), as_dict=True)
+
+    for ride in rides:
+        age_days = max((now - ride.requested_at).total_seconds() / 86400, 0)
+        weight = STATUS_WEIGHTS.get(ride.status, DEFAULT_STATUS_WEIGHT) * math.exp(-decay * age_days)
+
+        for address, lat, lng in (
+            (ride.pickup_address, ride.pickup_latitude, ride.pickup_longitude),
+            (ride.destination_address, ride.destination_latitude, ride.destination_longitude)
+        ):
+            name = match_place(index, names_by_key, address, lat, lng)
+            if name:
+                scores[name] = scores.get(name, 0) + weight
+
+    return scores
+
+def match_place(index, names_by_key, address, lat, lng):
+    """Place name for a ride endpoint, or None"""
+    if address:
+        # Place results are shown as "Place Name, Category, Diani Beach, Kenya"
+        name = names_by_key.get(normalize(address.split(",")[0]))
+        if name:
+            return name
+
+    if lat and lng:
+        nearest = index.nearby(flt(lat), flt(lng), MATCH_RADIUS_M, limit=1)
+        if nearest:
+            return nearest[0][0].name
+
+    return None
@@ -6,8 +6,23 @@ from frappe.utils import cstr
 import re
 import math
 import json
+from tuktuk_hailing.api.place_index import get_place_index, get_catalog_version, normalize, SEARCH_KEY_SEPARATOR
+from tuktuk_hailing.api.metrics import instrument, record_cache_lookup
+
+# InnoDB ignores shorter words (innodb_ft_min_token_size)
+FULLTEXT_MIN_TOKEN_LENGTH = 3
+
+BOUNDS_KEYS = ['min_lat', 'max_lat', 'min_lng', 'max_lng']
+
+# Reverse lookups never scan further than this
+MAX_REVERSE_LOOKUP_RADIUS_M = 2000
+
+# Entries are keyed by catalog version, so edits invalidate them immediately;
+# the TTL only bounds how long unused entries stay in Redis
+PLACE_RESULT_CACHE_TTL = 3600
 
 @frappe.whitelist(allow_guest=True)
+@instrument
 def search_places(query, limit=5, user_lat=None, user_lng=None, bounds=None):
     """
     Search for places in local database
@@ -41,13 +56,38 @@ def search_places(query, limit=5, user_lat=None, user_lng=None, bounds=None):
         except:
             bounds = None
     
+    search_mode = get_place_search_mode()
+    
+    # Round the user location (~110 m) and bounds (~11 m) so nearby
+    # requests share cache entries; the search uses the rounded values too
+    origin = round_coordinates(parse_origin(user_lat, user_lng), 3)
+    bounds = round_coordinates(parse_bounds(bounds), 4)
+    
+    cache_key = get_place_cache_key("search", query, limit, search_mode, bounds, origin)
+    cached = get_cached_place_results(cache_key)
+    
+    if cached is not None:
+        return cached
+    
+    response = get_search_response(query, limit, origin, bounds, search_mode)
+    set_cached_place_results(cache_key, response)
+    
+    return response
+
+def get_search_response(query, limit, origin, bounds, search_mode):
+    """Build the search_places response (uncached)"""
+    
+    user_lat, user_lng = origin or (None, None)
+    bounds = dict(zip(BOUNDS_KEYS, bounds)) if bounds else None
+    
     # Search in local database
     local_results = search_local_places(
         query, 
         limit, 
         user_lat=user_lat, 
         user_lng=user_lng,
-        bounds=bounds
+        bounds=bounds,
+        search_mode=search_mode
     )
     
     if local_results:
@@ -56,6 +96,22 @@ def search_places(query, limit=5, user_lat=None, user_lng=None, bounds=None):
             "results": local_results
         }
     
+    # Try typo-tolerant matching before sending the client to Nominatim
+    fuzzy_results = search_fuzzy_places(
+        query,
+        limit,
+        user_lat=user_lat,
+        user_lng=user_lng,
+        bounds=bounds
+    )
+    
+    if fuzzy_results:
+        return {
+            "source": "local",
+            "fuzzy": True,
+            "results": fuzzy_results
+        }
+    
     # No local results found
     return {
         "source": "none",
@@ -63,9 +119,59 @@ def search_places(query, limit=5, user_lat=None, user_lng=None, bounds=None):
         "message": "No local places found. Use Nominatim fallback."
     }
 
-def search_local_places(query, limit=5, user_lat=None, user_lng=None, bounds=None):
+@frappe.whitelist(allow_guest=True)
+@instrument
+def reverse_lookup(lat, lng, radius_m=200, limit=3):
+    """
+    Name a dropped pin or GPS fix using nearby local places
+    Answered from the in-memory place index without an external geocoder
+    
+    Args:
+        lat: Latitude of the point
+        lng: Longitude of the point
+        radius_m: Search radius in meters (max 2000)
+        limit: Maximum places to return, nearest first
+    """
+    
+    # Rate limiting
+    try:
+        from frappe.rate_limiter import rate_limit
+        rate_limit(limit=60, seconds=60)
+    except:
+        pass
+    
+    try:
+        lat = float(lat)
+        lng = float(lng)
+        radius_m = min(float(radius_m or 200), MAX_REVERSE_LOOKUP_RADIUS_M)
+        limit = int(limit or 3)
+    except (ValueError, TypeError):
+        return {"source": "none", "results": []}
+    
+    if not (-90 <= lat <= 90 and -180 <= lng <= 180) or radius_m <= 0:
+        return {"source": "none", "results": []}
+    
+    try:
+        index = get_place_index()
+    except Exception as e:
+        frappe.log_error(f"Place index error: {str(e)}", "Place Index")
+        return {"source": "none", "results": []}
+    
+    matches = index.nearby(lat, lng, radius_m, limit)
+    
+    if not matches:
+        return {"source": "none", "results": []}
+    
+    return {
+        "source": "local",
+        "results": [format_place_result(place, distance_km) for place, distance_km in matches]
+    }
+
+def search_local_places(query, limit=5, user_lat=None, user_lng=None, bounds=None, search_mode=None):
     """
-    Search local places database with fuzzy matching
+    Search local places
+    Uses the in-memory n-gram index unless Hailing Settings selects another mode
+    Falls back to the SQL LIKE search if the index cannot be loaded
     
     Args:
         query: Search term
@@ -73,54 +179,279 @@ def search_local_places(query, limit=5, user_lat=None, user_lng=None, bounds=Non
         user_lat: User's latitude for distance sorting
         user_lng: User's longitude for distance sorting
         bounds: Geographic bounds for filtering
+        search_mode: "Index", "Full Text" or "Like" (defaults to Hailing Settings)
     """
     
-    # Escape special characters for SQL LIKE
-    query_escaped = query.replace('%', '\\%').replace('_', '\\_')
+    search_mode = search_mode or get_place_search_mode()
+    
+    if search_mode == "Full Text":
+        return search_local_places_fulltext(query, limit, user_lat=user_lat, user_lng=user_lng, bounds=bounds)
+    
+    if search_mode == "Like":
+        return search_local_places_sql(query, limit, user_lat=user_lat, user_lng=user_lng, bounds=bounds)
+    
+    try:
+        index = get_place_index()
+    except Exception as e:
+        frappe.log_error(f"Place index error: {str(e)}", "Place Index")
+        return search_local_places_sql(query, limit, user_lat=user_lat, user_lng=user_lng, bounds=bounds)
+    
+    matches = index.search(
+        query,
+        limit,
+        bounds=parse_bounds(bounds),
+        origin=parse_origin(user_lat, user_lng)
+    )
+    
+    return [format_place_result(place, distance_km) for place, distance_km in matches]
+
+def search_fuzzy_places(query, limit=5, user_lat=None, user_lng=None, bounds=None):
+    """
+    Typo-tolerant place search ("Leopord Beach" -> "Leopard Beach Resort")
+    Used when exact and substring matching find nothing
+    
+    Args:
+        query: Search term
+        limit: Maximum results
+        user_lat: User's latitude for distance sorting
+        user_lng: User's longitude for distance sorting
+        bounds: Geographic bounds for filtering
+    """
+    
+    try:
+        index = get_place_index()
+    except Exception as e:
+        frappe.log_error(f"Place index error: {str(e)}", "Place Index")
+        return []
+    
+    matches = index.fuzzy_search(
+        query,
+        limit,
+        bounds=parse_bounds(bounds),
+        origin=parse_origin(user_lat, user_lng)
+    )
+    
+    return [format_place_result(place, distance_km) for place, distance_km in matches]
+
+def get_place_search_mode():
+    """Configured place search mode (defaults to the in-memory index)"""
+    try:
+        return frappe.db.get_single_value("Hailing Settings", "place_search_mode") or "Index"
+    except Exception:
+        return "Index"
+
+def build_fulltext_terms(query):
+    """
+    Convert a user query into a BOOLEAN MODE expression
+    Every word long enough to be indexed is required and prefix-matched
+    Returns None when no word is long enough
+    """
+    words = re.sub(r'[^\w\s]', ' ', query, flags=re.UNICODE).split()
+    terms = [f"+{word}*" for word in words if len(word) >= FULLTEXT_MIN_TOKEN_LENGTH]
+    return " ".join(terms) if terms else None
+
+def search_local_places_fulltext(query, limit=5, user_lat=None, user_lng=None, bounds=None):
+    """
+    Search local places with MariaDB FULLTEXT relevance scoring
+    Requires the ft_place_name and ft_place_search indexes from add_place_indexes
+    Queries with no word of at least 3 characters use the LIKE search instead
+    
+    Args:
+        query: Search term
+        limit: Maximum results
+        user_lat: User's latitude (adds distance_km to results)
+        user_lng: User's longitude (adds distance_km to results)
+        bounds: Geographic bounds for filtering
+    """
+    
+    terms = build_fulltext_terms(query)
+    if not terms:
+        return search_local_places_sql(query, limit, user_lat=user_lat, user_lng=user_lng, bounds=bounds)
     
-    # Build bounds filter
     bounds_filter = ""
-    params = {'query': query_escaped, 'limit': int(limit)}
+    params = {'query': normalize(query), 'terms': terms, 'limit': int(limit)}
     
-    if bounds and all(k in bounds for k in ['min_lat', 'max_lat', 'min_lng', 'max_lng']):
+    parsed_bounds = parse_bounds(bounds)
+    if parsed_bounds:
         bounds_filter = """
             AND latitude BETWEEN %(min_lat)s AND %(max_lat)s
             AND longitude BETWEEN %(min_lng)s AND %(max_lng)s
         """
-        params.update({
-            'min_lat': float(bounds['min_lat']),
-            'max_lat': float(bounds['max_lat']),
-            'min_lng': float(bounds['min_lng']),
-            'max_lng': float(bounds['max_lng'])
-        })
+        params.update(zip(BOUNDS_KEYS, parsed_bounds))
     
-    # Build distance calculation if user coordinates provided
-    distance_calc = ""
+    # Exact name first, then name relevance, then relevance across all text
+    sql = f"""
+        SELECT
+            place_name,
+            category,
+            latitude,
+            longitude,
+            aliases,
+            description,
+            MATCH(place_name) AGAINST (%(terms)s IN BOOLEAN MODE) AS name_score,
+            MATCH(place_name, aliases, description) AGAINST (%(terms)s IN BOOLEAN MODE) AS relevance
+        FROM `tabHailing Place`
+        WHERE
+            is_active = 1
+            {bounds_filter}
+            AND MATCH(place_name, aliases, description) AGAINST (%(terms)s IN BOOLEAN MODE)
+        ORDER BY
+            name_key = %(query)s DESC,
+            name_score DESC,
+            relevance DESC,
+            popularity_score DESC,
+            place_name ASC
+        LIMIT %(limit)s
+    """
+    
+    try:
+        results = frappe.db.sql(sql, params, as_dict=True)
+    except Exception as e:
+        # Most likely the FULLTEXT indexes have not been created yet
+        frappe.log_error(f"Full text place search error: {str(e)}", "Place Search")
+        return search_local_places_sql(query, limit, user_lat=user_lat, user_lng=user_lng, bounds=bounds)
+    
+    origin = parse_origin(user_lat, user_lng)
+    if origin:
+        from tuktuk_hailing.api.location import calculate_distance
+        
+        for result in results:
+            result.distance_km = calculate_distance(origin[0], origin[1], result.latitude, result.longitude)
+    
+    return [format_place_result(result, result.get('distance_km')) for result in results]
+
+def parse_bounds(bounds):
+    """Return (min_lat, max_lat, min_lng, max_lng) floats, or None if bounds are incomplete"""
+    if bounds and all(k in bounds for k in BOUNDS_KEYS):
+        return tuple(float(bounds[k]) for k in BOUNDS_KEYS)
+    return None
+
+def round_coordinates(coordinates, digits):
+    """Round a tuple of coordinates (None passes through)"""
+    if coordinates is None:
+        return None
+    return tuple(round(value, digits) for value in coordinates)
+
+def get_place_cache_key(endpoint, query, limit, *parts):
+    """
+    Cache key for place results
+    Includes the catalog version so any Hailing Place change misses the cache
+    """
+    key_parts = [endpoint, str(get_catalog_version()), normalize(query), str(int(limit))]
+    
+    for part in parts:
+        if isinstance(part, (tuple, list)):
+            part = ",".join(str(value) for value in part)
+        key_parts.append(cstr(part))
+    
+    cache = frappe.cache()
+    return cache.make_key("place_results:" + ":".join(key_parts))
+
+def get_cached_place_results(cache_key):
+    """Cached results for key, or None on a miss"""
+    try:
+        cached = frappe.cache().get(cache_key)
+        if cached:
+            results = json.loads(cached)
+            record_cache_lookup(True)
+            return results
+    except Exception:
+        pass  # If cache is unavailable or corrupted, fetch fresh data
+    
+    record_cache_lookup(False)
+    return None
+
+def set_cached_place_results(cache_key, results):
+    """Store results as JSON with PLACE_RESULT_CACHE_TTL"""
+    try:
+        frappe.cache().setex(cache_key, PLACE_RESULT_CACHE_TTL, json.dumps(results))
+    except Exception as e:
+        # If caching fails, log it but continue
+        frappe.log_error(f"Cache error: {str(e)}", "Place Results Cache")
+
+def parse_origin(user_lat, user_lng):
+    """Return (lat, lng) floats, or None if the user location is missing or invalid"""
     if user_lat and user_lng:
         try:
-            lat = float(user_lat)
-            lng = float(user_lng)
-            distance_calc = f"""
-                , (6371 * acos(
-                    cos(radians({lat})) 
-                    * cos(radians(latitude)) 
-                    * cos(radians(longitude) - radians({lng})) 
-                    + sin(radians({lat})) 
-                    * sin(radians(latitude))
-                )) AS distance_km
-            """
-            order_by = "match_priority ASC, distance_km ASC"
+            return float(user_lat), float(user_lng)
         except (ValueError, TypeError):
-            order_by = "match_priority ASC, place_name ASC"
-    else:
-        order_by = "match_priority ASC, place_name ASC"
+            pass
+    return None
+
+def format_place_result(place, distance_km=None):
+    """Format a place for the search_places response"""
+    formatted_result = {
+        'place_name': place.place_name,
+        'display_name': format_display_name(place),
+        'lat': place.latitude,
+        'lon': place.longitude,
+        'category': place.category,
+        'source': 'local'
+    }
+    
+    if distance_km is not None:
+        formatted_result['distance_km'] = round(distance_km, 2)
     
-    # Search strategy:
-    # 1. Exact match on place_name
-    # 2. Starts with match on place_name
-    # 3. Contains match on place_name
-    # 4. Match in aliases
-    # 5. Match in category
+    return formatted_result
+
+def search_local_places_sql(query, limit=5, user_lat=None, user_lng=None, bounds=None):
+    """
+    Search local places database with SQL LIKE matching
+    Used as a fallback when the in-memory index is unavailable
+    
+    Args:
+        query: Search term
+        limit: Maximum results
+        user_lat: User's latitude for distance sorting
+        user_lng: User's longitude for distance sorting
+        bounds: Geographic bounds for filtering
+    """
+    
+    # Normalized keys contain no LIKE wildcards, so no escaping is needed
+    query_key = normalize(query)
+    if not query_key:
+        return []
+    
+    # Build bounds filter
+    bounds_filter = ""
+    params = {'query': query_key, 'separator': SEARCH_KEY_SEPARATOR, 'limit': int(limit)}
+    
+    parsed_bounds = parse_bounds(bounds)
+    if parsed_bounds:
+        bounds_filter = """
+            AND latitude BETWEEN %(min_lat)s AND %(max_lat)s
+            AND longitude BETWEEN %(min_lng)s AND %(max_lng)s
+        """
+        params.update(zip(BOUNDS_KEYS, parsed_bounds))
+    
+    # Order by distance using bound parameters and plain arithmetic
+    # (equirectangular approximation, no trigonometry per row); exact
+    # distances are computed for the returned rows only
+    distance_calc = ""
+    # Popular places win ties within a priority
+    order_by = "match_priority ASC, popularity_score DESC, place_name ASC"
+    
+    origin = parse_origin(user_lat, user_lng)
+    if origin:
+        distance_calc = """
+            , POW(latitude - %(user_lat)s, 2)
+              + POW((longitude - %(user_lng)s) * %(lng_scale)s, 2) AS distance_sq
+        """
+        params.update({
+            'user_lat': origin[0],
+            'user_lng': origin[1],
+            'lng_scale': math.cos(math.radians(origin[0]))
+        })
+        order_by = "match_priority ASC, distance_sq ASC"
+    
+    # Search strategy, against the stored normalized keys:
+    # 1. Exact match on name_key (index lookup)
+    # 2. Starts with match on name_key (index range scan)
+    # 3. Contains match on name_key
+    # 4. Match in aliases (name and alias parts of search_key)
+    # 5. Match in category (rest of search_key)
+    # Priorities 1-2 are fetched first through the name_key index; the
+    # contains match scans every row, so it only runs when they fall short
     
     sql = f"""
         SELECT 
@@ -132,47 +463,30 @@ def search_local_places(query, limit=5, user_lat=None, user_lng=None, bounds=Non
             description
             {distance_calc},
             CASE
-                WHEN LOWER(place_name) = LOWER(%(query)s) THEN 1
-                WHEN LOWER(place_name) LIKE LOWER(CONCAT(%(query)s, '%%')) THEN 2
-                WHEN LOWER(place_name) LIKE LOWER(CONCAT('%%', %(query)s, '%%')) THEN 3
-                WHEN LOWER(IFNULL(aliases, '')) LIKE LOWER(CONCAT('%%', %(query)s, '%%')) THEN 4
-                WHEN LOWER(IFNULL(category, '')) LIKE LOWER(CONCAT('%%', %(query)s, '%%')) THEN 5
-                ELSE 6
+                WHEN name_key = %(query)s THEN 1
+                WHEN name_key LIKE CONCAT(%(query)s, '%%') THEN 2
+                WHEN name_key LIKE CONCAT('%%', %(query)s, '%%') THEN 3
+                WHEN SUBSTRING_INDEX(search_key, %(separator)s, 2) LIKE CONCAT('%%', %(query)s, '%%') THEN 4
+                ELSE 5
             END as match_priority
         FROM `tabHailing Place`
         WHERE 
             is_active = 1
             {bounds_filter}
-            AND (
-                LOWER(place_name) LIKE LOWER(CONCAT('%%', %(query)s, '%%'))
-                OR LOWER(IFNULL(aliases, '')) LIKE LOWER(CONCAT('%%', %(query)s, '%%'))
-                OR LOWER(IFNULL(category, '')) LIKE LOWER(CONCAT('%%', %(query)s, '%%'))
-            )
+            AND {{match_filter}}
         ORDER BY {order_by}
         LIMIT %(limit)s
     """
     
-    results = frappe.db.sql(sql, params, as_dict=True)
-    
-    # Format results for frontend
-    formatted_results = []
-    for result in results:
-        formatted_result = {
-            'place_name': result.place_name,
-            'display_name': format_display_name(result),
-            'lat': result.latitude,
-            'lon': result.longitude,
-            'category': result.category,
-            'source': 'local'
-        }
-        
-        # Add distance if calculated
-        if hasattr(result, 'distance_km') and result.distance_km is not None:
-            formatted_result['distance_km'] = round(result.distance_km, 2)
+    results = run_place_match_query(sql, params)
+    
+    if origin:
+        from tuktuk_hailing.api.location import calculate_distance
         
-        formatted_results.append(formatted_result)
+        for result in results:
+            result.distance_km = calculate_distance(origin[0], origin[1], result.latitude, result.longitude)
     
-    return formatted_results
+    return [format_place_result(result, result.get('distance_km')) for result in results]
 
 def format_display_name(result):
     """
@@ -188,6 +502,7 @@ def format_display_name(result):
     return ", ".join(parts)
 
 @frappe.whitelist(allow_guest=True)
+@instrument
 def get_place_suggestions(query, limit=10):
     """
     Get autocomplete suggestions for place names with caching
@@ -209,21 +524,52 @@ def get_place_suggestions(query, limit=10):
         return []
     
     query = query.strip()
-    query_lower = query.lower()
     
-    # Use frappe cache for popular queries (5 minute cache)
-    cache_key = f"place_suggestions:{query_lower}:{limit}"
-    cached = frappe.cache().get(cache_key)
+    cache_key = get_place_cache_key("suggestions", query, limit)
+    cached = get_cached_place_results(cache_key)
     
-    if cached:
-        # Deserialize from JSON string
-        try:
-            return json.loads(cached)
-        except:
-            pass  # If cache is corrupted, continue to fetch fresh data
+    if cached is not None:
+        return cached
     
-    query_escaped = query.replace('%', '\\%').replace('_', '\\_')
+    try:
+        index = get_place_index()
+    except Exception as e:
+        frappe.log_error(f"Place index error: {str(e)}", "Place Index")
+        index = None
+    
+    if index:
+        matches = index.search(query, limit, include_category=False)
+        if not matches:
+            matches = index.fuzzy_search(query, limit)
+        suggestions = [format_place_suggestion(place) for place, _distance in matches]
+    else:
+        suggestions = get_place_suggestions_sql(query, limit)
+    
+    set_cached_place_results(cache_key, suggestions)
+    
+    return suggestions
+
+def format_place_suggestion(place):
+    """Format a place for the get_place_suggestions response"""
+    return {
+        'label': format_display_name(place),
+        'value': place.place_name,
+        'lat': place.latitude,
+        'lon': place.longitude,
+        'category': place.category
+    }
+
+def get_place_suggestions_sql(query, limit=10):
+    """
+    Autocomplete suggestions via SQL LIKE matching
+    Used as a fallback when the in-memory index is unavailable
+    """
+    
+    query_key = normalize(query)
+    if not query_key:
+        return []
     
+    # Category matches are left out, as in the index search
     sql = """
         SELECT 
             place_name,
@@ -231,43 +577,43 @@ def get_place_suggestions(query, limit=10):
             latitude,
             longitude,
             CASE
-                WHEN LOWER(place_name) LIKE LOWER(CONCAT(%(query)s, '%%')) THEN 1
-                WHEN LOWER(place_name) LIKE LOWER(CONCAT('%%', %(query)s, '%%')) THEN 2
-                WHEN LOWER(IFNULL(aliases, '')) LIKE LOWER(CONCAT('%%', %(query)s, '%%')) THEN 3
+                WHEN name_key LIKE CONCAT(%(query)s, '%%') THEN 1
+                WHEN name_key LIKE CONCAT('%%', %(query)s, '%%') THEN 2
+                WHEN SUBSTRING_INDEX(search_key, %(separator)s, 2) LIKE CONCAT('%%', %(query)s, '%%') THEN 3
                 ELSE 4
             END as match_priority
         FROM `tabHailing Place`
         WHERE 
             is_active = 1
-            AND (
-                LOWER(place_name) LIKE LOWER(CONCAT('%%', %(query)s, '%%'))
-                OR LOWER(IFNULL(aliases, '')) LIKE LOWER(CONCAT('%%', %(query)s, '%%'))
-            )
-        ORDER BY match_priority ASC, place_name ASC
+            AND {match_filter}
+        HAVING match_priority < 4
+        ORDER BY match_priority ASC, popularity_score DESC, place_name ASC
         LIMIT %(limit)s
     """
     
-    results = frappe.db.sql(sql, {
-        'query': query_escaped,
+    results = run_place_match_query(sql, {
+        'query': query_key,
+        'separator': SEARCH_KEY_SEPARATOR,
         'limit': int(limit)
-    }, as_dict=True)
-    
-    suggestions = []
-    for result in results:
-        suggestions.append({
-            'label': format_display_name(result),
-            'value': result.place_name,
-            'lat': result.latitude,
-            'lon': result.longitude,
-            'category': result.category
-        })
+    })
     
-    # Cache the results for 5 minutes (300 seconds)
-    # Serialize to JSON string before caching
-    try:
-        frappe.cache().setex(cache_key, 300, json.dumps(suggestions))
-    except Exception as e:
-        # If caching fails, log it but continue
-        frappe.log_error(f"Cache error: {str(e)}", "Place Suggestions Cache")
+    return [format_place_suggestion(result) for result in results]
+
+def run_place_match_query(sql, params):
+    """
+    Run a place match query, name_key prefix matches first
+    
+    The prefix filter is a range scan of the name_key index. Only when it
+    finds fewer than the limit does the query run again with the contains
+    filter on search_key, which has to scan every active place.
+    """
+    results = frappe.db.sql(
+        sql.format(match_filter="name_key LIKE CONCAT(%(query)s, '%%')"), params, as_dict=True
+    )
+    
+    if len(results) < params['limit']:
+        results = frappe.db.sql(
+            sql.format(match_filter="search_key LIKE CONCAT('%%', %(query)s, '%%')"), params, as_dict=True
+        )
     
-    return suggestions
\ No newline at end of file
+    return results
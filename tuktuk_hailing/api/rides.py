@@ -4,8 +4,10 @@
 import frappe
 from frappe.utils import now
 import math
+from tuktuk_hailing.api.metrics import instrument
 
 @frappe.whitelist(allow_guest=True)
+@instrument
 def create_ride_request_public(customer_phone, pickup_address, pickup_lat, pickup_lng,
                                destination_address, destination_lat, destination_lng, customer_name=None, number_of_passengers=1):
     """
@@ -144,6 +146,7 @@ def create_group_booking(customer_phone, customer_name, passenger_count,
     return group_booking.name
 
 @frappe.whitelist()
+@instrument
 def get_pending_requests_for_driver(driver_id=None):
     """
     Get all pending ride requests visible to this driver
@@ -190,23 +193,25 @@ def get_pending_requests_for_driver(driver_id=None):
         order_by="requested_at asc"
     )
     
-    # Calculate distance from driver to each pickup location
-    from tuktuk_hailing.api.location import calculate_distance
-    
-    for request in requests:
-        request['distance_to_pickup_km'] = round(calculate_distance(
-            driver_location.latitude,
-            driver_location.longitude,
-            request.pickup_latitude,
-            request.pickup_longitude
-        ), 2)
-    
-    # Sort by distance to pickup
-    requests.sort(key=lambda x: x['distance_to_pickup_km'])
+    # Road distance and driving time from driver to every pickup in one matrix request
+    from tuktuk_hailing.api.routing import get_eta_matrix
+
+    etas = get_eta_matrix(
+        [(driver_location.latitude, driver_location.longitude)],
+        [(request.pickup_latitude, request.pickup_longitude) for request in requests]
+    )[0] if requests else []
+
+    for request, eta in zip(requests, etas):
+        request['distance_to_pickup_km'] = eta['distance_km']
+        request['eta_to_pickup_minutes'] = eta['duration_minutes']
+
+    # Sort by time to pickup
+    requests.sort(key=lambda x: x['eta_to_pickup_minutes'])
     
     return requests
 
 @frappe.whitelist()
+@instrument
 def accept_ride_request_by_driver(request_id, driver_id=None):
     """
     Driver accepts a ride request
@@ -242,6 +247,7 @@ def accept_ride_request_by_driver(request_id, driver_id=None):
         }
 
 @frappe.whitelist()
+@instrument
 def get_my_active_ride(driver_id=None):
     """
     Get driver's currently active ride (if any)
@@ -270,6 +276,7 @@ def get_my_active_ride(driver_id=None):
     return active_ride
 
 @frappe.whitelist()
+@instrument
 def mark_ride_en_route(request_id):
     """
     Driver marks that they are en route to pickup customer
@@ -291,30 +298,33 @@ def mark_ride_en_route(request_id):
         }
 
 @frappe.whitelist()
+@instrument
 def complete_ride_by_driver(request_id, actual_fare):
     """
     Driver marks ride as complete and enters actual fare
     """
     from tuktuk_hailing.tuktuk_hailing.doctype.ride_request.ride_request import complete_ride
-    from tuktuk_hailing.tuktuk_hailing.doctype.ride_trip.ride_trip import create_ride_trip_from_request
     
     try:
         # Complete the ride request
         result = complete_ride(request_id, actual_fare)
         
-        # Create ride trip record
-        trip_id = create_ride_trip_from_request(request_id)
-        
-        # Send payment request to customer
-        send_payment_request(trip_id, actual_fare)
-        
-        # Send rating request link
-        send_rating_request(trip_id)
+        # Trip record, payment and rating requests run in a worker
+        frappe.enqueue(
+            "tuktuk_hailing.api.rides.process_completed_ride",
+            queue="short",
+            enqueue_after_commit=True,
+            request_id=request_id,
+            actual_fare=actual_fare
+        )
+        frappe.db.commit()
         
+        # The trip is created by the job; clients keep getting the trip_id key
         return {
             "success": True,
-            "trip_id": trip_id,
-            "message": "Ride completed. Payment request sent to customer."
+            "trip_id": None,
+            "processing": True,
+            "message": "Ride completed. Payment request will be sent to customer."
         }
     
     except Exception as e:
@@ -325,6 +335,7 @@ def complete_ride_by_driver(request_id, actual_fare):
         }
 
 @frappe.whitelist()
+@instrument
 def cancel_ride_by_driver(request_id, reason=None):
     """
     Driver cancels an accepted ride
@@ -346,6 +357,7 @@ def cancel_ride_by_driver(request_id, reason=None):
         }
 
 @frappe.whitelist(allow_guest=True)
+@instrument
 def cancel_ride_by_customer(request_id, customer_phone, reason=None):
     """
     Customer cancels their ride request
@@ -379,6 +391,7 @@ def cancel_ride_by_customer(request_id, customer_phone, reason=None):
         }
 
 @frappe.whitelist(allow_guest=True)
+@instrument
 def get_group_booking_status(group_booking_id, customer_phone):
     """
     Get status of a group booking with multiple tuktuks
@@ -437,6 +450,7 @@ def get_group_booking_status(group_booking_id, customer_phone):
     return response
 
 @frappe.whitelist(allow_guest=True)
+@instrument
 def get_ride_status(request_id, customer_phone):
     """
     Get current status of a ride request
@@ -494,6 +508,24 @@ def get_ride_status(request_id, customer_phone):
     
     return response
 
+def process_completed_ride(request_id, actual_fare):
+    """
+    Background job: create the Ride Trip and send payment and rating requests
+    Enqueued by complete_ride_by_driver on the short queue
+    """
+    from tuktuk_hailing.tuktuk_hailing.doctype.ride_trip.ride_trip import create_ride_trip_from_request
+    
+    # Create ride trip record
+    trip_id = create_ride_trip_from_request(request_id)
+    
+    # Send payment request to customer
+    send_payment_request(trip_id, actual_fare)
+    
+    # Send rating request link
+    send_rating_request(trip_id)
+    
+    return trip_id
+
 # Notification helper functions
 
 def notify_customer_driver_accepted(request_id):
@@ -568,6 +600,7 @@ def send_rating_request(trip_id):
     pass
 
 @frappe.whitelist()
+@instrument
 def test_websocket_notification():
     """
     Test endpoint to manually trigger a WebSocket notification to all available drivers
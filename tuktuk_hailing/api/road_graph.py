@@ -0,0 +1,399 @@
+# Copyright (c) 2024, Sunny Tuktuk and contributors
+# For license information, please see license.txt
+
+"""
+Built-in road router for the service area
+
+build_road_graph.py turns an OSM extract into a compact graph file. Each
+worker loads it once into flat arrays (compressed sparse rows: the edges of
+node n are offsets[n]..offsets[n + 1]) and answers routes with A* and ETA
+matrices with Dijkstra, so routing keeps working without OSRM or with no
+external service configured at all.
+"""
+
+import frappe
+from array import array
+from heapq import heappush, heappop
+import json
+import math
+import os
+import sys
+
+ROAD_GRAPH_FILENAME = "road_graph.bin"
+ROAD_GRAPH_MAGIC = b"TTRG1\n"
+
+# Same fixed-point scale as OSM, so coordinates fit 32-bit ints exactly
+COORDINATE_SCALE = 10 ** 7
+
+# Nearest-node lookup grid, about 550 m per cell
+GRID_DEGREES = 0.005
+
+# Points further than this from any road are not routed
+MAX_SNAP_DISTANCE_M = 500
+
+# Speed for the straight legs between a point and its nearest road node
+SNAP_SPEED_KMH = 10
+
+METRES_PER_DEGREE = 111320
+
+# {site: (file mtime, graph)}; a worker can serve several sites
+_graphs = {}
+
+def get_road_graph_path():
+    return frappe.get_site_path("private", ROAD_GRAPH_FILENAME)
+
+def get_road_graph():
+    """
+    The site's road graph, loaded once per worker and reloaded when rebuilt
+    Returns the site's previously loaded graph (or None) if the file cannot be read
+    """
+    site = frappe.local.site
+    path = get_road_graph_path()
+
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        return None
+
+    loaded_mtime, graph = _graphs.get(site, (None, None))
+
+    if mtime != loaded_mtime:
+        # A broken file is not retried until it changes; the previous graph stays in use
+        try:
+            graph = RoadGraph.load(path)
+        except Exception as e:
+            frappe.log_error(f"Road graph load error: {str(e)}", "Road Graph")
+        _graphs[site] = (mtime, graph)
+
+    return graph
+
+def get_offline_route(start_lat, start_lng, end_lat, end_lng):
+    """Route in the get_osrm_route shape, or None without a graph or route"""
+    graph = get_road_graph()
+
+    if not graph:
+        return None
+
+    return graph.route(float(start_lat), float(start_lng), float(end_lat), float(end_lng))
+
+def get_offline_eta_cells(pairs):
+    """
+    ETA cells for (source, destination) pairs of (lat, lng) points
+    Pairs the graph cannot route are left out
+    """
+    graph = get_road_graph()
+
+    if not graph or not pairs:
+        return {}
+
+    sources = list(dict.fromkeys(source for source, _destination in pairs))
+    destinations = list(dict.fromkeys(destination for _source, destination in pairs))
+    matrix = graph.eta_matrix(sources, destinations)
+
+    cells = {}
+    for source, row in zip(sources, matrix):
+        for destination, cell in zip(destinations, row):
+            if cell and (source, destination) in pairs:
+                cells[(source, destination)] = cell
+
+    return cells
+
+def build_csr(node_count, sources):
+    """
+    Group edges by source node
+    Returns (offsets, order): the edges of node n are order[offsets[n]:offsets[n + 1]]
+    """
+    offsets = array("i", [0]) * (node_count + 1)
+
+    for source in sources:
+        offsets[source + 1] += 1
+
+    for n in range(node_count):
+        offsets[n + 1] += offsets[n]
+
+    position = array("i", offsets[:-1])
+    order = array("i", [0]) * len(sources)
+
+    for edge, source in enumerate(sources):
+        order[position[source]] = edge
+        position[source] += 1
+
+    return offsets, order
+
+def distance_m(lat1, lng1, lat2, lng2):
+    """Equirectangular distance, accurate to well under 1% at city scale"""
+    x = (lng2 - lng1) * math.cos(math.radians((lat1 + lat2) / 2))
+    y = lat2 - lat1
+    return math.sqrt(x * x + y * y) * METRES_PER_DEGREE
+
+class RoadGraph:
+    """
+    Directed road graph in flat arrays
+
+    lats, lngs: node coordinates (scaled ints)
+    offsets, targets: forward adjacency (CSR)
+    lengths, durations: per edge, metres and seconds
+    """
+
+    def __init__(self, lats, lngs, offsets, targets, lengths, durations):
+        self.lats = lats
+        self.lngs = lngs
+        self.offsets = offsets
+        self.targets = targets
+        self.lengths = lengths
+        self.durations = durations
+        self.node_count = len(lats)
+
+        # Fastest edge speed, for an A* heuristic that never overestimates
+        self.max_speed = max(
+            (length / duration for length, duration in zip(lengths, durations) if duration > 0),
+            default=1.0
+        )
+
+        self.build_reverse()
+        self.build_grid()
+
+    @classmethod
+    def from_edges(cls, lats, lngs, sources, targets, lengths, durations):
+        """Build from an edge list in any order"""
+        offsets, order = build_csr(len(lats), sources)
+
+        return cls(
+            lats, lngs, offsets,
+            array("i", (targets[edge] for edge in order)),
+            array("f", (lengths[edge] for edge in order)),
+            array("f", (durations[edge] for edge in order))
+        )
+
+    def build_reverse(self):
+        """Incoming edges per node, for searches from the destination side"""
+        sources = array("i")
+        for node in range(self.node_count):
+            sources.extend([node] * (self.offsets[node + 1] - self.offsets[node]))
+
+        self.reverse_offsets, order = build_csr(self.node_count, self.targets)
+        self.reverse_sources = array("i", (sources[edge] for edge in order))
+        self.reverse_edges = order
+
+    def build_grid(self):
+        """Bucket node ids by grid cell for nearest-node lookup"""
+        cells = {}
+        scale = COORDINATE_SCALE * GRID_DEGREES
+
+        for node in range(self.node_count):
+            cell = (int(self.lats[node] // scale), int(self.lngs[node] // scale))
+            cells.setdefault(cell, array("i")).append(node)
+
+        self.grid = cells
+
+    def coordinates(self, node):
+        return self.lats[node] / COORDINATE_SCALE, self.lngs[node] / COORDINATE_SCALE
+
+    def nearest_node(self, lat, lng):
+        """(node, distance in metres) of the closest node within MAX_SNAP_DISTANCE_M, or (None, None)"""
+        row = int(lat // GRID_DEGREES)
+        column = int(lng // GRID_DEGREES)
+
+        # Narrowest side of a cell (cells are narrower east-west away from the equator)
+        cell_m = GRID_DEGREES * METRES_PER_DEGREE * math.cos(math.radians(lat))
+        reach = int(MAX_SNAP_DISTANCE_M / cell_m) + 1
+
+        best, best_distance = None, MAX_SNAP_DISTANCE_M
+
+        for ring in range(reach + 1):
+            # Nodes in this ring are at least (ring - 1) cells away
+            if best is not None and (ring - 1) * cell_m > best_distance:
+                break
+
+            for cell_row in range(row - ring, row + ring + 1):
+                for cell_column in range(column - ring, column + ring + 1):
+                    if max(abs(cell_row - row), abs(cell_column - column)) != ring:
+                        continue
+
+                    for node in self.grid.get((cell_row, cell_column), ()):
+                        node_lat, node_lng = self.coordinates(node)
+                        distance = distance_m(lat, lng, node_lat, node_lng)
+                        if distance <= best_distance:
+                            best, best_distance = node, distance
+
+        return (best, best_distance) if best is not None else (None, None)
+
+    def heuristic(self, node, goal_lat, goal_lng):
+        node_lat, node_lng = self.coordinates(node)
+        return distance_m(node_lat, node_lng, goal_lat, goal_lng) * 0.99 / self.max_speed
+
+    def shortest_path(self, start, goal):
+        """A* by travel time; returns the list of edges from start to goal, or None"""
+        goal_lat, goal_lng = self.coordinates(goal)
+        offsets, targets, durations = self.offsets, self.targets, self.durations
+
+        best = {start: 0.0}
+        previous = {}
+        heap = [(self.heuristic(start, goal_lat, goal_lng), 0.0, start)]
+
+        while heap:
+            _estimate, time_so_far, node = heappop(heap)
+
+            if node == goal:
+                edges = []
+                while node != start:
+                    node, edge = previous[node]
+                    edges.append(edge)
+                return edges[::-1]
+
+            if time_so_far > best[node]:
+                continue
+
+            for edge in range(offsets[node], offsets[node + 1]):
+                target = targets[edge]
+                time_to_target = time_so_far + durations[edge]
+
+                if time_to_target < best.get(target, math.inf):
+                    best[target] = time_to_target
+                    previous[target] = (node, edge)
+                    heappush(heap, (time_to_target + self.heuristic(target, goal_lat, goal_lng), time_to_target, target))
+
+        return None
+
+    def route(self, start_lat, start_lng, end_lat, end_lng):
+        """Fastest route between two points in the get_osrm_route shape, or None"""
+        start, start_snap = self.nearest_node(start_lat, start_lng)
+        goal, goal_snap = self.nearest_node(end_lat, end_lng)
+
+        if start is None or goal is None:
+            return None
+
+        edges = self.shortest_path(start, goal)
+
+        if edges is None:
+            return None
+
+        coordinates = [[start_lng, start_lat]]
+        for node in [start] + [self.targets[edge] for edge in edges]:
+            lat, lng = self.coordinates(node)
+            coordinates.append([lng, lat])
+        coordinates.append([end_lng, end_lat])
+
+        snap_m = start_snap + goal_snap
+        distance = sum(self.lengths[edge] for edge in edges) + snap_m
+        duration = sum(self.durations[edge] for edge in edges) + snap_m / (SNAP_SPEED_KMH / 3.6)
+
+        return {
+            "distance_km": round(distance / 1000, 2),
+            "duration_minutes": round(duration / 60, 1),
+            "geometry": {"type": "LineString", "coordinates": coordinates},
+            "success": True,
+            "source": "offline"
+        }
+
+    def travel_times(self, origin, goals, reverse=False):
+        """
+        Dijkstra from origin until every goal node is settled
+        With reverse=True times are from each goal to the origin instead
+        Returns {node: (seconds, metres)} for the reachable goals
+        """
+        if reverse:
+            offsets, neighbours, edge_ids = self.reverse_offsets, self.reverse_sources, self.reverse_edges
+        else:
+            offsets, neighbours, edge_ids = self.offsets, self.targets, None
+
+        remaining = set(goals)
+        found = {}
+        best = {origin: 0.0}
+        heap = [(0.0, 0.0, origin)]
+
+        while heap and remaining:
+            time_so_far, length_so_far, node = heappop(heap)
+
+            if time_so_far > best[node]:
+                continue
+
+            if node in remaining:
+                remaining.discard(node)
+                found[node] = (time_so_far, length_so_far)
+
+            for position in range(offsets[node], offsets[node + 1]):
+                edge = edge_ids[position] if edge_ids is not None else position
+                neighbour = neighbours[position]
+                time_to_neighbour = time_so_far + self.durations[edge]
+
+                if time_to_neighbour < best.get(neighbour, math.inf):
+                    best[neighbour] = time_to_neighbour
+                    heappush(heap, (time_to_neighbour, length_so_far + self.lengths[edge], neighbour))
+
+        return found
+
+    def eta_matrix(self, sources, destinations):
+        """
+        Driving time and distance for every (lat, lng) source x destination
+        Searches run from whichever side has fewer points; unroutable cells are None
+        """
+        source_nodes = [self.nearest_node(lat, lng) for lat, lng in sources]
+        destination_nodes = [self.nearest_node(lat, lng) for lat, lng in destinations]
+        matrix = [[None] * len(destinations) for _source in sources]
+
+        reverse = len(destinations) < len(sources)
+        origins, goals = (destination_nodes, source_nodes) if reverse else (source_nodes, destination_nodes)
+        goal_set = {node for node, _snap in goals if node is not None}
+
+        for a, (origin, origin_snap) in enumerate(origins):
+            if origin is None:
+                continue
+
+            found = self.travel_times(origin, goal_set, reverse=reverse)
+
+            for b, (goal, goal_snap) in enumerate(goals):
+                if goal not in found:
+                    continue
+
+                seconds, metres = found[goal]
+                snap_m = origin_snap + goal_snap
+                cell = {
+                    "distance_km": round((metres + snap_m) / 1000, 2),
+                    "duration_minutes": round((seconds + snap_m / (SNAP_SPEED_KMH / 3.6)) / 60, 1)
+                }
+
+                if reverse:
+                    matrix[b][a] = cell
+                else:
+                    matrix[a][b] = cell
+
+        return matrix
+
+    def save(self, path):
+        """Write the graph as a header line and raw arrays (native byte order)"""
+        header = {
+            "nodes": self.node_count,
+            "edges": len(self.targets),
+            "byteorder": sys.byteorder
+        }
+
+        with open(path, "wb") as output:
+            output.write(ROAD_GRAPH_MAGIC)
+            output.write(json.dumps(header).encode("utf-8") + b"\n")
+            for values in (self.lats, self.lngs, self.offsets, self.targets, self.lengths, self.durations):
+                values.tofile(output)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "rb") as source:
+            if source.readline() != ROAD_GRAPH_MAGIC:
+                raise ValueError(f"{path} is not a road graph file")
+
+            header = json.loads(source.readline())
+            swap = header.get("byteorder") != sys.byteorder
+
+            def read(typecode, count):
+                values = array(typecode)
+                values.fromfile(source, count)
+                if swap:
+                    values.byteswap()
+                return values
+
+            nodes, edges = header["nodes"], header["edges"]
+
+            return cls(
+                read("i", nodes), read("i", nodes),
+                read("i", nodes + 1), read("i", edges),
+                read("f", edges), read("f", edges)
+            )
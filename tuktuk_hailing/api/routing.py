@@ -0,0 +1,468 @@
+# Copyright (c) 2024, Sunny Tuktuk and contributors
+# For license information, please see license.txt
+
+"""
+Pooled, cached OSRM routing client
+
+Drivers re-request the route to their customer on every screen refresh, so
+routes are cached in Redis keyed by start and end rounded to roughly 20 m.
+Each worker keeps one pooled HTTP session to OSRM, concurrent requests for
+the same route share a single upstream call, and a circuit breaker stops
+calling OSRM for a while after repeated failures.
+
+get_eta_matrix answers many drivers x many pickups with one OSRM table
+request, caching each driver/pickup cell the same way.
+"""
+
+import frappe
+import hashlib
+import json
+import time
+
+ROUTING_USER_AGENT = "SunnyTuktuk/1.0 (info@sunnytuktuk.com)"
+ROUTING_TIMEOUT_SECONDS = 5
+ROUTING_POOL_SIZE = 10
+
+# 0.0002 degrees is about 22 m of latitude (and slightly less longitude here)
+ROUTE_GRID_DEGREES = 0.0002
+ROUTE_CACHE_TTL = 600
+
+# ETA matrix cells (one source, one destination) are cached individually
+ETA_CACHE_TTL = 600
+# OSRM's default max-table-size is 100 coordinates per request
+TABLE_CHUNK_SIZE = 50
+# All table requests of one matrix share this budget; cells not fetched in
+# time come from the road graph or the straight-line estimate
+ETA_FETCH_BUDGET_SECONDS = 3
+
+# Without OSRM, road distance is estimated from the straight line; the coast
+# road and the few crossings between Diani and Ukunda add about 40%
+ETA_ROAD_FACTOR = 1.4
+ETA_FALLBACK_SPEED_KMH = 20
+
+# Only one worker asks OSRM for a given route at a time; the others wait up
+# to ROUTE_WAIT_SECONDS for its answer to land in the cache
+ROUTE_LOCK_SECONDS = 10
+ROUTE_WAIT_SECONDS = 6
+ROUTE_POLL_INTERVAL = 0.05
+
+# Circuit breaker: after CIRCUIT_FAILURE_THRESHOLD failures within
+# CIRCUIT_FAILURE_WINDOW seconds, OSRM is not called for CIRCUIT_COOLDOWN
+# seconds. After that a single probe request decides whether it closes again.
+CIRCUIT_FAILURE_THRESHOLD = 5
+CIRCUIT_FAILURE_WINDOW = 60
+CIRCUIT_COOLDOWN = 30
+CIRCUIT_FAILURES_KEY = "routing_circuit_failures"
+CIRCUIT_OPENED_KEY = "routing_circuit_opened"
+CIRCUIT_PROBE_KEY = "routing_circuit_probe"
+
+_session = None
+
+class RoutingServiceError(Exception):
+    """OSRM could not be reached or answered with a server error"""
+
+def get_session():
+    """Per-process HTTP session that keeps connections to OSRM open"""
+    global _session
+
+    if _session is None:
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=ROUTING_POOL_SIZE, pool_maxsize=ROUTING_POOL_SIZE)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        session.headers["User-Agent"] = ROUTING_USER_AGENT
+        _session = session
+
+    return _session
+
+def get_route(start_lat, start_lng, end_lat, end_lng, api_url):
+    """
+    Driving route between two points from the route cache or OSRM
+
+    Args:
+        start_lat, start_lng: Start coordinates
+        end_lat, end_lng: End coordinates
+        api_url: OSRM route service URL ending in "/route/v1/driving/"
+    """
+    route_key = get_route_key(start_lat, start_lng, end_lat, end_lng, api_url)
+
+    route = get_cached_route(route_key)
+    if route is not None:
+        return route
+
+    return resolve_route_miss(start_lat, start_lng, end_lat, end_lng, api_url, route_key)
+
+def snap(value):
+    """Round a coordinate to the route cache grid"""
+    return round(round(float(value) / ROUTE_GRID_DEGREES) * ROUTE_GRID_DEGREES, 6)
+
+def snap_point(point):
+    """Round a (lat, lng) pair to the route cache grid"""
+    return (snap(point[0]), snap(point[1]))
+
+def get_service_key(api_url):
+    """Short tag for the OSRM instance, so changing the URL starts a fresh cache"""
+    return hashlib.sha1((api_url or "").encode("utf-8")).hexdigest()[:8]
+
+def get_route_key(start_lat, start_lng, end_lat, end_lng, api_url):
+    """Cache key shared by all routes that start and end in the same grid cells"""
+    points = ",".join(str(snap(value)) for value in (start_lat, start_lng, end_lat, end_lng))
+    return f"route:{get_service_key(api_url)}:{points}"
+
+def get_cached_route(route_key):
+    """Cached route for route_key, or None"""
+    try:
+        cached = frappe.cache().get(frappe.cache().make_key(route_key))
+        if cached:
+            route = json.loads(cached)
+            route["source"] = "cache"
+            return route
+    except Exception:
+        pass  # Treat as a miss
+
+    return None
+
+def resolve_route_miss(start_lat, start_lng, end_lat, end_lng, api_url, route_key):
+    """
+    Ask OSRM for a route that is not cached
+    Only one caller per route does the upstream request; the rest wait for it
+    """
+    cache = frappe.cache()
+    lock_key = cache.make_key(route_key + ":lock")
+
+    if not cache.set(lock_key, 1, nx=True, ex=ROUTE_LOCK_SECONDS):
+        return wait_for_route(route_key)
+
+    try:
+        if not allow_routing_request():
+            return {"error": "Routing service unavailable", "success": False}
+
+        try:
+            route = fetch_osrm_route(start_lat, start_lng, end_lat, end_lng, api_url)
+        except RoutingServiceError as e:
+            record_routing_failure()
+            frappe.log_error(f"OSRM routing error: {str(e)}", "Routing API Error")
+            return {"error": "Routing service unavailable", "success": False}
+
+        record_routing_success()
+
+        if not route:
+            return {"error": "Route not found", "success": False}
+
+        try:
+            cache.setex(cache.make_key(route_key), ROUTE_CACHE_TTL, json.dumps(route))
+        except Exception as e:
+            frappe.log_error(f"Cache error: {str(e)}", "Routing Cache")
+
+        route["source"] = "osrm"
+        return route
+    finally:
+        cache.delete(lock_key)
+
+def wait_for_route(route_key):
+    """Wait for another worker to fetch the same route"""
+    deadline = time.monotonic() + ROUTE_WAIT_SECONDS
+
+    while time.monotonic() < deadline:
+        time.sleep(ROUTE_POLL_INTERVAL)
+        route = get_cached_route(route_key)
+        if route is not None:
+            return route
+
+        # The other worker finished without caching anything (no route or error)
+        if not frappe.cache().get(frappe.cache().make_key(route_key + ":lock")):
+            break
+
+    return {"error": "Routing service unavailable", "success": False}
+
+def fetch_osrm_route(start_lat, start_lng, end_lat, end_lng, api_url):
+    """
+    Request a route from OSRM
+    Returns the route, None when OSRM found no route, and raises
+    RoutingServiceError when OSRM is unreachable or failing
+    """
+    url = f"{api_url}{start_lng},{start_lat};{end_lng},{end_lat}"
+    params = {
+        "overview": "full",
+        "geometries": "geojson"
+    }
+
+    try:
+        response = get_session().get(url, params=params, timeout=ROUTING_TIMEOUT_SECONDS)
+    except Exception as e:
+        raise RoutingServiceError(str(e))
+
+    if response.status_code >= 500 or response.status_code == 429:
+        raise RoutingServiceError(f"HTTP {response.status_code}")
+
+    try:
+        data = response.json()
+    except ValueError:
+        raise RoutingServiceError("Invalid response")
+
+    if data.get("code") == "Ok" and data.get("routes"):
+        route = data["routes"][0]
+        return {
+            "distance_km": round(route["distance"] / 1000, 2),
+            "duration_minutes": round(route["duration"] / 60, 1),
+            "geometry": route["geometry"],
+            "success": True
+        }
+
+    return None
+
+def get_eta_matrix(sources, destinations, api_url=None):
+    """
+    Road distance and driving time from every source to every destination
+    Cells come from the ETA cache or one OSRM table request for all misses;
+    when OSRM is unavailable they come from the built-in road graph, and
+    failing that are estimated from the straight-line distance
+
+    Args:
+        sources: List of (lat, lng), e.g. driver locations
+        destinations: List of (lat, lng), e.g. pickup points
+        api_url: OSRM route service URL (defaults to the Routing API URL setting
+            when the Routing API Provider is OSRM; other providers are not asked)
+
+    Returns:
+        One row per source, each a list of
+        {"distance_km", "duration_minutes", "estimated"} per destination
+    """
+    if not sources or not destinations:
+        return [[] for _source in sources]
+
+    if api_url is None:
+        # Only OSRM speaks the table API; other providers go straight to the fallbacks
+        if frappe.db.get_single_value("Hailing Settings", "routing_api_provider") == "OSRM":
+            api_url = frappe.db.get_single_value("Hailing Settings", "routing_api_url")
+
+    service = get_service_key(api_url)
+    source_points = [snap_point(point) for point in sources]
+    destination_points = [snap_point(point) for point in destinations]
+
+    cells = get_cached_eta_cells(service, source_points, destination_points)
+    missing = {
+        (source, destination)
+        for source in source_points
+        for destination in destination_points
+        if (source, destination) not in cells
+    }
+
+    if missing and api_url and allow_routing_request():
+        fetched, error = fetch_eta_cells(missing, api_url)
+
+        if error:
+            record_routing_failure()
+            frappe.log_error(f"OSRM table error: {error}", "Routing API Error")
+        elif fetched:
+            record_routing_success()
+
+        # Chunks answered before a failure or the deadline are still used
+        cells.update(fetched)
+        cache_eta_cells(service, fetched)
+
+    # Cells OSRM could not answer come from the built-in road graph if there is one
+    missing = {pair for pair in missing if pair not in cells}
+    if missing:
+        from tuktuk_hailing.api.road_graph import get_offline_eta_cells
+        cells.update(get_offline_eta_cells(missing))
+
+    matrix = []
+    for source, source_point in zip(sources, source_points):
+        row = []
+        for destination, destination_point in zip(destinations, destination_points):
+            cell = cells.get((source_point, destination_point))
+            row.append(dict(cell, estimated=False) if cell else estimate_eta(source, destination))
+        matrix.append(row)
+
+    return matrix
+
+def get_eta_key(service, source, destination):
+    return f"eta:{service}:{source[0]},{source[1]};{destination[0]},{destination[1]}"
+
+def get_cached_eta_cells(service, source_points, destination_points):
+    """Cached cells for every source/destination pair, in a single round trip"""
+    pairs = list({
+        (source, destination): None
+        for source in source_points
+        for destination in destination_points
+    })
+
+    try:
+        cache = frappe.cache()
+        values = cache.mget([cache.make_key(get_eta_key(service, *pair)) for pair in pairs])
+    except Exception:
+        return {}  # Treat everything as a miss
+
+    return {pair: json.loads(value) for pair, value in zip(pairs, values) if value}
+
+def cache_eta_cells(service, cells):
+    try:
+        cache = frappe.cache()
+        pipeline = cache.pipeline()
+        for (source, destination), cell in cells.items():
+            pipeline.setex(cache.make_key(get_eta_key(service, source, destination)), ETA_CACHE_TTL, json.dumps(cell))
+        pipeline.execute()
+    except Exception as e:
+        frappe.log_error(f"Cache error: {str(e)}", "Routing Cache")
+
+def fetch_eta_cells(missing, api_url, budget_seconds=None):
+    """
+    Fetch the missing (source, destination) cells with OSRM table requests
+    Each request covers at most TABLE_CHUNK_SIZE sources and destinations;
+    together they stop after budget_seconds (ETA_FETCH_BUDGET_SECONDS)
+
+    Returns:
+        (cells fetched, error message or None); cells from chunks answered
+        before a failure or the deadline are kept
+    """
+    sources = list(dict.fromkeys(source for source, _destination in missing))
+    destinations = list(dict.fromkeys(destination for _source, destination in missing))
+    deadline = time.monotonic() + (ETA_FETCH_BUDGET_SECONDS if budget_seconds is None else budget_seconds)
+    cells = {}
+
+    for source_start in range(0, len(sources), TABLE_CHUNK_SIZE):
+        source_chunk = sources[source_start:source_start + TABLE_CHUNK_SIZE]
+
+        for destination_start in range(0, len(destinations), TABLE_CHUNK_SIZE):
+            destination_chunk = destinations[destination_start:destination_start + TABLE_CHUNK_SIZE]
+
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return cells, None
+
+            try:
+                durations, distances = fetch_osrm_table(
+                    source_chunk,
+                    destination_chunk,
+                    api_url,
+                    timeout=min(ROUTING_TIMEOUT_SECONDS, remaining)
+                )
+            except RoutingServiceError as e:
+                return cells, str(e)
+
+            for a, source in enumerate(source_chunk):
+                for b, destination in enumerate(destination_chunk):
+                    # None means OSRM found no road between the two points
+                    if durations[a][b] is None or distances[a][b] is None:
+                        continue
+                    cells[(source, destination)] = {
+                        "distance_km": round(distances[a][b] / 1000, 2),
+                        "duration_minutes": round(durations[a][b] / 60, 1)
+                    }
+
+    return cells, None
+
+def fetch_osrm_table(sources, destinations, api_url, timeout=ROUTING_TIMEOUT_SECONDS):
+    """
+    Request a duration and distance table from OSRM
+    Returns (durations, distances) in seconds and metres, one row per source
+    """
+    coordinates = ";".join(f"{lng},{lat}" for lat, lng in sources + destinations)
+    params = {
+        "sources": ";".join(str(n) for n in range(len(sources))),
+        "destinations": ";".join(str(n) for n in range(len(sources), len(sources) + len(destinations))),
+        "annotations": "duration,distance"
+    }
+
+    try:
+        response = get_session().get(
+            get_table_url(api_url) + coordinates,
+            params=params,
+            timeout=timeout
+        )
+    except Exception as e:
+        raise RoutingServiceError(str(e))
+
+    if response.status_code >= 500 or response.status_code == 429:
+        raise RoutingServiceError(f"HTTP {response.status_code}")
+
+    try:
+        data = response.json()
+    except ValueError:
+        raise RoutingServiceError("Invalid response")
+
+    if data.get("code") != "Ok" or "durations" not in data or "distances" not in data:
+        raise RoutingServiceError(data.get("message") or data.get("code") or "Invalid response")
+
+    return data["durations"], data["distances"]
+
+def get_table_url(api_url):
+    """OSRM table service URL for a route service URL"""
+    return api_url.replace("/route/", "/table/", 1)
+
+def estimate_eta(source, destination):
+    """Fallback cell: straight-line distance stretched to road distance"""
+    from tuktuk_hailing.api.location import calculate_distance
+
+    distance_km = calculate_distance(source[0], source[1], destination[0], destination[1]) * ETA_ROAD_FACTOR
+
+    return {
+        "distance_km": round(distance_km, 2),
+        "duration_minutes": round(distance_km / ETA_FALLBACK_SPEED_KMH * 60, 1),
+        "estimated": True
+    }
+
+def allow_routing_request():
+    """
+    Check the circuit breaker
+    While open no request is allowed; once the cooldown has passed, one
+    worker at a time may send a probe request
+    """
+    try:
+        cache = frappe.cache()
+        opened_at = cache.get(cache.make_key(CIRCUIT_OPENED_KEY))
+    except Exception:
+        return True  # Without Redis there is no shared breaker state
+
+    if not opened_at:
+        return True
+
+    if time.time() - float(opened_at) < CIRCUIT_COOLDOWN:
+        return False
+
+    return bool(cache.set(cache.make_key(CIRCUIT_PROBE_KEY), 1, nx=True, ex=ROUTING_TIMEOUT_SECONDS + 1))
+
+def record_routing_failure():
+    """Count a failure and open the circuit at the threshold (or when a probe fails)"""
+    try:
+        cache = frappe.cache()
+        failures_key = cache.make_key(CIRCUIT_FAILURES_KEY)
+        opened_key = cache.make_key(CIRCUIT_OPENED_KEY)
+
+        pipeline = cache.pipeline()
+        pipeline.incr(failures_key)
+        pipeline.expire(failures_key, CIRCUIT_FAILURE_WINDOW)
+        failures = pipeline.execute()[0]
+
+        if failures >= CIRCUIT_FAILURE_THRESHOLD or cache.get(opened_key):
+            # Kept well past the cooldown so a failed probe reopens the circuit
+            cache.setex(opened_key, CIRCUIT_COOLDOWN * 10, time.time())
+            cache.delete(cache.make_key(CIRCUIT_PROBE_KEY))
+    except Exception:
+        pass  # The breaker is an optimization; routing still works without it
+
+def record_routing_success():
+    """Close the circuit after any successful response"""
+    try:
+        cache = frappe.cache()
+        cache.delete(
+            cache.make_key(CIRCUIT_FAILURES_KEY),
+            cache.make_key(CIRCUIT_OPENED_KEY),
+            cache.make_key(CIRCUIT_PROBE_KEY)
+        )
+    except Exception:
+        pass
+
+def get_circuit_state():
+    """Circuit breaker state: closed, open or half-open"""
+    cache = frappe.cache()
+    opened_at = cache.get(cache.make_key(CIRCUIT_OPENED_KEY))
+
+    if not opened_at:
+        return "closed"
+
+    return "open" if time.time() - float(opened_at) < CIRCUIT_COOLDOWN else "half-open"
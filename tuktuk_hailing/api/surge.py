@@ -0,0 +1,151 @@
+# Copyright (c) 2024, Sunny Tuktuk and contributors
+# For license information, please see license.txt
+
+"""
+Surge pricing from live demand and supply
+
+A scheduled job bins recent Ride Requests (demand) and available drivers
+(supply) into grid cells of about 1 km with one GROUP BY query each, turns
+the demand/supply ratio of every cell into a fare multiplier, and stores the
+multipliers in a Redis hash. calculate_fare then needs a single hash lookup
+for the pickup cell, so quotes stay instant.
+"""
+
+import frappe
+import math
+from frappe.utils import cint, flt, now_datetime, add_to_date
+
+# About 1.1 km per cell
+SURGE_CELL_DEGREES = 0.01
+
+SURGE_MULTIPLIERS_KEY = "surge_multipliers"
+
+# Multipliers expire if the job stops running, so a stale surge never sticks
+SURGE_MULTIPLIERS_TTL = 360
+
+# Drivers in the 8 neighbouring cells can reach the pickup too
+NEIGHBOUR_SUPPLY_WEIGHT = 0.5
+
+# Surge starts once there are more requests than this per available driver
+SURGE_RATIO_THRESHOLD = 1.0
+SURGE_STEP_PER_RATIO = 0.25
+
+# A couple of requests in an empty cell is noise, not demand
+SURGE_MIN_REQUESTS = 3
+
+def update_surge_multipliers():
+    """
+    Scheduled job: recompute the multiplier of every cell with demand
+    Runs every 2 minutes via scheduler
+    """
+    settings = frappe.get_single("Hailing Settings")
+
+    if not settings.surge_pricing_enabled:
+        store_surge_multipliers({})
+        return {}
+
+    now = now_datetime()
+    demand = get_demand_by_cell(add_to_date(now, minutes=-(cint(settings.surge_window_minutes) or 15)))
+    supply = get_supply_by_cell(add_to_date(now, seconds=-(cint(settings.stale_location_threshold) or 60)))
+
+    multipliers = compute_surge_multipliers(demand, supply, flt(settings.surge_max_multiplier) or 2.0)
+    store_surge_multipliers(multipliers)
+
+    return multipliers
+
+def get_surge_cell(lat, lng):
+    """
+    Grid cell key for a point
+    floor(a / b), like the FLOOR() in the binning queries: float // is off by one on boundaries (39.57 // 0.01 == 3956)
+    """
+    return f"{math.floor(flt(lat) / SURGE_CELL_DEGREES)}:{math.floor(flt(lng) / SURGE_CELL_DEGREES)}"
+
+def get_demand_by_cell(since):
+    """Ride Requests made since `since`, counted per cell"""
+    return get_cell_counts("""
+        SELECT
+            FLOOR(pickup_latitude / %(cell)s) AS cell_row,
+            FLOOR(pickup_longitude / %(cell)s) AS cell_column,
+            COUNT(*)
+        FROM `tabRide Request`
+        WHERE requested_at >= %(since)s
+        GROUP BY cell_row, cell_column
+    """, since)
+
+def get_supply_by_cell(since):
+    """Available drivers with a location update since `since`, counted per cell"""
+    return get_cell_counts("""
+        SELECT
+            FLOOR(latitude / %(cell)s) AS cell_row,
+            FLOOR(longitude / %(cell)s) AS cell_column,
+            COUNT(DISTINCT driver)
+        FROM `tabDriver Location`
+        WHERE hailing_status = 'Available'
+            AND is_stale = 0
+            AND timestamp >= %(since)s
+        GROUP BY cell_row, cell_column
+    """, since)
+
+def get_cell_counts(query, since):
+    """{(row, column): count} from a grouped query"""
+    rows = frappe.db.sql(query, {"cell": SURGE_CELL_DEGREES, "since": since})
+    return {(int(row), int(column)): cint(count) for row, column, count in rows}
+
+def compute_surge_multipliers(demand, supply, max_multiplier):
+    """
+    Multiplier per cell key for the cells that surge
+
+    Args:
+        demand: {(row, column): requests}
+        supply: {(row, column): available drivers}
+        max_multiplier: Upper bound for any cell
+    """
+    multipliers = {}
+
+    for (row, column), requests in demand.items():
+        if requests < SURGE_MIN_REQUESTS:
+            continue
+
+        drivers = supply.get((row, column), 0) + NEIGHBOUR_SUPPLY_WEIGHT * sum(
+            supply.get((row + d_row, column + d_column), 0)
+            for d_row in (-1, 0, 1)
+            for d_column in (-1, 0, 1)
+            if d_row or d_column
+        )
+
+        ratio = requests / max(drivers, 1)
+        multiplier = 1 + SURGE_STEP_PER_RATIO * (ratio - SURGE_RATIO_THRESHOLD)
+
+        # Steps of 0.1 so quotes do not jitter between runs
+        multiplier = min(round(multiplier, 1), max_multiplier)
+
+        if multiplier > 1:
+            multipliers[f"{row}:{column}"] = multiplier
+
+    return multipliers
+
+def store_surge_multipliers(multipliers):
+    """Replace all stored multipliers in one transaction"""
+    try:
+        cache = frappe.cache()
+        key = cache.make_key(SURGE_MULTIPLIERS_KEY)
+
+        pipeline = cache.pipeline()
+        pipeline.delete(key)
+        if multipliers:
+            pipeline.hset(key, mapping=multipliers)
+            pipeline.expire(key, SURGE_MULTIPLIERS_TTL)
+        pipeline.execute()
+    except Exception as e:
+        frappe.log_error(f"Cache error: {str(e)}", "Surge Pricing")
+
+def get_surge_multiplier(lat, lng):
+    """Current multiplier for a pickup point (1.0 when there is no surge)"""
+    try:
+        cache = frappe.cache()
+        # Raw hmget: frappe's hget would prefix the key again and unpickle the value
+        value = cache.hmget(cache.make_key(SURGE_MULTIPLIERS_KEY), [get_surge_cell(lat, lng)])[0]
+    except Exception:
+        return 1.0  # Never block a quote on Redis
+
+    return flt(value.decode() if isinstance(value, bytes) else value) or 1.0
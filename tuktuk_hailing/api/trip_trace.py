@@ -0,0 +1,166 @@
+# Copyright (c) 2024, Sunny Tuktuk and contributors
+# For license information, please see license.txt
+
+"""
+Compact route traces for Ride Trips
+
+The points collected by trip_tracking are simplified with Douglas-Peucker
+(points closer than the configured tolerance to the line between their
+neighbours are dropped) and stored on the Ride Trip as an encoded polyline
+(the Google format, 5 decimal places). A trip keeps its route in a few
+hundred bytes, long after its Driver Location rows have been cleaned up.
+"""
+
+import frappe
+from frappe.utils import flt
+import math
+
+DEFAULT_TOLERANCE_M = 10
+
+# Metres per degree of latitude
+METRES_PER_DEGREE = 111195
+
+POLYLINE_PRECISION = 5
+
+def build_trip_trace(points, tolerance_m=None):
+    """
+    Encoded, simplified trace of a trip's points
+
+    Args:
+        points: [(lat, lng), ...] in driving order
+        tolerance_m: Simplification tolerance (Hailing Settings when not given)
+    Returns (encoded polyline, number of points kept)
+    """
+    if tolerance_m is None:
+        tolerance_m = flt(frappe.db.get_single_value("Hailing Settings", "trip_trace_tolerance_meters")) or DEFAULT_TOLERANCE_M
+
+    simplified = simplify_trace(points, tolerance_m)
+    return encode_polyline(simplified), len(simplified)
+
+def simplify_trace(points, tolerance_m):
+    """
+    Douglas-Peucker simplification, keeping the first and last point
+
+    Args:
+        points: [(lat, lng), ...]
+        tolerance_m: Largest distance in metres a dropped point may be from the kept line
+    """
+    if len(points) < 3 or tolerance_m <= 0:
+        return list(points)
+
+    # Local flat projection in metres: trips span a few km at most
+    cos_lat = math.cos(math.radians(points[0][0]))
+    xy = [(lng * METRES_PER_DEGREE * cos_lat, lat * METRES_PER_DEGREE) for lat, lng in points]
+
+    keep = [False] * len(points)
+    keep[0] = keep[-1] = True
+
+    # Iterative, so long traces cannot hit the recursion limit
+    stack = [(0, len(points) - 1)]
+
+    while stack:
+        first, last = stack.pop()
+        farthest, farthest_distance = None, tolerance_m
+
+        for index in range(first + 1, last):
+            distance = segment_distance(xy[index], xy[first], xy[last])
+            if distance > farthest_distance:
+                farthest, farthest_distance = index, distance
+
+        if farthest is not None:
+            keep[farthest] = True
+            stack.append((first, farthest))
+            stack.append((farthest, last))
+
+    return [point for point, kept in zip(points, keep) if kept]
+
+def segment_distance(point, start, end):
+    """Distance from a point to the segment start-end (flat coordinates)"""
+    dx, dy = end[0] - start[0], end[1] - start[1]
+    length_squared = dx * dx + dy * dy
+
+    if length_squared == 0:
+        t = 0
+    else:
+        t = max(0, min(1, ((point[0] - start[0]) * dx + (point[1] - start[1]) * dy) / length_squared))
+
+    return math.hypot(point[0] - (start[0] + t * dx), point[1] - (start[1] + t * dy))
+
+def encode_polyline(points):
+    """Encode [(lat, lng), ...] in the Google polyline format"""
+    factor = 10 ** POLYLINE_PRECISION
+    output = []
+    previous_lat = previous_lng = 0
+
+    for lat, lng in points:
+        lat, lng = int(round(lat * factor)), int(round(lng * factor))
+        encode_value(lat - previous_lat, output)
+        encode_value(lng - previous_lng, output)
+        previous_lat, previous_lng = lat, lng
+
+    return "".join(output)
+
+def encode_value(value, output):
+    """Append one signed delta as 5-bit chunks"""
+    value = ~(value << 1) if value < 0 else value << 1
+
+    while value >= 0x20:
+        output.append(chr((0x20 | (value & 0x1f)) + 63))
+        value >>= 5
+
+    output.append(chr(value + 63))
+
+def decode_polyline(encoded):
+    """Decode a Google polyline into [(lat, lng), ...]"""
+    factor = 10 ** POLYLINE_PRECISION
+    points = []
+    index = lat = lng = 0
+
+    while index < len(encoded):
+        delta_lat, index = decode_value(encoded, index)
+        delta_lng, index = decode_value(encoded, index)
+        lat += delta_lat
+        lng += delta_lng
+        points.append((lat / factor, lng / factor))
+
+    return points
+
+def decode_value(encoded, index):
+    """Read one signed delta starting at index; returns (value, next index)"""
+    result = shift = 0
+
+    while True:
+        chunk = ord(encoded[index]) - 63
+        index += 1
+        result |= (chunk & 0x1f) << shift
+        shift += 5
+
+        if chunk < 0x20:
+            break
+
+    return (~(result >> 1) if result & 1 else result >> 1), index
+
+@frappe.whitelist()
+def get_trip_trace(trip_id):
+    """
+    Decoded route of a Ride Trip for display
+
+    Args:
+        trip_id: Ride Trip
+    Returns coordinates as [lat, lng] pairs (Leaflet order)
+    """
+    trip = frappe.get_doc("Ride Trip", trip_id)
+    trip.check_permission("read")
+
+    if not trip.route_trace:
+        return {
+            "success": False,
+            "error": "No route recorded for this trip"
+        }
+
+    return {
+        "success": True,
+        "trip_id": trip.name,
+        "coordinates": [list(point) for point in decode_polyline(trip.route_trace)],
+        "distance_km": trip.distance_traveled_km
+    }
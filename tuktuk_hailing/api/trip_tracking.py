@@ -0,0 +1,224 @@
+# Copyright (c) 2024, Sunny Tuktuk and contributors
+# For license information, please see license.txt
+
+"""
+Trip distance from the driver's GPS pings
+
+While a driver has an accepted ride, every location ping advances a small
+per-ride state in Redis: the last accepted point and the running distance.
+Each ping costs one lookup and one write, however long the trip, and the
+total is read once when the Ride Trip is created.
+
+Distance only counts after the driver has come within PICKUP_RADIUS_M of the
+pickup point, so the drive to the customer is not billed. Pings with poor
+accuracy, moves smaller than the GPS noise and impossible jumps are ignored.
+The accepted points of the trip are kept in a Redis list as well, for the
+simplified route trace stored on the Ride Trip (see api/trip_trace.py).
+"""
+
+import frappe
+from frappe.utils import flt, cint
+from tuktuk_hailing.api.location import calculate_distance
+import time
+
+ACTIVE_RIDE_KEY = "driver_active_ride:"
+TRIP_TRACK_KEY = "trip_track:"
+TRIP_POINTS_KEY = "trip_points:"
+
+# About 7 hours of pings every 5 seconds; older points are dropped beyond that
+MAX_TRIP_POINTS = 5000
+
+# Longer than any trip; abandoned states expire on their own
+TRIP_TRACK_TTL = 6 * 3600
+
+# Pings less accurate than this are dropped
+MAX_ACCURACY_M = 50
+
+# Moves shorter than this (or than the ping's accuracy) are GPS jitter
+MIN_MOVE_M = 15
+
+# Faster than a tuktuk can go: a GPS jump, unless it persists
+MAX_SPEED_KMH = 80
+MAX_REJECTED_JUMPS = 3
+
+PICKUP_RADIUS_M = 75
+
+TRACK_FIELDS = (
+    "pickup_lat", "pickup_lng", "lat", "lng", "ts",
+    "distance_m", "trip_distance_m", "picked_up", "rejected", "pings"
+)
+
+def start_trip_tracking(ride_request):
+    """Link the driver to the ride and start an empty track at the pickup"""
+    cache = frappe.cache()
+    track_key = cache.make_key(TRIP_TRACK_KEY + ride_request.name)
+
+    try:
+        pipeline = cache.pipeline()
+        pipeline.setex(cache.make_key(ACTIVE_RIDE_KEY + ride_request.accepted_by_driver), TRIP_TRACK_TTL, ride_request.name)
+        pipeline.delete(track_key, cache.make_key(TRIP_POINTS_KEY + ride_request.name))
+        pipeline.hset(track_key, mapping={
+            "pickup_lat": flt(ride_request.pickup_latitude),
+            "pickup_lng": flt(ride_request.pickup_longitude),
+            "distance_m": 0,
+            "trip_distance_m": 0,
+            "picked_up": 0,
+            "rejected": 0,
+            "pings": 0
+        })
+        pipeline.expire(track_key, TRIP_TRACK_TTL)
+        pipeline.execute()
+    except Exception as e:
+        frappe.log_error(f"Cache error: {str(e)}", "Trip Tracking")
+
+def stop_trip_tracking(driver_id, request_id=None):
+    """
+    Stop counting pings for the driver
+    With request_id the ride's track is discarded too (cancelled rides)
+    """
+    try:
+        cache = frappe.cache()
+        keys = [cache.make_key(ACTIVE_RIDE_KEY + driver_id)]
+        if request_id:
+            keys.append(cache.make_key(TRIP_TRACK_KEY + request_id))
+            keys.append(cache.make_key(TRIP_POINTS_KEY + request_id))
+        cache.delete(*keys)
+    except Exception:
+        pass  # Keys expire on their own
+
+def record_trip_ping(driver_id, latitude, longitude, accuracy=None, timestamp=None):
+    """Advance the track of the driver's active ride, if any"""
+    try:
+        cache = frappe.cache()
+        request_id = cache.get(cache.make_key(ACTIVE_RIDE_KEY + driver_id))
+
+        if not request_id:
+            return
+
+        if isinstance(request_id, bytes):
+            request_id = request_id.decode()
+
+        track_key = cache.make_key(TRIP_TRACK_KEY + request_id)
+        state = read_track(cache, track_key)
+
+        if state is None:
+            return
+
+        update = advance_track(state, flt(latitude), flt(longitude), flt(accuracy) or None, time.time() if timestamp is None else timestamp)
+
+        if update:
+            pipeline = cache.pipeline()
+            pipeline.hset(track_key, mapping=update)
+            pipeline.expire(track_key, TRIP_TRACK_TTL)
+
+            # Trip points: every new position once the customer is on board
+            if update.get("picked_up") or ("lat" in update and cint(state.picked_up)):
+                points_key = cache.make_key(TRIP_POINTS_KEY + request_id)
+                pipeline.rpush(points_key, f"{flt(latitude):.6f},{flt(longitude):.6f}")
+                pipeline.ltrim(points_key, -MAX_TRIP_POINTS, -1)
+                pipeline.expire(points_key, TRIP_TRACK_TTL)
+
+            pipeline.execute()
+    except Exception as e:
+        # Never fail a location update because of distance tracking
+        frappe.log_error(f"Trip tracking error: {str(e)}", "Trip Tracking")
+
+def read_track(cache, track_key):
+    """Track state as a dict, or None if there is none"""
+    # Raw hmget: frappe's hgetall would prefix the key again and unpickle the values
+    values = cache.hmget(track_key, TRACK_FIELDS)
+
+    if values[0] is None:
+        return None
+
+    return frappe._dict({
+        field: (value.decode() if isinstance(value, bytes) else value)
+        for field, value in zip(TRACK_FIELDS, values)
+    })
+
+def advance_track(state, lat, lng, accuracy, timestamp):
+    """
+    Fields to update for one ping, or None if the ping is dropped
+
+    Args:
+        state: Current track (see TRACK_FIELDS); absent fields are None
+        lat, lng: Ping position
+        accuracy: Ping accuracy in metres, if known
+        timestamp: Ping time in seconds
+    """
+    if accuracy and accuracy > MAX_ACCURACY_M:
+        return None
+
+    update = {"pings": cint(state.pings) + 1}
+
+    if not cint(state.picked_up) and state.pickup_lat is not None:
+        if calculate_distance(flt(state.pickup_lat), flt(state.pickup_lng), lat, lng) * 1000 <= PICKUP_RADIUS_M:
+            update["picked_up"] = 1
+
+    if state.lat is None:
+        # First ping: nothing to measure from yet
+        update.update({"lat": lat, "lng": lng, "ts": timestamp})
+        return update
+
+    moved_m = calculate_distance(flt(state.lat), flt(state.lng), lat, lng) * 1000
+    elapsed = max(timestamp - flt(state.ts), 1)
+
+    if moved_m / elapsed * 3.6 > MAX_SPEED_KMH:
+        rejected = cint(state.rejected) + 1
+
+        if rejected < MAX_REJECTED_JUMPS:
+            update["rejected"] = rejected
+            return update
+
+        # The jump persists, so the old point was wrong: restart from here
+        update.update({"lat": lat, "lng": lng, "ts": timestamp, "rejected": 0})
+        return update
+
+    if moved_m < max(MIN_MOVE_M, accuracy or 0):
+        # Keep the old point, so slow movement adds up once it clears the noise
+        return update
+
+    update.update({
+        "lat": lat,
+        "lng": lng,
+        "ts": timestamp,
+        "rejected": 0,
+        "distance_m": flt(state.distance_m) + moved_m
+    })
+
+    if cint(state.picked_up):
+        update["trip_distance_m"] = flt(state.trip_distance_m) + moved_m
+
+    return update
+
+def finish_trip_tracking(request_id):
+    """
+    Final totals and trip points for a ride, removing its track
+    Returns {"distance_km", "trip_distance_km", "picked_up", "pings", "points"} or None
+    """
+    try:
+        cache = frappe.cache()
+        track_key = cache.make_key(TRIP_TRACK_KEY + request_id)
+        points_key = cache.make_key(TRIP_POINTS_KEY + request_id)
+        state = read_track(cache, track_key)
+
+        pipeline = cache.pipeline()
+        pipeline.lrange(points_key, 0, -1)
+        pipeline.delete(track_key, points_key)
+        raw_points = pipeline.execute()[0] or []
+    except Exception:
+        return None
+
+    if state is None:
+        return None
+
+    return frappe._dict({
+        "distance_km": round(flt(state.distance_m) / 1000, 2),
+        "trip_distance_km": round(flt(state.trip_distance_m) / 1000, 2),
+        "picked_up": bool(cint(state.picked_up)),
+        "pings": cint(state.pings),
+        "points": [
+            tuple(float(value) for value in (point.decode() if isinstance(point, bytes) else point).split(","))
+            for point in raw_points
+        ]
+    })
@@ -0,0 +1 @@
+# Benchmarks for Tuktuk Hailing
@@ -0,0 +1,528 @@
+#!/usr/bin/env python3
+"""
+Hailing Load Simulation
+
+Simulates a fleet of drivers pinging their position along Diani roads and
+polling for requests, and customers who look for drivers, book, poll their
+ride status and sometimes cancel. Drivers accept and complete rides. The
+simulated timeline is replayed as fast as the site allows, calling the API
+functions in process, and every call is timed and its database queries
+counted.
+
+The report gives p50/p95/p99 latency, queries per call and throughput per
+endpoint, plus the load the simulated traffic would put on the site
+(worker-seconds per second: how many busy workers it takes to keep up).
+Results are saved as JSON; compare_results diffs two runs.
+
+Run against a development site only - synthetic drivers, a vehicle and
+ride requests are inserted and committed, then removed at the end of the run
+together with their trips, dispatch events, rollup counts and Redis state.
+
+Usage:
+    bench execute tuktuk_hailing.benchmarks.load_simulation.run_simulation
+    bench execute tuktuk_hailing.benchmarks.load_simulation.run_simulation --kwargs "{'drivers': 500, 'bookings_per_minute': 50, 'duration_minutes': 5}"
+    bench execute tuktuk_hailing.benchmarks.load_simulation.compare_results --kwargs "{'baseline': 'before.json', 'current': 'after.json'}"
+"""
+
+import frappe
+from frappe.utils import now, now_datetime, cint, flt, get_datetime
+from tuktuk_hailing.api.location import calculate_distance
+from tuktuk_hailing.benchmarks.place_search import percentile
+import heapq
+import json
+import os
+import random
+import time
+
+# Marks synthetic rows so they can be removed without touching real data;
+# ride requests are removed by the names the run created, never by phone number
+BENCHMARK_OWNER = "load-benchmark@tuktuk.local"
+DRIVER_PREFIX = "BENCH-DRV-"
+VEHICLE_NAME = "BENCH-TUKTUK"
+CUSTOMER_PHONE_PREFIX = "+254700900"
+
+# Rows deleted per statement
+DELETE_BATCH_SIZE = 500
+
+# Main roads of the service area, as waypoints drivers go up and down
+DIANI_ROUTES = [
+    # Diani Beach Road, Tiwi end to Galu
+    [(-4.2790, 39.5935), (-4.2905, 39.5900), (-4.3040, 39.5850), (-4.3180, 39.5790),
+     (-4.3310, 39.5730), (-4.3450, 39.5680), (-4.3580, 39.5620)],
+    # Ukunda junction to the beach road
+    [(-4.2870, 39.5650), (-4.2850, 39.5720), (-4.2830, 39.5800), (-4.2810, 39.5880), (-4.2790, 39.5935)],
+    # Ukunda town along the highway
+    [(-4.2700, 39.5600), (-4.2780, 39.5630), (-4.2870, 39.5650), (-4.2990, 39.5690)]
+]
+
+DRIVER_SPEED_KMH = 25
+GPS_ACCURACY_M = 10
+
+# Seconds between calls of each simulated client
+DRIVER_POLL_SECONDS = 15
+CUSTOMER_POLL_SECONDS = 5
+
+# Customer and driver behaviour
+CANCEL_RATE = 0.1
+CANCEL_AFTER_SECONDS = (5, 60)
+ACCEPT_AFTER_SECONDS = (5, 25)
+RIDE_MINUTES = (3, 10)
+NEARBY_DRIVERS_KM = 5
+
+# A p95 or query count this much higher than the baseline is a regression
+REGRESSION_THRESHOLD = 0.2
+
+
+class Route:
+    """A road as waypoints, with positions by distance along it"""
+
+    def __init__(self, points):
+        self.points = points
+        self.lengths = [
+            calculate_distance(*start, *end)
+            for start, end in zip(points, points[1:])
+        ]
+        self.length_km = sum(self.lengths)
+
+    def position(self, distance_km):
+        """Point at distance_km along the route, driving back and forth"""
+        distance_km %= 2 * self.length_km
+        if distance_km > self.length_km:
+            distance_km = 2 * self.length_km - distance_km
+
+        for (start, end), length in zip(zip(self.points, self.points[1:]), self.lengths):
+            if distance_km <= length:
+                share = distance_km / length if length else 0
+                return (
+                    round(start[0] + (end[0] - start[0]) * share, 7),
+                    round(start[1] + (end[1] - start[1]) * share, 7)
+                )
+            distance_km -= length
+
+        return self.points[-1]
+
+
+class LoadSimulation:
+    """Event-driven replay of a simulated fleet and its customers"""
+
+    def __init__(self, drivers, bookings_per_minute, duration_minutes, ping_seconds, seed=42):
+        self.rng = random.Random(seed)
+        self.duration = duration_minutes * 60
+        self.bookings_per_minute = bookings_per_minute
+        self.ping_seconds = ping_seconds
+        self.routes = [Route(points) for points in DIANI_ROUTES]
+
+        self.drivers = [
+            frappe._dict(
+                name=f"{DRIVER_PREFIX}{n:04d}",
+                route=self.rng.choice(self.routes),
+                offset_km=self.rng.uniform(0, 20),
+                busy_with=None
+            )
+            for n in range(drivers)
+        ]
+        self.rides = {}
+        self.samples = {}
+        self.events = []
+        self.sequence = 0
+
+    def schedule(self, at, handler, *args):
+        if at <= self.duration:
+            self.sequence += 1
+            heapq.heappush(self.events, (at, self.sequence, handler, args))
+
+    def run(self):
+        for driver in self.drivers:
+            self.schedule(self.rng.uniform(0, self.ping_seconds), self.ping, driver)
+            self.schedule(self.rng.uniform(0, DRIVER_POLL_SECONDS), self.poll_requests, driver)
+
+        if self.bookings_per_minute:
+            self.schedule(self.rng.expovariate(self.bookings_per_minute / 60), self.book)
+
+        started = time.perf_counter()
+        while self.events:
+            at, _sequence, handler, args = heapq.heappop(self.events)
+            handler(at, *args)
+
+        return time.perf_counter() - started
+
+    def call(self, endpoint, fn, *args, **kwargs):
+        """Time one API call and count its queries; None if it failed"""
+        stats = self.samples.setdefault(endpoint, {"latency_ms": [], "queries": [], "errors": 0})
+        queries = [0]
+        original_sql = frappe.db.sql
+
+        def counting_sql(*sql_args, **sql_kwargs):
+            queries[0] += 1
+            return original_sql(*sql_args, **sql_kwargs)
+
+        frappe.db.sql = counting_sql
+        started = time.perf_counter()
+
+        try:
+            result = fn(*args, **kwargs)
+        except Exception:
+            frappe.db.rollback()
+            result = None
+        finally:
+            stats["latency_ms"].append((time.perf_counter() - started) * 1000)
+            frappe.db.sql = original_sql
+            stats["queries"].append(queries[0])
+
+        if result is None or (isinstance(result, dict) and result.get("success") is False):
+            stats["errors"] += 1
+            return None
+
+        return result
+
+    def driver_position(self, driver, at):
+        return driver.route.position(driver.offset_km + DRIVER_SPEED_KMH * at / 3600)
+
+    def random_point(self):
+        route = self.rng.choice(self.routes)
+        return route.position(self.rng.uniform(0, route.length_km))
+
+    def ping(self, at, driver):
+        from tuktuk_hailing.api.location import update_driver_location
+
+        lat, lng = self.driver_position(driver, at)
+        self.call(
+            "update_driver_location", update_driver_location,
+            lat, lng, driver_id=driver.name, accuracy=GPS_ACCURACY_M, speed=DRIVER_SPEED_KMH,
+            hailing_status="En Route" if driver.busy_with else "Available"
+        )
+        self.schedule(at + self.ping_seconds, self.ping, driver)
+
+    def poll_requests(self, at, driver):
+        from tuktuk_hailing.api.rides import get_pending_requests_for_driver
+
+        if not driver.busy_with:
+            self.call("get_pending_requests_for_driver", get_pending_requests_for_driver, driver.name)
+        self.schedule(at + DRIVER_POLL_SECONDS, self.poll_requests, driver)
+
+    def book(self, at):
+        from tuktuk_hailing.api.location import get_available_drivers
+        from tuktuk_hailing.api.rides import create_ride_request_public
+
+        self.schedule(at + self.rng.expovariate(self.bookings_per_minute / 60), self.book)
+
+        pickup, destination = self.random_point(), self.random_point()
+        if calculate_distance(*pickup, *destination) < 0.3:
+            return
+
+        phone = f"{CUSTOMER_PHONE_PREFIX}{len(self.rides):05d}"
+
+        # The booking page shows nearby drivers before the customer books
+        self.call("get_available_drivers", get_available_drivers, *pickup, NEARBY_DRIVERS_KM)
+
+        result = self.call(
+            "create_ride_request_public", create_ride_request_public,
+            phone, "Benchmark pickup", *pickup,
+            "Benchmark destination", *destination,
+            customer_name="Benchmark Customer"
+        )
+        if not result:
+            return
+
+        request_id = result["request_id"]
+        self.rides[request_id] = frappe._dict(phone=phone, status="Pending", driver=None)
+
+        self.schedule(at + CUSTOMER_POLL_SECONDS, self.poll_status, request_id)
+        self.schedule(at + self.rng.uniform(*ACCEPT_AFTER_SECONDS), self.accept, request_id)
+        if self.rng.random() < CANCEL_RATE:
+            self.schedule(at + self.rng.uniform(*CANCEL_AFTER_SECONDS), self.cancel, request_id)
+
+    def poll_status(self, at, request_id):
+        from tuktuk_hailing.api.rides import get_ride_status
+
+        ride = self.rides[request_id]
+        if ride.status not in ("Pending", "Accepted"):
+            return
+
+        result = self.call("get_ride_status", get_ride_status, request_id, ride.phone)
+        if result and result.get("status") == "Expired":
+            ride.status = "Expired"
+            return
+
+        self.schedule(at + CUSTOMER_POLL_SECONDS, self.poll_status, request_id)
+
+    def accept(self, at, request_id):
+        from tuktuk_hailing.api.rides import accept_ride_request_by_driver
+
+        ride = self.rides[request_id]
+        idle = [driver for driver in self.drivers if not driver.busy_with]
+        if ride.status != "Pending" or not idle:
+            return
+
+        driver = self.rng.choice(idle)
+        if not self.call("accept_ride_request_by_driver", accept_ride_request_by_driver, request_id, driver.name):
+            return
+
+        ride.status, ride.driver = "Accepted", driver
+        driver.busy_with = request_id
+        self.schedule(at + self.rng.uniform(*RIDE_MINUTES) * 60, self.complete, request_id)
+
+    def cancel(self, at, request_id):
+        from tuktuk_hailing.api.rides import cancel_ride_by_customer
+
+        ride = self.rides[request_id]
+        if ride.status != "Pending":
+            return
+
+        if self.call("cancel_ride_by_customer", cancel_ride_by_customer, request_id, ride.phone, "Benchmark"):
+            ride.status = "Cancelled"
+
+    def complete(self, at, request_id):
+        from tuktuk_hailing.api.rides import complete_ride_by_driver
+
+        ride = self.rides[request_id]
+        if ride.status != "Accepted":
+            return
+
+        self.call("complete_ride_by_driver", complete_ride_by_driver, request_id, 300)
+        ride.status = "Completed"
+        ride.driver.busy_with = None
+
+    def report(self):
+        """Per-endpoint statistics"""
+        results = {}
+
+        for endpoint, stats in sorted(self.samples.items()):
+            latencies = stats["latency_ms"]
+            calls = len(latencies)
+            mean_ms = sum(latencies) / calls
+
+            results[endpoint] = {
+                "calls": calls,
+                "errors": stats["errors"],
+                "mean_ms": round(mean_ms, 3),
+                "p50_ms": round(percentile(latencies, 50), 3),
+                "p95_ms": round(percentile(latencies, 95), 3),
+                "p99_ms": round(percentile(latencies, 99), 3),
+                "queries_per_call": round(sum(stats["queries"]) / calls, 2),
+                # What one worker can serve, and what the simulated traffic asks for
+                "throughput_per_s": round(1000 / mean_ms, 1) if mean_ms else None,
+                "demand_per_s": round(calls / self.duration, 2),
+                "load": round(calls / self.duration * mean_ms / 1000, 3)
+            }
+
+        return results
+
+
+def create_synthetic_fleet(count):
+    """Insert synthetic drivers sharing one synthetic vehicle"""
+    timestamp = now()
+    standard = ["name", "owner", "modified_by", "creation", "modified", "docstatus", "idx"]
+
+    frappe.db.bulk_insert(
+        "TukTuk Vehicle", standard,
+        [(VEHICLE_NAME, BENCHMARK_OWNER, BENCHMARK_OWNER, timestamp, timestamp, 0, 0)],
+        ignore_duplicates=True
+    )
+    frappe.db.bulk_insert(
+        "TukTuk Driver", standard + ["driver_name", "assigned_tuktuk", "hailing_status"],
+        [
+            (f"{DRIVER_PREFIX}{n:04d}", BENCHMARK_OWNER, BENCHMARK_OWNER, timestamp, timestamp, 0, 0,
+             f"Benchmark Driver {n}", VEHICLE_NAME, "Available")
+            for n in range(count)
+        ],
+        ignore_duplicates=True
+    )
+    frappe.db.commit()
+
+
+def remove_synthetic_data(requests, drivers):
+    """
+    Delete everything the simulation created
+
+    Args:
+        requests: Names of the Ride Requests the run created
+        drivers: Names of the synthetic drivers
+    """
+    from tuktuk_hailing.api.kpi_rollups import rebuild_kpi_rollups
+
+    # Before the requests go: the counts to take out of the minute rollups come from them
+    subtract_minute_rollups(requests)
+
+    for start in range(0, len(requests), DELETE_BATCH_SIZE):
+        batch = requests[start:start + DELETE_BATCH_SIZE]
+        frappe.db.delete("Ride Dispatch Event", {"ride_request": ["in", batch]})
+        frappe.db.delete("Ride Trip", {"ride_request": ["in", batch]})
+        frappe.db.delete("Ride Request", {"name": ["in", batch]})
+
+    frappe.db.delete("Driver Location", {"driver": ["like", DRIVER_PREFIX + "%"]})
+    frappe.db.delete("TukTuk Driver", {"owner": BENCHMARK_OWNER})
+    frappe.db.delete("TukTuk Vehicle", {"owner": BENCHMARK_OWNER})
+
+    frappe.db.commit()
+    # Day and total rollups are rebuilt without the run
+    rebuild_kpi_rollups()
+
+    clear_trip_tracking(requests, drivers)
+
+
+def subtract_minute_rollups(requests):
+    """Take the run's requests out of the minute rollups, leaving real activity in the same minutes"""
+    from tuktuk_hailing.api.kpi_rollups import get_rollup_key, write_rollup_rows
+
+    minutes = {}
+
+    # The same columns the daily rebuild counts each field by
+    for field, column, value, condition in (
+        ("requests", "requested_at", "COUNT(*)", ""),
+        ("accepts", "accepted_at", "COUNT(*)", ""),
+        ("cancellations", "cancelled_at", "COUNT(*)", "AND status = 'Cancelled'"),
+        ("completions", "modified", "COUNT(*)", "AND status = 'Completed'"),
+        ("revenue", "modified", "COALESCE(SUM(actual_fare), 0)", "AND status = 'Completed'")
+    ):
+        for start in range(0, len(requests), DELETE_BATCH_SIZE):
+            for minute, amount in frappe.db.sql(f"""
+                SELECT DATE_FORMAT({column}, '%%Y-%%m-%%d %%H:%%i:00') AS minute, {value}
+                FROM `tabRide Request`
+                WHERE name IN %(requests)s AND {column} IS NOT NULL {condition}
+                GROUP BY minute
+            """, {"requests": tuple(requests[start:start + DELETE_BATCH_SIZE])}):
+                counts = minutes.setdefault(get_datetime(minute), {})
+                counts[field] = counts.get(field, 0) - flt(amount)
+
+    write_rollup_rows([
+        (get_rollup_key("Minute", minute), minute, counts)
+        for minute, counts in minutes.items()
+    ])
+
+
+def clear_trip_tracking(requests, drivers):
+    """Drop the trip tracking state of the run's rides and drivers"""
+    from tuktuk_hailing.api.trip_tracking import ACTIVE_RIDE_KEY, TRIP_TRACK_KEY, TRIP_POINTS_KEY
+
+    cache = frappe.cache()
+    keys = [cache.make_key(ACTIVE_RIDE_KEY + driver) for driver in drivers]
+    keys += [cache.make_key(prefix + request) for request in requests for prefix in (TRIP_TRACK_KEY, TRIP_POINTS_KEY)]
+
+    for start in range(0, len(keys), DELETE_BATCH_SIZE):
+        cache.delete(*keys[start:start + DELETE_BATCH_SIZE])
+
+
+def run_simulation(drivers=500, bookings_per_minute=50, duration_minutes=5, ping_seconds=None,
+                   output=None, seed=42, keep=False):
+    """
+    Simulate a fleet and its customers, and report per-endpoint performance
+
+    Args:
+        drivers: Number of simulated drivers
+        bookings_per_minute: Average booking rate
+        duration_minutes: Simulated time
+        ping_seconds: Seconds between location pings (Hailing Settings when not given)
+        output: JSON file for the results (sites/<site>/private/benchmarks/ when not given)
+        seed: Random seed so runs are comparable
+        keep: Leave synthetic data in the database after the run
+
+    Returns:
+        dict with the configuration and {endpoint: stats}
+    """
+    settings = frappe.get_single("Hailing Settings")
+    ping_seconds = cint(ping_seconds) or cint(settings.location_update_interval_available) or 10
+
+    config = {
+        "drivers": cint(drivers),
+        "bookings_per_minute": flt(bookings_per_minute),
+        "duration_minutes": flt(duration_minutes),
+        "ping_seconds": ping_seconds,
+        "seed": cint(seed)
+    }
+
+    print("\n" + "=" * 100)
+    print("HAILING LOAD SIMULATION")
+    print("=" * 100)
+    print(f"🛺 {config['drivers']} drivers pinging every {ping_seconds}s, "
+          f"👥 {config['bookings_per_minute']:g} bookings/min, ⏱️  {config['duration_minutes']:g} simulated minutes")
+
+    started_at = now_datetime()
+    create_synthetic_fleet(config["drivers"])
+
+    simulation = LoadSimulation(
+        config["drivers"], config["bookings_per_minute"], config["duration_minutes"], ping_seconds, config["seed"]
+    )
+
+    try:
+        elapsed = simulation.run()
+        results = simulation.report()
+    finally:
+        if not keep:
+            remove_synthetic_data(list(simulation.rides), [driver.name for driver in simulation.drivers])
+            print("🗑️  Removed synthetic drivers and rides")
+
+    print(f"\n{'Endpoint':<34}{'calls':>7}{'errors':>8}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}"
+          f"{'queries':>9}{'max/s':>8}{'load':>7}")
+    print("-" * 100)
+    for endpoint, stats in results.items():
+        print(f"{endpoint:<34}{stats['calls']:>7}{stats['errors']:>8}{stats['p50_ms']:>9}{stats['p95_ms']:>9}"
+              f"{stats['p99_ms']:>9}{stats['queries_per_call']:>9}{stats['throughput_per_s'] or 0:>8}{stats['load']:>7}")
+
+    total_load = sum(stats["load"] for stats in results.values())
+    print("-" * 100)
+    print(f"Replayed {config['duration_minutes']:g} simulated minutes in {elapsed:.1f}s; "
+          f"the traffic needs about {total_load:.2f} busy workers")
+
+    run = {
+        "run_at": str(started_at),
+        "config": config,
+        "elapsed_seconds": round(elapsed, 2),
+        "workers_needed": round(total_load, 2),
+        "results": results
+    }
+
+    output = output or frappe.get_site_path("private", "benchmarks", f"load_simulation_{started_at:%Y%m%d_%H%M%S}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as handle:
+        json.dump(run, handle, indent=1)
+
+    print(f"💾 Saved results to {output}")
+    print("=" * 100 + "\n")
+
+    return run
+
+
+def compare_results(baseline, current, threshold=REGRESSION_THRESHOLD):
+    """
+    Compare two saved runs and list regressions
+
+    Args:
+        baseline: JSON file of the reference run
+        current: JSON file of the run to check
+        threshold: Allowed relative increase of p95 latency and queries per call
+
+    Returns:
+        list of regression descriptions (empty when there are none)
+    """
+    with open(baseline, encoding="utf-8") as handle:
+        before = json.load(handle)["results"]
+    with open(current, encoding="utf-8") as handle:
+        after = json.load(handle)["results"]
+
+    threshold = flt(threshold)
+    regressions = []
+
+    print(f"\n{'Endpoint':<34}{'p95 before':>12}{'p95 after':>12}{'queries before':>16}{'queries after':>15}")
+    print("-" * 89)
+
+    for endpoint in sorted(set(before) & set(after)):
+        old, new = before[endpoint], after[endpoint]
+        print(f"{endpoint:<34}{old['p95_ms']:>12}{new['p95_ms']:>12}{old['queries_per_call']:>16}{new['queries_per_call']:>15}")
+
+        for metric in ("p95_ms", "queries_per_call"):
+            if old[metric] and new[metric] > old[metric] * (1 + threshold):
+                regressions.append(f"{endpoint}: {metric} {old[metric]} -> {new[metric]}")
+
+    if regressions:
+        print("\n❌ Regressions:")
+        for regression in regressions:
+            print(f"   {regression}")
+    else:
+        print("\n✅ No regressions")
+
+    return regressions
+
+
+if __name__ == "__main__":
+    run_simulation()
@@ -0,0 +1,398 @@
+#!/usr/bin/env python3
+"""
+Place Search Benchmark
+
+Generates a synthetic Hailing Place catalog and times search_local_places in
+each search mode (Index, Full Text, Like) at increasing catalog sizes.
+
+run_search_suite times the search paths customers hit - search_local_places
+with and without user location and bounds, get_place_suggestions and the
+cached search_places path - across query lengths, saves the timings as JSON
+and fails when they regress against a saved baseline.
+
+Run against a development site only - synthetic rows are inserted and
+committed, then removed at the end of the run.
+
+Usage:
+    bench execute tuktuk_hailing.patches.add_place_indexes.execute
+    bench execute tuktuk_hailing.benchmarks.place_search.compare_search_modes
+    bench execute tuktuk_hailing.benchmarks.place_search.compare_search_modes --kwargs "{'sizes': [1000, 10000]}"
+    bench execute tuktuk_hailing.benchmarks.place_search.run_search_suite
+    bench execute tuktuk_hailing.benchmarks.place_search.run_search_suite --kwargs "{'baseline': 'place_search_baseline.json'}"
+"""
+
+import frappe
+from frappe.utils import now, now_datetime, flt
+import json
+import os
+import random
+import time
+
+# Marks synthetic rows so they can be removed without touching real places
+BENCHMARK_OWNER = "place-benchmark@tuktuk.local"
+
+DEFAULT_SIZES = (1000, 10000, 100000)
+
+SEARCH_MODES = ("Index", "Full Text", "Like")
+
+QUERIES = [
+    "di",
+    "diani",
+    "kinond",
+    "baobab villa",
+    "beach resort",
+    "galu kinondo",
+    "restaurant",
+    "msambweni cottages"
+]
+
+# Query sets by length, for run_search_suite
+QUERIES_BY_LENGTH = {
+    "short": ["di", "ga", "tiw", "bao"],
+    "medium": ["diani", "kinond", "coral", "villa"],
+    "long": ["baobab villa", "galu kinondo", "msambweni cottages", "leopard beach resort"]
+}
+
+# A customer in central Diani, and a map view around them
+USER_LOCATION = {"user_lat": -4.3180, "user_lng": 39.5790}
+SEARCH_BOUNDS = {"bounds": {"min_lat": -4.35, "max_lat": -4.28, "min_lng": 39.54, "max_lng": 39.60}}
+
+SEARCH_VARIANTS = {
+    "plain": {},
+    "location": USER_LOCATION,
+    "bounds": SEARCH_BOUNDS,
+    "location+bounds": dict(USER_LOCATION, **SEARCH_BOUNDS)
+}
+
+# p95 this much slower than the baseline fails the suite...
+REGRESSION_THRESHOLD = 0.25
+# ...unless the difference is below timer noise
+REGRESSION_FLOOR_MS = 0.5
+
+PLACE_WORDS = [
+    "Diani", "Galu", "Tiwi", "Ukunda", "Kinondo", "Msambweni", "Baobab", "Coral",
+    "Palm", "Sands", "Leopard", "Pinewood", "Kaskazi", "Kongo", "Mwaluganje", "Jadini",
+    "Shimba", "Neptune", "Kilimanjaro", "Amani", "Bahari", "Jambo", "Karibu", "Simba"
+]
+
+PLACE_TYPES = [
+    ("Beach Resort", "Resort hotel"),
+    ("Villa", "Villa"),
+    ("Cottages", "Cottage"),
+    ("Restaurant", "Restaurant"),
+    ("Hotel", "Hotel"),
+    ("Guest House", "Guest house"),
+    ("Seafood Grill", "Seafood"),
+    ("Apartments", "Holiday apartment rental"),
+    ("Supermarket", "Supermarket"),
+    ("Pharmacy", "Pharmacy")
+]
+
+
+def generate_places(count, start=0, seed=42):
+    """
+    Yield synthetic place rows that look like the coastal catalog
+
+    Args:
+        count: Number of places to generate
+        start: Sequence number of the first place (keeps names unique across calls)
+        seed: Random seed so runs are comparable
+    """
+    from tuktuk_hailing.import_diani_places import generate_aliases
+
+    rng = random.Random(seed + start)
+
+    for n in range(start, start + count):
+        first, second = rng.sample(PLACE_WORDS, 2)
+        place_type, category = rng.choice(PLACE_TYPES)
+        words = [first, second] if rng.random() < 0.3 else [first]
+        place_name = f"{' '.join(words)} {place_type} {n}"
+
+        yield {
+            "place_name": place_name,
+            "category": category,
+            # Diani-Galu coastal strip
+            "latitude": round(rng.uniform(-4.45, -4.20), 7),
+            "longitude": round(rng.uniform(39.50, 39.62), 7),
+            "aliases": generate_aliases(place_name, category),
+            "description": f"{place_type} near {rng.choice(PLACE_WORDS)}"
+        }
+
+
+def insert_places(rows):
+    """Bulk insert synthetic rows and return how many were inserted"""
+    from tuktuk_hailing.api.place_index import get_search_keys
+
+    timestamp = now()
+    fields = [
+        "name", "owner", "modified_by", "creation", "modified", "docstatus", "idx",
+        "place_name", "category", "latitude", "longitude", "aliases", "description", "is_active",
+        "name_key", "search_key"
+    ]
+
+    values = [
+        (
+            row["place_name"], BENCHMARK_OWNER, BENCHMARK_OWNER, timestamp, timestamp, 0, 0,
+            row["place_name"], row["category"], row["latitude"], row["longitude"],
+            row["aliases"], row["description"], 1,
+            *get_search_keys(row["place_name"], row["aliases"], row["category"])
+        )
+        for row in rows
+    ]
+
+    frappe.db.bulk_insert("Hailing Place", fields, values, ignore_duplicates=True)
+    # FULLTEXT indexes only see committed rows
+    frappe.db.commit()
+
+    return len(values)
+
+
+def remove_synthetic_places():
+    """Delete all rows created by the benchmark"""
+    from tuktuk_hailing.api.place_index import invalidate_place_index
+
+    frappe.db.sql("DELETE FROM `tabHailing Place` WHERE owner = %s", (BENCHMARK_OWNER,))
+    frappe.db.commit()
+    invalidate_place_index()
+
+
+def count_synthetic_places():
+    return frappe.db.count("Hailing Place", {"owner": BENCHMARK_OWNER})
+
+
+def grow_catalog(size):
+    """Top the synthetic catalog up to size rows"""
+    from tuktuk_hailing.api.place_index import invalidate_place_index
+
+    existing = count_synthetic_places()
+    if existing < size:
+        rows = list(generate_places(size - existing, start=existing))
+        for i in range(0, len(rows), 10000):
+            insert_places(rows[i:i + 10000])
+
+        # Bulk inserts skip doc events
+        invalidate_place_index()
+
+
+def percentile(samples, pct):
+    """Nearest-rank percentile of a list of numbers"""
+    ordered = sorted(samples)
+    if not ordered:
+        return 0
+    rank = max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered))) - 1))
+    return ordered[rank]
+
+
+def time_calls(fn, queries, repeat, before=None):
+    """
+    Time fn(query) for every query, repeat times
+
+    Args:
+        before: Called with the query before each timed call (not timed)
+
+    Returns:
+        dict with mean, p50, p95 and max in milliseconds
+    """
+    samples = []
+    for _ in range(repeat):
+        for query in queries:
+            if before:
+                before(query)
+            started = time.perf_counter()
+            fn(query)
+            samples.append((time.perf_counter() - started) * 1000)
+
+    return {
+        "mean_ms": round(sum(samples) / len(samples), 3),
+        "p50_ms": round(percentile(samples, 50), 3),
+        "p95_ms": round(percentile(samples, 95), 3),
+        "max_ms": round(max(samples), 3),
+        "calls": len(samples)
+    }
+
+
+def compare_search_modes(sizes=DEFAULT_SIZES, repeat=20, limit=5, keep=False):
+    """
+    Time every search mode at each catalog size
+
+    Args:
+        sizes: Synthetic catalog sizes to test, smallest first
+        repeat: Passes over the query set per mode
+        limit: Result limit passed to search_local_places
+        keep: Leave synthetic places in the database after the run
+
+    Returns:
+        dict of {size: {mode: timing stats}}
+    """
+    from tuktuk_hailing.api.places import search_local_places
+    from tuktuk_hailing.api.place_index import get_place_index
+
+    print("\n" + "=" * 60)
+    print("PLACE SEARCH BENCHMARK")
+    print("=" * 60)
+
+    results = {}
+
+    try:
+        for size in sorted(int(s) for s in sizes):
+            grow_catalog(size)
+            get_place_index()  # build outside the timed calls
+
+            results[size] = {}
+            print(f"\n📍 Catalog: {size} synthetic places")
+            print(f"{'Mode':<12}{'mean ms':>10}{'p50 ms':>10}{'p95 ms':>10}{'max ms':>10}")
+            print("-" * 52)
+
+            for mode in SEARCH_MODES:
+                stats = time_calls(
+                    lambda q: search_local_places(q, limit, search_mode=mode),
+                    QUERIES,
+                    int(repeat)
+                )
+                results[size][mode] = stats
+                print(f"{mode:<12}{stats['mean_ms']:>10}{stats['p50_ms']:>10}{stats['p95_ms']:>10}{stats['max_ms']:>10}")
+    finally:
+        if not keep:
+            remove_synthetic_places()
+            print("\n🗑️  Removed synthetic places")
+
+    print("=" * 60 + "\n")
+
+    return results
+
+
+def time_search_scenarios(repeat, limit):
+    """{scenario: timing stats} for every search path, query length and variant"""
+    from tuktuk_hailing.api.places import (
+        search_local_places,
+        search_places,
+        get_place_suggestions,
+        get_place_cache_key
+    )
+
+    cache = frappe.cache()
+    scenarios = {}
+
+    for length, queries in QUERIES_BY_LENGTH.items():
+        for variant, kwargs in SEARCH_VARIANTS.items():
+            scenarios[f"search_local_places {length} {variant}"] = time_calls(
+                lambda q: search_local_places(q, limit, search_mode="Index", **kwargs),
+                queries,
+                repeat
+            )
+
+        # Suggestions are cached; drop the entry so every timed call computes them
+        scenarios[f"get_place_suggestions {length}"] = time_calls(
+            lambda q: get_place_suggestions(q, limit),
+            queries,
+            repeat,
+            before=lambda q: cache.delete(get_place_cache_key("suggestions", q.strip(), limit))
+        )
+
+        for variant in ("plain", "location"):
+            kwargs = SEARCH_VARIANTS[variant]
+            # Warm the result cache, then time cache hits only
+            for query in queries:
+                search_places(query, limit, **kwargs)
+
+            scenarios[f"search_places cached {length} {variant}"] = time_calls(
+                lambda q: search_places(q, limit, **kwargs),
+                queries,
+                repeat
+            )
+
+    return scenarios
+
+
+def find_regressions(baseline, results, threshold=REGRESSION_THRESHOLD):
+    """
+    Scenarios whose p95 got slower than the baseline allows
+
+    Args:
+        baseline: {size: {scenario: stats}} from an earlier run
+        results: {size: {scenario: stats}} from this run
+        threshold: Allowed relative increase of p95
+    """
+    regressions = []
+
+    for size, scenarios in results.items():
+        for scenario, stats in scenarios.items():
+            before = baseline.get(str(size), {}).get(scenario)
+            if not before:
+                continue
+
+            slower_ms = stats["p95_ms"] - before["p95_ms"]
+            if stats["p95_ms"] > before["p95_ms"] * (1 + flt(threshold)) and slower_ms > REGRESSION_FLOOR_MS:
+                regressions.append(f"{size} places, {scenario}: p95 {before['p95_ms']} -> {stats['p95_ms']} ms")
+
+    return regressions
+
+
+def run_search_suite(sizes=DEFAULT_SIZES, repeat=20, limit=5, baseline=None, threshold=REGRESSION_THRESHOLD,
+                     output=None, keep=False):
+    """
+    Time every customer-facing search path at each catalog size
+
+    Args:
+        sizes: Synthetic catalog sizes to test, smallest first
+        repeat: Passes over each query set per scenario
+        limit: Result limit
+        baseline: JSON file of an earlier run; regressions beyond threshold fail the run
+        threshold: Allowed relative increase of p95 against the baseline
+        output: JSON file for the results (sites/<site>/private/benchmarks/ when not given)
+        keep: Leave synthetic places in the database after the run
+
+    Returns:
+        dict of {size: {scenario: timing stats}}
+    """
+    from tuktuk_hailing.api.place_index import get_place_index
+
+    print("\n" + "=" * 84)
+    print("PLACE SEARCH SUITE")
+    print("=" * 84)
+
+    results = {}
+
+    try:
+        for size in sorted(int(s) for s in sizes):
+            grow_catalog(size)
+            get_place_index()  # build outside the timed calls
+
+            results[size] = time_search_scenarios(int(repeat), int(limit))
+
+            print(f"\n📍 Catalog: {size} synthetic places")
+            print(f"{'Scenario':<44}{'mean ms':>10}{'p50 ms':>10}{'p95 ms':>10}{'max ms':>10}")
+            print("-" * 84)
+            for scenario, stats in results[size].items():
+                print(f"{scenario:<44}{stats['mean_ms']:>10}{stats['p50_ms']:>10}{stats['p95_ms']:>10}{stats['max_ms']:>10}")
+    finally:
+        if not keep:
+            remove_synthetic_places()
+            print("\n🗑️  Removed synthetic places")
+
+    output = output or frappe.get_site_path("private", "benchmarks", f"place_search_{now_datetime():%Y%m%d_%H%M%S}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as handle:
+        json.dump({str(size): scenarios for size, scenarios in results.items()}, handle, indent=1)
+    print(f"💾 Saved results to {output}")
+
+    if baseline:
+        with open(baseline, encoding="utf-8") as handle:
+            regressions = find_regressions(json.load(handle), results, threshold)
+
+        if regressions:
+            print("\n❌ Regressions:")
+            for regression in regressions:
+                print(f"   {regression}")
+            print("=" * 84 + "\n")
+            frappe.throw(f"{len(regressions)} place search regression(s) against {baseline}")
+
+        print("\n✅ No regressions against baseline")
+
+    print("=" * 84 + "\n")
+
+    return results
+
+
+if __name__ == "__main__":
+    compare_search_modes()
@@ -0,0 +1,322 @@
+#!/usr/bin/env python3
+"""
+Build the built-in road graph from an OpenStreetMap extract
+
+Supported files:
+- OSM XML (.osm, .osm.xml)
+- OSM PBF (.pbf, .osm.pbf) - needs pyosmium 3.7+ (pip install osmium)
+
+Roads inside the service area (plus a small margin) are kept, split into
+one edge per segment, weighted by tuktuk travel time for the road class,
+and reduced to the largest connected network. The result is written to the
+site's private folder, where api/road_graph.py picks it up.
+
+Usage:
+1. Download an extract (e.g. kenya-latest.osm.pbf clipped with osmium extract)
+2. Run: bench execute tuktuk_hailing.build_road_graph.build_from_file --kwargs "{'filepath': '/path/to/kwale.osm.pbf'}"
+"""
+
+from tuktuk_hailing.api.road_graph import RoadGraph, COORDINATE_SCALE, distance_m, get_road_graph_path
+from tuktuk_hailing.import_osm_places import NodeLocations, get_service_area, area_bbox, in_bbox
+from array import array
+from xml.etree import ElementTree
+import os
+import time
+
+# Typical tuktuk speeds (km/h) per OSM highway class; other classes are not driven
+ROAD_SPEEDS_KMH = {
+    "trunk": 45,
+    "primary": 40,
+    "secondary": 35,
+    "tertiary": 30,
+    "unclassified": 25,
+    "residential": 20,
+    "living_street": 10,
+    "service": 15,
+    "track": 12,
+    "road": 20
+}
+
+# Roads just outside the service area still connect places inside it
+BBOX_MARGIN_DEGREES = 0.02
+
+def build_from_file(filepath, output=None, clip_to_service_area=True):
+    """
+    Build and save the road graph
+
+    Args:
+        filepath: Path to .osm or .pbf extract
+        output: Graph file (defaults to the site's road_graph.bin)
+        clip_to_service_area: Only keep roads near the Hailing Settings service area
+    """
+
+    if not os.path.exists(filepath):
+        print(f"❌ File not found: {filepath}")
+        return
+
+    reader = get_way_reader(filepath)
+
+    if not reader:
+        print(f"❌ Unsupported file type: {filepath}")
+        return
+
+    bbox = None
+    if clip_to_service_area:
+        bbox = area_bbox(get_service_area())
+        if bbox:
+            bbox = (
+                bbox[0] - BBOX_MARGIN_DEGREES, bbox[1] + BBOX_MARGIN_DEGREES,
+                bbox[2] - BBOX_MARGIN_DEGREES, bbox[3] + BBOX_MARGIN_DEGREES
+            )
+        else:
+            print("⚠️  No service area configured - keeping every road in the extract")
+
+    print(f"\n🛣️  Building road graph from: {filepath}")
+    print("=" * 60)
+
+    started = time.monotonic()
+    builder = RoadGraphBuilder()
+
+    try:
+        for tags, points in reader(filepath, bbox):
+            builder.add_way(tags, points)
+    except ImportError as e:
+        print(f"❌ {str(e)}")
+        return
+
+    graph = builder.build()
+
+    if not graph.node_count:
+        print("❌ No drivable roads found")
+        return
+
+    output = output or get_road_graph_path()
+
+    # Workers reload on mtime change, so they must never see a half-written file
+    temp_output = f"{output}.tmp"
+    try:
+        graph.save(temp_output)
+        os.replace(temp_output, output)
+    finally:
+        if os.path.exists(temp_output):
+            os.remove(temp_output)
+
+    print(f"🧭 Nodes:            {graph.node_count}")
+    print(f"➡️  Edges:            {len(graph.targets)}")
+    print(f"✂️  Dropped (islands): {builder.dropped_nodes} nodes")
+    print(f"⏱️  Time:             {time.monotonic() - started:.1f}s")
+    print(f"💾 Saved to:         {output}")
+    print("=" * 60)
+
+    return graph
+
+def get_way_reader(filepath):
+    """Streaming road reader for the file type, or None"""
+    path = filepath.lower()
+
+    if path.endswith(".pbf"):
+        return iter_road_ways_pbf
+    if path.endswith(".osm") or path.endswith(".osm.xml"):
+        return iter_road_ways_xml
+
+    return None
+
+def get_road_speed(tags):
+    """Travel speed in km/h for a way, or None if tuktuks cannot use it"""
+    if tags.get("access") in ("no", "private") or tags.get("motor_vehicle") in ("no", "private"):
+        return None
+
+    highway = tags.get("highway") or ""
+    return ROAD_SPEEDS_KMH.get(highway[:-5] if highway.endswith("_link") else highway)
+
+def get_directions(tags):
+    """(forward, backward): whether the way can be driven in and against node order"""
+    oneway = tags.get("oneway")
+
+    if oneway == "-1":
+        return False, True
+    if oneway in ("yes", "true", "1") or tags.get("junction") in ("roundabout", "circular"):
+        return True, False
+
+    return True, True
+
+class RoadGraphBuilder:
+    """Collects road segments and compacts them into a RoadGraph"""
+
+    def __init__(self):
+        self.index = {}
+        self.lats = array("i")
+        self.lngs = array("i")
+        self.sources = array("i")
+        self.targets = array("i")
+        self.lengths = array("f")
+        self.durations = array("f")
+        self.dropped_nodes = 0
+
+    def node(self, node_id, lat, lng):
+        """Compact index for an OSM node"""
+        index = self.index.get(node_id)
+
+        if index is None:
+            index = self.index[node_id] = len(self.lats)
+            self.lats.append(int(round(lat * COORDINATE_SCALE)))
+            self.lngs.append(int(round(lng * COORDINATE_SCALE)))
+
+        return index
+
+    def add_way(self, tags, points):
+        """
+        Add a way's segments
+        points are (node_id, lat, lng), or None for nodes outside the area
+        """
+        speed = get_road_speed(tags)
+
+        if not speed:
+            return
+
+        forward, backward = get_directions(tags)
+        speed_ms = speed / 3.6
+
+        for a, b in zip(points, points[1:]):
+            if a is None or b is None:
+                continue
+
+            u = self.node(*a)
+            v = self.node(*b)
+            length = distance_m(a[1], a[2], b[1], b[2])
+
+            if forward:
+                self.add_edge(u, v, length, length / speed_ms)
+            if backward:
+                self.add_edge(v, u, length, length / speed_ms)
+
+    def add_edge(self, u, v, length, duration):
+        self.sources.append(u)
+        self.targets.append(v)
+        self.lengths.append(length)
+        self.durations.append(duration)
+
+    def build(self):
+        """RoadGraph of the largest connected network (ignoring direction)"""
+        keep = self.largest_component()
+        self.dropped_nodes = len(self.lats) - sum(keep)
+
+        renumber = array("i", [-1]) * len(self.lats)
+        lats, lngs = array("i"), array("i")
+
+        for node, kept in enumerate(keep):
+            if kept:
+                renumber[node] = len(lats)
+                lats.append(self.lats[node])
+                lngs.append(self.lngs[node])
+
+        edges = [edge for edge, source in enumerate(self.sources) if keep[source]]
+
+        return RoadGraph.from_edges(
+            lats, lngs,
+            array("i", (renumber[self.sources[edge]] for edge in edges)),
+            array("i", (renumber[self.targets[edge]] for edge in edges)),
+            array("f", (self.lengths[edge] for edge in edges)),
+            array("f", (self.durations[edge] for edge in edges))
+        )
+
+    def largest_component(self):
+        """Per-node flags for the biggest weakly connected component (union-find)"""
+        parent = array("i", range(len(self.lats)))
+
+        def find(node):
+            while parent[node] != node:
+                parent[node] = parent[parent[node]]
+                node = parent[node]
+            return node
+
+        for u, v in zip(self.sources, self.targets):
+            root_u, root_v = find(u), find(v)
+            if root_u != root_v:
+                parent[root_u] = root_v
+
+        sizes = {}
+        roots = array("i", (find(node) for node in range(len(self.lats))))
+        for root in roots:
+            sizes[root] = sizes.get(root, 0) + 1
+
+        if not sizes:
+            return []
+
+        largest = max(sizes, key=sizes.get)
+        return [root == largest for root in roots]
+
+def iter_road_ways_xml(filepath, bbox=None):
+    """
+    Yield (tags, points) for every highway way in an OSM XML file
+    Node locations inside bbox are kept in compact arrays until the ways are read
+    """
+    nodes = NodeLocations()
+    tags = {}
+    refs = []
+    root = None
+
+    for event, element in ElementTree.iterparse(filepath, events=("start", "end")):
+        if event == "start":
+            if root is None:
+                root = element
+            elif element.tag in ("node", "way", "relation"):
+                tags = {}
+                refs = []
+            continue
+
+        if element.tag == "tag":
+            tags[element.get("k")] = element.get("v")
+            continue
+
+        if element.tag == "nd":
+            refs.append(int(element.get("ref")))
+            continue
+
+        if element.tag == "node":
+            lat = float(element.get("lat"))
+            lng = float(element.get("lon"))
+
+            if in_bbox(lat, lng, bbox):
+                nodes.add(int(element.get("id")), lat, lng)
+
+        elif element.tag == "way":
+            if "highway" in tags:
+                nodes.sort()
+                points = []
+                for ref in refs:
+                    location = nodes.get(ref)
+                    points.append((ref,) + location if location else None)
+                yield tags, points
+
+        elif element.tag != "relation":
+            continue
+
+        root.clear()
+
+def iter_road_ways_pbf(filepath, bbox=None):
+    """Yield (tags, points) for every highway way in an OSM PBF file"""
+    try:
+        import osmium
+    except ImportError:
+        raise ImportError("Reading .pbf extracts needs pyosmium 3.7+ (pip install osmium)")
+
+    processor = (
+        osmium.FileProcessor(filepath, osmium.osm.NODE | osmium.osm.WAY)
+        .with_locations()
+        .with_filter(osmium.filter.KeyFilter("highway"))
+    )
+
+    for obj in processor:
+        if not obj.is_way():
+            continue
+
+        points = []
+        for node in obj.nodes:
+            location = node.location
+            if location.valid() and in_bbox(location.lat, location.lon, bbox):
+                points.append((node.ref, location.lat, location.lon))
+            else:
+                points.append(None)
+
+        yield {tag.k: tag.v for tag in obj.tags}, points
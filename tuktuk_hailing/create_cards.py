@@ -45,11 +45,10 @@ def create_total_ride_requests_card():
     card_data = {
         "name": "Total Ride Requests",
         "label": "Total Ride Requests",
-        "document_type": "Ride Request",
-        "function": "Count",
-        "filters_json": "[]",
+        "type": "Custom",
+        "method": "tuktuk_hailing.api.kpi_rollups.get_total_ride_requests",
         "color": "Blue",
-        "show_percentage_stats": 1,
+        "show_percentage_stats": 0,
         "stats_time_interval": "Daily",
         "is_public": 1,
         "is_standard": 1,
@@ -63,11 +62,10 @@ def create_pending_requests_card():
     card_data = {
         "name": "Pending Requests",
         "label": "Pending Requests",
-        "document_type": "Ride Request",
-        "function": "Count",
-        "filters_json": "[[\"Ride Request\", \"status\", \"=\", \"Pending\", false]]",
+        "type": "Custom",
+        "method": "tuktuk_hailing.api.kpi_rollups.get_pending_requests",
         "color": "Orange",
-        "show_percentage_stats": 1,
+        "show_percentage_stats": 0,
         "stats_time_interval": "Daily",
         "is_public": 1,
         "is_standard": 1,
@@ -81,11 +79,10 @@ def create_active_rides_card():
     card_data = {
         "name": "Active Rides",
         "label": "Active Rides",
-        "document_type": "Ride Request",
-        "function": "Count",
-        "filters_json": "[[\"Ride Request\", \"status\", \"in\", [\"Accepted\", \"En Route\"], false]]",
+        "type": "Custom",
+        "method": "tuktuk_hailing.api.kpi_rollups.get_active_rides",
         "color": "Green",
-        "show_percentage_stats": 1,
+        "show_percentage_stats": 0,
         "stats_time_interval": "Daily",
         "is_public": 1,
         "is_standard": 1,
@@ -99,11 +96,10 @@ def create_completed_trips_card():
     card_data = {
         "name": "Completed Trips",
         "label": "Completed Trips",
-        "document_type": "Ride Trip",
-        "function": "Count",
-        "filters_json": "[]",
+        "type": "Custom",
+        "method": "tuktuk_hailing.api.kpi_rollups.get_completed_trips",
         "color": "Purple",
-        "show_percentage_stats": 1,
+        "show_percentage_stats": 0,
         "stats_time_interval": "Daily",
         "is_public": 1,
         "is_standard": 1,
@@ -25,8 +25,21 @@ scheduler_events = {
     "cron": {
         "*/5 * * * *": [
             "tuktuk_hailing.api.location.cleanup_stale_locations"
+        ],
+        "*/2 * * * *": [
+            "tuktuk_hailing.api.surge.update_surge_multipliers"
         ]
-    }
+    },
+    "hourly": [
+        "tuktuk_hailing.api.geocoding.sync_geocode_cache",
+        "tuktuk_hailing.api.demand_heatmap.update_demand_heatmap"
+    ],
+    "daily": [
+        "tuktuk_hailing.api.place_popularity.update_place_popularity",
+        "tuktuk_hailing.api.driver_stats.reconcile_driver_stats",
+        "tuktuk_hailing.api.kpi_rollups.rebuild_kpi_rollups",
+        "tuktuk_hailing.api.dispatch_trace.prune_dispatch_events"
+    ]
 }
 
 fixtures = [
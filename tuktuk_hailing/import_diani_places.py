@@ -5,50 +5,81 @@ Import places from Diani_Galu.csv into ERPNext
 Usage:
 1. Upload CSV to server
 2. Run: bench execute tuktuk_hailing.import_diani_places.import_from_csv --kwargs "{'filepath': '/path/to/Diani_Galu.csv'}"
+3. Keep existing places instead of updating them:
+   bench execute tuktuk_hailing.import_diani_places.import_from_csv --kwargs "{'filepath': '/path/to/Diani_Galu.csv', 'on_duplicate': 'skip'}"
 """
 
 import frappe
+from frappe.utils import now
+from tuktuk_hailing.api.place_index import invalidate_place_index, get_search_keys
 import csv
 import os
+import time
 
-def import_from_csv(filepath, dry_run=False):
+# Rows per multi-row INSERT statement (and per commit)
+DEFAULT_BATCH_SIZE = 1000
+
+# How rows whose place already exists (in the database or earlier in the file) are handled
+DUPLICATE_POLICIES = ("update", "skip")
+
+# Values in the Category column that are locations, not categories
+IGNORED_CATEGORIES = ('Kenya', 'Diani')
+
+PLACE_COLUMNS = [
+    "name", "owner", "modified_by", "creation", "modified", "docstatus", "idx",
+    "place_name", "category", "latitude", "longitude", "aliases", "description", "is_active",
+    "name_key", "search_key"
+]
+
+# Empty aliases/description in the import keep the stored values
+# (flush fills in stored aliases first, so search_key covers them)
+PLACE_UPSERT_CLAUSE = """
+    category = VALUES(category),
+    latitude = VALUES(latitude),
+    longitude = VALUES(longitude),
+    aliases = COALESCE(VALUES(aliases), aliases),
+    description = COALESCE(VALUES(description), description),
+    name_key = VALUES(name_key),
+    search_key = VALUES(search_key),
+    modified = VALUES(modified),
+    modified_by = VALUES(modified_by)
+"""
+
+def import_from_csv(filepath, dry_run=False, on_duplicate="update", batch_size=DEFAULT_BATCH_SIZE):
     """
     Import places from Diani_Galu.csv
     
     CSV Format:
     Name,Category,Address,Latitude,Longitude
     
+    The file is read once and written in batches of multi-row upserts,
+    so large catalogs import in seconds. Runs without prompting.
+    
     Args:
         filepath: Path to CSV file
         dry_run: If True, preview changes without saving to database
+        on_duplicate: "update" - rows overwrite existing places and earlier rows with the same name
+                      "skip" - existing places and the first row for each name are kept
+        batch_size: Rows per INSERT statement
     """
     
     if not os.path.exists(filepath):
         print(f"❌ File not found: {filepath}")
         return
     
+    if on_duplicate not in DUPLICATE_POLICIES:
+        print(f"❌ Unknown duplicate policy: {on_duplicate} (use one of {', '.join(DUPLICATE_POLICIES)})")
+        return
+    
     if dry_run:
         print("🔍 DRY RUN MODE - No changes will be saved to database")
         print("=" * 60)
     
-    # Check for duplicates in CSV first
-    if not check_duplicates(filepath):
-        response = input("\n⚠️  Duplicates found. Continue anyway? (y/n): ")
-        if response.lower() != 'y':
-            print("Import cancelled.")
-            return
-    
-    # First, create all unique categories
-    create_categories(filepath, dry_run)
-    
-    created_count = 0
-    updated_count = 0
-    skipped_count = 0
-    error_count = 0
-    
     print(f"\n📥 Starting import from: {filepath}")
     print("=" * 60)
     
+    upserter = PlaceUpserter(on_duplicate=on_duplicate, batch_size=batch_size, dry_run=dry_run)
+    
     with open(filepath, 'r', encoding='utf-8') as csvfile:
         reader = csv.DictReader(csvfile)
         
@@ -63,7 +94,7 @@ def import_from_csv(filepath, dry_run=False):
                 # Skip if no coordinates
                 if not latitude or not longitude:
                     print(f"⚠️  Skipping {name}: Missing coordinates")
-                    skipped_count += 1
+                    upserter.skip()
                     continue
                 
                 # Convert coordinates
@@ -72,131 +103,235 @@ def import_from_csv(filepath, dry_run=False):
                     lng = float(longitude)
                 except ValueError:
                     print(f"⚠️  Skipping {name}: Invalid coordinates")
-                    skipped_count += 1
+                    upserter.skip()
                     continue
                 
                 # Clean up the name (remove quotes and extra spaces)
                 name = name.replace('"', '').strip()
                 
-                # Generate aliases from name variations
-                aliases = generate_aliases(name, category)
-                
-                # Check if place already exists
-                existing = frappe.db.exists("Hailing Place", name)
+                if category in IGNORED_CATEGORIES:
+                    category = None
                 
-                if existing:
-                    # Update existing place
-                    if dry_run:
-                        print(f"🔄 Would update: {name} ({category}) - {lat}, {lng}")
-                        updated_count += 1
-                    else:
-                        place = frappe.get_doc("Hailing Place", name)
-                        place.category = category
-                        place.latitude = lat
-                        place.longitude = lng
-                        if address:
-                            place.description = address
-                        if aliases:
-                            place.aliases = aliases
-                        place.save(ignore_permissions=True)
-                        updated_count += 1
-                        
-                        if updated_count % 50 == 0:
-                            print(f"🔄 Updated {updated_count} places...")
-                else:
-                    # Create new place
-                    if dry_run:
-                        print(f"✅ Would create: {name} ({category}) - {lat}, {lng}")
-                        created_count += 1
-                    else:
-                        place = frappe.get_doc({
-                            "doctype": "Hailing Place",
-                            "place_name": name,
-                            "category": category,
-                            "latitude": lat,
-                            "longitude": lng,
-                            "aliases": aliases,
-                            "description": address if address else None,
-                            "is_active": 1
-                        })
-                        
-                        place.insert(ignore_permissions=True)
-                        created_count += 1
-                        
-                        if created_count % 50 == 0:
-                            print(f"✅ Created {created_count} places...")
-                
-                # Commit every 100 records
-                if not dry_run and (created_count + updated_count) % 100 == 0:
-                    frappe.db.commit()
+                upserter.add({
+                    "place_name": name,
+                    "category": category,
+                    "latitude": lat,
+                    "longitude": lng,
+                    # Generate aliases from name variations
+                    "aliases": generate_aliases(name, category),
+                    "description": address if address else None
+                })
                     
             except Exception as e:
-                error_count += 1
+                upserter.stats["errors"] += 1
                 print(f"❌ Error importing row {index} ({row.get('Name', 'unknown')}): {str(e)}")
                 continue
     
-    # Final commit
-    if not dry_run:
-        frappe.db.commit()
+    upserter.finish()
+    upserter.print_summary()
     
-    # Print summary
-    print("\n" + "=" * 60)
-    print("📊 IMPORT SUMMARY")
-    print("=" * 60)
-    print(f"✅ Created:  {created_count}")
-    print(f"🔄 Updated:  {updated_count}")
-    print(f"⚠️  Skipped:  {skipped_count}")
-    print(f"❌ Errors:   {error_count}")
-    print(f"📍 Total:    {created_count + updated_count}")
-    print("=" * 60)
-    
-    if dry_run:
-        print("⚠️  DRY RUN - No changes were saved to database")
-        print("Run without dry_run=True to actually import the data\n")
-    else:
-        print("✨ Import complete!\n")
+    return upserter.stats
 
-def create_categories(filepath, dry_run=False):
+class PlaceUpserter:
     """
-    Extract unique categories from CSV and create Category records
+    Buffer Hailing Place rows and write them with multi-row
+    INSERT ... ON DUPLICATE KEY UPDATE statements
     
-    Args:
-        filepath: Path to CSV file
-        dry_run: If True, preview without saving
+    Rows bypass document events, so the place index is invalidated once
+    in finish(). Missing categories are created in a single statement
+    before the batch that first uses them.
     """
     
-    categories = set()
-    
-    with open(filepath, 'r', encoding='utf-8') as csvfile:
-        reader = csv.DictReader(csvfile)
-        for row in reader:
-            category = row['Category'].strip()
-            if category and category not in ['Kenya', 'Diani']:  # Skip non-category values
-                categories.add(category)
+    def __init__(self, on_duplicate="update", batch_size=DEFAULT_BATCH_SIZE, dry_run=False):
+        self.on_duplicate = on_duplicate
+        self.batch_size = max(int(batch_size), 1)
+        self.dry_run = dry_run
+        
+        # Keyed by lowercased name: place names are case-insensitive in MariaDB
+        self.batch = {}
+        self.seen = set()
+        self.known_categories = set(frappe.get_all("Hailing Place Category", pluck="name"))
+        
+        self.stats = frappe._dict(
+            rows=0, created=0, updated=0, unchanged=0, duplicates=0,
+            skipped=0, errors=0, categories=0, seconds=0
+        )
+        self.started = time.perf_counter()
+    
+    def add(self, place):
+        """Queue a place dict (place_name, category, latitude, longitude, aliases, description)"""
+        self.stats.rows += 1
+        key = place["place_name"].lower()
+        
+        if key in self.seen:
+            self.stats.duplicates += 1
+            if self.on_duplicate == "skip":
+                return
+        
+        self.seen.add(key)
+        self.batch[key] = place
+        
+        if len(self.batch) >= self.batch_size:
+            self.flush()
     
-    created_categories = 0
+    def skip(self):
+        """Count a source row that could not be imported"""
+        self.stats.rows += 1
+        self.stats.skipped += 1
     
-    for category in sorted(categories):
-        if not frappe.db.exists("Hailing Place Category", category):
-            if dry_run:
+    def flush(self):
+        """Write the buffered rows"""
+        if not self.batch:
+            return
+        
+        places = list(self.batch.values())
+        self.batch = {}
+        
+        existing = self.get_existing_aliases(places)
+        
+        if self.on_duplicate == "skip":
+            self.stats.unchanged += len(existing)
+            places = [place for place in places if place["place_name"].lower() not in existing]
+        
+        if self.dry_run:
+            new_categories = self.create_categories(places)
+            for place in places:
+                action = "🔄 Would update" if place["place_name"].lower() in existing else "✅ Would create"
+                print(f"{action}: {place['place_name']} ({place['category']}) - {place['latitude']}, {place['longitude']}")
+        else:
+            try:
+                new_categories = self.create_categories(places)
+                self.write_places(places)
+                frappe.db.commit()
+            except Exception as e:
+                frappe.db.rollback()
+                self.stats.errors += len(places)
+                print(f"❌ Error writing batch of {len(places)} places: {str(e)}")
+                return
+        
+        self.known_categories.update(new_categories)
+        self.stats.categories += len(new_categories)
+        
+        updated = sum(1 for place in places if place["place_name"].lower() in existing)
+        self.stats.updated += updated
+        self.stats.created += len(places) - updated
+        
+        if not self.dry_run:
+            print(f"💾 Saved {self.stats.created + self.stats.updated} places...")
+    
+    def get_existing_aliases(self, places):
+        """
+        Stored aliases of places in the batch that already exist, keyed by
+        lowercased name; rows without aliases keep the stored ones
+        """
+        rows = frappe.get_all(
+            "Hailing Place",
+            filters={"name": ("in", [place["place_name"] for place in places])},
+            fields=["name", "aliases"]
+        )
+        existing = {row.name.lower(): row.aliases for row in rows}
+        
+        for place in places:
+            if not place["aliases"]:
+                place["aliases"] = existing.get(place["place_name"].lower())
+        
+        return existing
+    
+    def create_categories(self, places):
+        """Insert categories not seen before in one statement and return them"""
+        new_categories = sorted({
+            place["category"] for place in places
+            if place["category"] and place["category"] not in self.known_categories
+        })
+        
+        if not new_categories:
+            return []
+        
+        if self.dry_run:
+            for category in new_categories:
                 print(f"📁 Would create category: {category}")
-                created_categories += 1
-            else:
-                try:
-                    cat_doc = frappe.get_doc({
-                        "doctype": "Hailing Place Category",
-                        "category_name": category,
-                        "icon": get_category_icon(category)
-                    })
-                    cat_doc.insert(ignore_permissions=True)
-                    created_categories += 1
-                except Exception as e:
-                    print(f"Warning: Could not create category '{category}': {str(e)}")
-    
-    if created_categories > 0:
-        if not dry_run:
-            frappe.db.commit()
-        print(f"📁 {'Would create' if dry_run else 'Created'} {created_categories} categories")
+            return new_categories
+        
+        timestamp = now()
+        user = frappe.session.user
+        
+        frappe.db.bulk_insert(
+            "Hailing Place Category",
+            ["name", "owner", "modified_by", "creation", "modified", "docstatus", "idx", "category_name", "icon"],
+            [
+                (category, user, user, timestamp, timestamp, 0, 0, category, get_category_icon(category))
+                for category in new_categories
+            ],
+            ignore_duplicates=True
+        )
+        
+        return new_categories
+    
+    def write_places(self, places):
+        """Upsert places in one multi-row statement"""
+        if not places:
+            return
+        
+        timestamp = now()
+        user = frappe.session.user
+        values = []
+        
+        for place in places:
+            name_key, search_key = get_search_keys(place["place_name"], place["aliases"], place["category"])
+            values.extend([
+                place["place_name"], user, user, timestamp, timestamp, 0, 0,
+                place["place_name"], place["category"], place["latitude"], place["longitude"],
+                place["aliases"], place["description"], 1, name_key, search_key
+            ])
+        
+        row_placeholder = "(" + ", ".join(["%s"] * len(PLACE_COLUMNS)) + ")"
+        columns = ", ".join(f"`{column}`" for column in PLACE_COLUMNS)
+        
+        if self.on_duplicate == "skip":
+            # Another import may have inserted the same place since get_existing_aliases
+            statement = f"INSERT IGNORE INTO `tabHailing Place` ({columns}) VALUES "
+            suffix = ""
+        else:
+            statement = f"INSERT INTO `tabHailing Place` ({columns}) VALUES "
+            suffix = " ON DUPLICATE KEY UPDATE " + PLACE_UPSERT_CLAUSE
+        
+        frappe.db.sql(statement + ", ".join([row_placeholder] * len(places)) + suffix, values)
+    
+    def finish(self):
+        """Flush remaining rows and rebuild search indexes"""
+        self.flush()
+        self.stats.seconds = round(time.perf_counter() - self.started, 2)
+        
+        if not self.dry_run and (self.stats.created or self.stats.updated):
+            invalidate_place_index()
+        
+        return self.stats
+    
+    def print_summary(self):
+        stats = self.stats
+        rate = stats.rows / max(stats.seconds, 0.01)
+        
+        if stats.categories:
+            print(f"📁 {'Would create' if self.dry_run else 'Created'} {stats.categories} categories")
+        
+        print("\n" + "=" * 60)
+        print("📊 IMPORT SUMMARY")
+        print("=" * 60)
+        print(f"✅ Created:    {stats.created}")
+        print(f"🔄 Updated:    {stats.updated}")
+        print(f"⏭️  Unchanged:  {stats.unchanged}")
+        print(f"👥 Duplicates: {stats.duplicates} ({self.on_duplicate})")
+        print(f"⚠️  Skipped:    {stats.skipped}")
+        print(f"❌ Errors:     {stats.errors}")
+        print(f"📍 Total:      {stats.created + stats.updated}")
+        print(f"⏱️  Time:       {stats.seconds}s ({rate:,.0f} rows/s)")
+        print("=" * 60)
+        
+        if self.dry_run:
+            print("⚠️  DRY RUN - No changes were saved to database")
+            print("Run without dry_run=True to actually import the data\n")
+        else:
+            print("✨ Import complete!\n")
 
 def check_duplicates(filepath):
     """
@@ -0,0 +1,500 @@
+#!/usr/bin/env python3
+"""
+Import places from GeoJSON and OpenStreetMap extracts
+
+Supported files:
+- GeoJSON FeatureCollection (.geojson, .json) or GeoJSON sequence (.geojsonl, .geojsons, .ndjson)
+- OSM XML (.osm, .osm.xml)
+- OSM PBF (.pbf, .osm.pbf) - needs pyosmium 3.7+ (pip install osmium)
+
+Files are streamed, never loaded whole, and rows go through the same batched
+upsert as import_diani_places, so a county extract imports on a small VM.
+
+Usage:
+1. Download an extract (e.g. kenya-latest.osm.pbf clipped with osmium extract)
+2. Run: bench execute tuktuk_hailing.import_osm_places.import_from_file --kwargs "{'filepath': '/path/to/kwale.osm.pbf'}"
+"""
+
+import frappe
+from tuktuk_hailing.import_diani_places import PlaceUpserter, generate_aliases, DEFAULT_BATCH_SIZE, DUPLICATE_POLICIES
+from tuktuk_hailing.tuktuk_hailing.doctype.hailing_settings.hailing_settings import point_in_polygon
+from array import array
+from bisect import bisect_left
+from xml.etree import ElementTree
+import json
+import os
+import re
+
+# Tag keys checked in order; the first mapped one decides the category
+OSM_CATEGORY_KEYS = ("amenity", "tourism", "shop", "leisure", "natural", "aeroway", "railway")
+
+# OSM tag -> Hailing Place Category, using the names already in our catalog
+OSM_CATEGORY_TAGS = {
+    ("amenity", "restaurant"): "Restaurant",
+    ("amenity", "fast_food"): "Fast Food",
+    ("amenity", "cafe"): "Coffee shop",
+    ("amenity", "bar"): "Bar",
+    ("amenity", "pub"): "Bar",
+    ("amenity", "nightclub"): "Night club",
+    ("amenity", "fuel"): "Gas station",
+    ("amenity", "pharmacy"): "Pharmacy",
+    ("amenity", "hospital"): "Hospital",
+    ("amenity", "clinic"): "Clinic",
+    ("amenity", "bank"): "Bank",
+    ("amenity", "atm"): "ATM",
+    ("amenity", "place_of_worship"): "Place of worship",
+    ("amenity", "school"): "School",
+    ("amenity", "police"): "Police station",
+    ("amenity", "marketplace"): "Market",
+    ("amenity", "bus_station"): "Bus station",
+    ("tourism", "hotel"): "Hotel",
+    ("tourism", "motel"): "Hotel",
+    ("tourism", "guest_house"): "Guest house",
+    ("tourism", "hostel"): "Hostel",
+    ("tourism", "apartment"): "Holiday apartment rental",
+    ("tourism", "chalet"): "Cottage",
+    ("tourism", "attraction"): "Tourist attraction",
+    ("tourism", "viewpoint"): "Tourist attraction",
+    ("tourism", "museum"): "Tourist attraction",
+    ("shop", "supermarket"): "Supermarket",
+    ("shop", "convenience"): "General store",
+    ("shop", "general"): "General store",
+    ("shop", "mall"): "Shopping mall",
+    ("shop", "greengrocer"): "Greengrocer",
+    ("leisure", "resort"): "Resort hotel",
+    ("natural", "beach"): "Beach",
+    ("aeroway", "aerodrome"): "Airport",
+    ("railway", "station"): "Train station"
+}
+
+# Alternative names stored as aliases
+OSM_ALIAS_TAGS = ("alt_name", "old_name", "short_name", "official_name")
+
+OSM_ADDRESS_TAGS = ("addr:housename", "addr:street", "addr:place", "addr:city")
+
+GEOJSON_SEQUENCE_SUFFIXES = (".geojsonl", ".geojsons", ".ndjson", ".jsonl")
+GEOJSON_CHUNK_SIZE = 1024 * 1024
+
+# Largest single feature the streaming reader buffers before giving up
+MAX_GEOJSON_FEATURE_SIZE = 64 * 1024 * 1024
+FEATURES_ARRAY = re.compile(r'"features"\s*:\s*\[')
+
+# OSM stores coordinates with 7 decimals, so scaled ints are exact
+OSM_COORDINATE_SCALE = 10 ** 7
+
+def import_from_file(filepath, dry_run=False, on_duplicate="update", clip_to_service_area=True,
+                     include_unmapped=False, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Import named POIs from a GeoJSON or OSM file
+
+    Args:
+        filepath: Path to .geojson, .geojsonl, .osm or .pbf file
+        dry_run: If True, preview changes without saving to database
+        on_duplicate: "update" or "skip" (see import_diani_places.import_from_csv)
+        clip_to_service_area: Only import places inside the Hailing Settings service area
+        include_unmapped: Also import POIs whose tag has no category mapping
+        batch_size: Rows per INSERT statement
+    """
+
+    if not os.path.exists(filepath):
+        print(f"❌ File not found: {filepath}")
+        return
+
+    if on_duplicate not in DUPLICATE_POLICIES:
+        print(f"❌ Unknown duplicate policy: {on_duplicate} (use one of {', '.join(DUPLICATE_POLICIES)})")
+        return
+
+    reader = get_reader(filepath)
+
+    if not reader:
+        print(f"❌ Unsupported file type: {filepath}")
+        return
+
+    area = get_service_area() if clip_to_service_area else None
+
+    if clip_to_service_area and not area:
+        print("⚠️  No service area configured - importing without clipping")
+
+    if dry_run:
+        print("🔍 DRY RUN MODE - No changes will be saved to database")
+        print("=" * 60)
+
+    print(f"\n📥 Starting import from: {filepath}")
+    print("=" * 60)
+
+    bbox = area_bbox(area)
+    upserter = PlaceUpserter(on_duplicate=on_duplicate, batch_size=batch_size, dry_run=dry_run)
+    ignored_count = 0
+    outside_count = 0
+
+    try:
+        for tags, lat, lng in reader(filepath, bbox):
+            place = place_from_tags(tags, lat, lng, include_unmapped)
+
+            if not place:
+                ignored_count += 1
+                continue
+
+            if area and not in_service_area(lat, lng, area, bbox):
+                outside_count += 1
+                continue
+
+            upserter.add(place)
+    except ImportError as e:
+        print(f"❌ {str(e)}")
+        return
+
+    upserter.finish()
+
+    print(f"\n🗺️  Outside service area: {outside_count}")
+    print(f"🚫 Not a mapped POI:     {ignored_count}")
+    upserter.print_summary()
+
+    upserter.stats.outside = outside_count
+    upserter.stats.ignored = ignored_count
+
+    return upserter.stats
+
+def get_reader(filepath):
+    """Streaming reader for the file type, or None"""
+    path = filepath.lower()
+
+    if path.endswith(".pbf"):
+        return iter_osm_pbf
+    if path.endswith(".osm") or path.endswith(".osm.xml"):
+        return iter_osm_xml
+    if path.endswith(GEOJSON_SEQUENCE_SUFFIXES):
+        return iter_geojson_sequence
+    if path.endswith(".geojson") or path.endswith(".json"):
+        return iter_geojson
+
+    return None
+
+def get_service_area():
+    """Service area polygon as [[lng, lat], ...], or None"""
+    coordinates = frappe.db.get_single_value("Hailing Settings", "service_area_coordinates")
+
+    if not coordinates:
+        return None
+
+    try:
+        return json.loads(coordinates)[0]
+    except (ValueError, IndexError, TypeError):
+        return None
+
+def area_bbox(area):
+    """(min_lat, max_lat, min_lng, max_lng) of the polygon, or None"""
+    if not area:
+        return None
+
+    lngs = [point[0] for point in area]
+    lats = [point[1] for point in area]
+    return min(lats), max(lats), min(lngs), max(lngs)
+
+def in_bbox(lat, lng, bbox):
+    return bbox is None or (bbox[0] <= lat <= bbox[1] and bbox[2] <= lng <= bbox[3])
+
+def in_service_area(lat, lng, area, bbox):
+    """Point-in-polygon test with a bounding-box shortcut"""
+    return in_bbox(lat, lng, bbox) and point_in_polygon(lat, lng, area)
+
+def get_osm_category(tags, include_unmapped=False):
+    """Hailing Place Category for OSM tags, or None if the object is not a POI we want"""
+    for key in OSM_CATEGORY_KEYS:
+        value = tags.get(key)
+        if not value:
+            continue
+
+        category = OSM_CATEGORY_TAGS.get((key, value))
+        if category:
+            return category
+
+        if include_unmapped:
+            return value.replace("_", " ").capitalize()
+
+    return None
+
+def place_from_tags(tags, lat, lng, include_unmapped=False):
+    """Place row for PlaceUpserter, or None for unnamed or unmapped objects"""
+    name = (tags.get("name:en") or tags.get("name") or "").replace('"', '').strip()
+
+    if not name or lat is None or lng is None:
+        return None
+
+    category = get_osm_category(tags, include_unmapped)
+
+    if not category:
+        return None
+
+    aliases = [generate_aliases(name, category)]
+    aliases.extend(tags[key] for key in OSM_ALIAS_TAGS if tags.get(key))
+    if tags.get("name:en") and tags.get("name") and tags["name"] != name:
+        aliases.append(tags["name"])
+
+    address = ", ".join(tags[key] for key in OSM_ADDRESS_TAGS if tags.get(key))
+
+    return {
+        "place_name": name,
+        "category": category,
+        "latitude": round(lat, 7),
+        "longitude": round(lng, 7),
+        "aliases": ", ".join(alias for alias in aliases if alias) or None,
+        "description": address or None
+    }
+
+def center_of(points):
+    """Average of (lat, lng) points, or (None, None)"""
+    if not points:
+        return None, None
+
+    return (
+        sum(point[0] for point in points) / len(points),
+        sum(point[1] for point in points) / len(points)
+    )
+
+def geometry_center(geometry):
+    """Representative (lat, lng) of a GeoJSON geometry"""
+    if not geometry or not geometry.get("coordinates"):
+        return None, None
+
+    if geometry.get("type") == "Point":
+        lng, lat = geometry["coordinates"][:2]
+        return lat, lng
+
+    # Lines and polygons: average of all positions
+    points = []
+    stack = [geometry["coordinates"]]
+
+    while stack:
+        item = stack.pop()
+        if item and isinstance(item[0], (int, float)):
+            points.append((item[1], item[0]))
+        else:
+            stack.extend(item)
+
+    return center_of(points)
+
+def feature_record(feature):
+    """(tags, lat, lng) for a GeoJSON feature, or None"""
+    if not isinstance(feature, dict) or feature.get("type") != "Feature":
+        return None
+
+    properties = feature.get("properties") or {}
+
+    # osmtogeojson and Overpass exports nest OSM tags
+    tags = dict(properties.get("tags") or {}, **{
+        key: value for key, value in properties.items() if isinstance(value, str)
+    })
+
+    if not tags.get("name") and not tags.get("name:en"):
+        return None
+
+    lat, lng = geometry_center(feature.get("geometry"))
+
+    return tags, lat, lng
+
+def iter_geojson(filepath, bbox=None):
+    """
+    Yield (tags, lat, lng) from a FeatureCollection one feature at a time
+    Only the current feature and a read buffer are held in memory
+
+    Raises ValueError with the byte offset of a feature that cannot be parsed
+    or is larger than MAX_GEOJSON_FEATURE_SIZE
+    """
+    decoder = json.JSONDecoder()
+
+    with open(filepath, "r", encoding="utf-8") as handle:
+        buffer = ""
+        # Bytes of the file before buffer[0], for error messages
+        offset = 0
+
+        # Find the start of the features array
+        while True:
+            chunk = handle.read(GEOJSON_CHUNK_SIZE)
+            if not chunk:
+                return
+
+            buffer += chunk
+            match = FEATURES_ARRAY.search(buffer)
+
+            if match:
+                offset += len(buffer[:match.end()].encode("utf-8"))
+                buffer = buffer[match.end():]
+                break
+
+            # Keep a tail in case the key is split across chunks
+            offset += len(buffer[:-32].encode("utf-8"))
+            buffer = buffer[-32:]
+
+        position = 0
+
+        while True:
+            while position < len(buffer) and buffer[position] in " \t\r\n,":
+                position += 1
+
+            if position < len(buffer) and buffer[position] == "]":
+                return
+
+            try:
+                if position >= len(buffer):
+                    raise ValueError("Need more data")
+                feature, position = decoder.raw_decode(buffer, position)
+            except ValueError as e:
+                offset += len(buffer[:position].encode("utf-8"))
+                buffer = buffer[position:]
+                position = 0
+
+                if len(buffer) > MAX_GEOJSON_FEATURE_SIZE:
+                    raise ValueError(f"GeoJSON feature at byte {offset} is larger than {MAX_GEOJSON_FEATURE_SIZE} characters or malformed: {e}")
+
+                # Read at least as much as is pending, so a large feature is
+                # re-parsed a logarithmic number of times, not once per chunk
+                chunk = handle.read(max(GEOJSON_CHUNK_SIZE, len(buffer)))
+                if not chunk:
+                    if buffer.strip():
+                        raise ValueError(f"Malformed or truncated GeoJSON feature at byte {offset}: {e}")
+                    return
+                buffer += chunk
+                continue
+
+            record = feature_record(feature)
+            if record:
+                yield record
+
+            # Drop consumed text so the buffer stays around one chunk
+            if position > GEOJSON_CHUNK_SIZE:
+                offset += len(buffer[:position].encode("utf-8"))
+                buffer = buffer[position:]
+                position = 0
+
+def iter_geojson_sequence(filepath, bbox=None):
+    """Yield (tags, lat, lng) from newline-delimited GeoJSON features"""
+    with open(filepath, "r", encoding="utf-8") as handle:
+        for line in handle:
+            # RFC 8142 record separators
+            line = line.strip().lstrip("\x1e")
+            if not line:
+                continue
+
+            record = feature_record(json.loads(line))
+            if record:
+                yield record
+
+class NodeLocations:
+    """
+    Compact node id -> location store for resolving way centers
+    Parallel arrays use ~16 bytes per node instead of a dict entry
+    """
+
+    def __init__(self):
+        self.ids = array("q")
+        self.lats = array("i")
+        self.lngs = array("i")
+        self.ordered = True
+
+    def add(self, node_id, lat, lng):
+        if self.ids and node_id < self.ids[-1]:
+            self.ordered = False
+
+        self.ids.append(node_id)
+        self.lats.append(int(round(lat * OSM_COORDINATE_SCALE)))
+        self.lngs.append(int(round(lng * OSM_COORDINATE_SCALE)))
+
+    def sort(self):
+        """Sort by id (extracts are normally sorted already)"""
+        if self.ordered:
+            return
+
+        order = sorted(range(len(self.ids)), key=self.ids.__getitem__)
+        self.ids = array("q", (self.ids[i] for i in order))
+        self.lats = array("i", (self.lats[i] for i in order))
+        self.lngs = array("i", (self.lngs[i] for i in order))
+        self.ordered = True
+
+    def get(self, node_id):
+        """(lat, lng) of a stored node, or None"""
+        index = bisect_left(self.ids, node_id)
+
+        if index < len(self.ids) and self.ids[index] == node_id:
+            return self.lats[index] / OSM_COORDINATE_SCALE, self.lngs[index] / OSM_COORDINATE_SCALE
+
+        return None
+
+def iter_osm_xml(filepath, bbox=None):
+    """
+    Yield (tags, lat, lng) for named nodes and ways in an OSM XML file
+    Elements are cleared as soon as they are read; only node locations inside
+    bbox are kept so ways can be placed at the center of their nodes
+    """
+    nodes = NodeLocations()
+    tags = {}
+    refs = []
+    root = None
+
+    for event, element in ElementTree.iterparse(filepath, events=("start", "end")):
+        if event == "start":
+            if root is None:
+                root = element
+            elif element.tag in ("node", "way", "relation"):
+                tags = {}
+                refs = []
+            continue
+
+        if element.tag == "tag":
+            tags[element.get("k")] = element.get("v")
+            continue
+
+        if element.tag == "nd":
+            refs.append(int(element.get("ref")))
+            continue
+
+        if element.tag == "node":
+            lat = float(element.get("lat"))
+            lng = float(element.get("lon"))
+
+            if in_bbox(lat, lng, bbox):
+                nodes.add(int(element.get("id")), lat, lng)
+
+            if "name" in tags or "name:en" in tags:
+                yield tags, lat, lng
+
+        elif element.tag == "way":
+            if "name" in tags or "name:en" in tags:
+                nodes.sort()
+                lat, lng = center_of([point for point in map(nodes.get, refs) if point])
+                if lat is not None:
+                    yield tags, lat, lng
+
+        elif element.tag != "relation":
+            continue
+
+        # Multipolygon relations are skipped; their members rarely carry the POI name
+        root.clear()
+
+def iter_osm_pbf(filepath, bbox=None):
+    """Yield (tags, lat, lng) for named nodes and ways in an OSM PBF file"""
+    try:
+        import osmium
+    except ImportError:
+        raise ImportError("Reading .pbf extracts needs pyosmium 3.7+ (pip install osmium)")
+
+    processor = (
+        osmium.FileProcessor(filepath, osmium.osm.NODE | osmium.osm.WAY)
+        .with_locations()
+        .with_filter(osmium.filter.KeyFilter("name", "name:en"))
+    )
+
+    for obj in processor:
+        tags = {tag.k: tag.v for tag in obj.tags}
+
+        if obj.is_node():
+            if obj.location.valid():
+                yield tags, obj.location.lat, obj.location.lon
+
+        elif obj.is_way():
+            lat, lng = center_of([
+                (node.location.lat, node.location.lon)
+                for node in obj.nodes if node.location.valid()
+            ])
+            if lat is not None and in_bbox(lat, lng, bbox):
+                yield tags, lat, lng
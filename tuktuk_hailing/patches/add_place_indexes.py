@@ -44,6 +44,18 @@ def execute():
             'sql': 'ALTER TABLE `tabHailing Place` ADD INDEX idx_coordinates (latitude, longitude)',
             'check': "SELECT COUNT(*) as cnt FROM information_schema.statistics WHERE table_schema = DATABASE() AND table_name = 'tabHailing Place' AND index_name = 'idx_coordinates'",
             'description': 'Composite index on coordinates for geographic queries'
+        },
+        {
+            'name': 'ft_place_name',
+            'sql': 'ALTER TABLE `tabHailing Place` ADD FULLTEXT INDEX ft_place_name (place_name)',
+            'check': "SELECT COUNT(*) as cnt FROM information_schema.statistics WHERE table_schema = DATABASE() AND table_name = 'tabHailing Place' AND index_name = 'ft_place_name'",
+            'description': 'FULLTEXT index on place_name for name relevance scoring'
+        },
+        {
+            'name': 'ft_place_search',
+            'sql': 'ALTER TABLE `tabHailing Place` ADD FULLTEXT INDEX ft_place_search (place_name, aliases, description)',
+            'check': "SELECT COUNT(*) as cnt FROM information_schema.statistics WHERE table_schema = DATABASE() AND table_name = 'tabHailing Place' AND index_name = 'ft_place_search'",
+            'description': 'FULLTEXT index on place_name, aliases and description for Full Text search mode'
         }
     ]
     
@@ -146,7 +158,10 @@ def drop_indexes():
     print("\n⚠️  WARNING: This will remove all custom indexes!")
     print("=" * 60)
     
-    indexes_to_drop = ['idx_place_name', 'idx_category', 'idx_is_active', 'idx_coordinates']
+    indexes_to_drop = [
+        'idx_place_name', 'idx_category', 'idx_is_active', 'idx_coordinates',
+        'ft_place_name', 'ft_place_search'
+    ]
     
     dropped_count = 0
     
@@ -41,6 +41,11 @@ function initHailingMap(frm) {
     frm.driver_markers = {};
     frm.my_marker = null;
     
+    // Hot zones: where customers usually request rides at this hour
+    frm.hot_zones = L.layerGroup().addTo(map);
+    loadHotZones(frm);
+    map.on('moveend', () => loadHotZones(frm));
+    
     // Start location tracking if available for hailing is ON
     if (frm.doc.hailing_status === 'Available') {
         startLocationTracking(frm);
@@ -231,6 +236,37 @@ async function loadNearbyDrivers(frm) {
     }
 }
 
+async function loadHotZones(frm) {
+    const bounds = frm.hailing_map.getBounds();
+    
+    try {
+        const result = await frappe.call({
+            method: 'tuktuk_hailing.api.demand_heatmap.get_demand_heatmap',
+            args: {
+                bounds: [bounds.getSouth(), bounds.getWest(), bounds.getNorth(), bounds.getEast()].join(',')
+            }
+        });
+        
+        frm.hot_zones.clearLayers();
+        
+        const heatmap = result.message;
+        if (!heatmap || !heatmap.max_intensity) return;
+        
+        heatmap.cells.forEach(cell => {
+            const strength = cell.intensity / heatmap.max_intensity;
+            
+            L.rectangle(cell.bounds, {
+                stroke: false,
+                fillColor: '#e74c3c',
+                fillOpacity: 0.1 + 0.4 * strength,
+                interactive: false
+            }).addTo(frm.hot_zones);
+        });
+    } catch (error) {
+        console.error('Error loading hot zones:', error);
+    }
+}
+
 async function loadPendingRequests(frm) {
     const requestsContainer = document.getElementById('pending-requests');
     if (!requestsContainer) return;
@@ -248,7 +284,7 @@ async function loadPendingRequests(frm) {
                 <div class="ride-request-card" data-request-id="${req.name}">
                     <div class="request-header">
                         <strong>${req.pickup_address.substring(0, 50)}</strong>
-                        <span class="badge badge-info">${req.distance_to_pickup_km} km away</span>
+                        <span class="badge badge-info">${req.distance_to_pickup_km} km · ${req.eta_to_pickup_minutes} min away</span>
                     </div>
                     <div class="request-body">
                         <p><strong>To:</strong> ${req.destination_address.substring(0, 50)}</p>
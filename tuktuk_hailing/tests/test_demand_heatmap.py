@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+Unit tests for the demand heatmap tiles
+
+Run with:
+    bench run-tests --app tuktuk_hailing --module test_demand_heatmap
+"""
+
+import frappe
+import unittest
+from tuktuk_hailing.api.demand_heatmap import (
+    HEATMAP_KEY,
+    HEATMAP_BUILD_LOCK_KEY,
+    ALL_DAYS,
+    encode_geohash,
+    decode_geohash,
+    bin_demand,
+    store_demand_tiles,
+    get_demand_heatmap
+)
+
+DIANI = (-4.2833, 39.5667)
+UKUNDA = (-4.2880, 39.5020)
+
+class TestDemandHeatmap(unittest.TestCase):
+    """Test suite for geohash binning and tile lookup"""
+
+    @classmethod
+    def tearDownClass(cls):
+        cache = frappe.cache()
+        cache.delete(cache.make_key(HEATMAP_KEY))
+        cache.delete(cache.make_key(HEATMAP_BUILD_LOCK_KEY))
+
+    def test_geohash(self):
+        """Encoding matches the reference and the cell contains the point"""
+        self.assertEqual(encode_geohash(42.605, -5.603, 5), "ezs42")
+
+        south, west, north, east = decode_geohash(encode_geohash(*DIANI))
+        self.assertTrue(south <= DIANI[0] <= north and west <= DIANI[1] <= east)
+
+    def test_bin_demand_averages(self):
+        """Counts become requests per hour, per weekday and over the whole week"""
+        rows = [
+            (-4.283, 39.567, 4, 20, 8),   # Fridays at 20:00, two grid points in one cell
+            (-4.284, 39.567, 4, 20, 8),
+            (-4.288, 39.502, 5, 20, 14)   # Saturdays at 20:00, elsewhere
+        ]
+        tiles = bin_demand(rows, weeks=8)
+        diani = encode_geohash(-4.283, 39.567)
+
+        self.assertEqual(tiles[(4, 20)], {diani: 2.0})
+        self.assertEqual(tiles[(ALL_DAYS, 20)][diani], round(16 / 56, 2))
+        self.assertNotIn((4, 21), tiles)
+
+    def test_endpoint_serves_stored_tile(self):
+        """The endpoint reads the stored tile and filters it to the bounds"""
+        diani, ukunda = encode_geohash(*DIANI), encode_geohash(*UKUNDA)
+        store_demand_tiles({(ALL_DAYS, 20): {diani: 1.5, ukunda: 0.5}})
+
+        everything = get_demand_heatmap(hour=20)
+        self.assertEqual([cell["geohash"] for cell in everything["cells"]], [diani, ukunda])
+        self.assertEqual(everything["max_intensity"], 1.5)
+
+        # Bounds around Diani only
+        nearby = get_demand_heatmap(bounds="-4.30,39.55,-4.27,39.58", hour=20)
+        self.assertEqual([cell["geohash"] for cell in nearby["cells"]], [diani])
+
+        # A built slot without demand is empty, not rebuilt
+        self.assertEqual(get_demand_heatmap(hour=3)["cells"], [])
+        self.assertFalse(get_demand_heatmap(hour=3)["building"])
+
+    def test_missing_tiles_queue_one_build(self):
+        """Without tiles the endpoint answers empty and takes the build lock"""
+        cache = frappe.cache()
+        cache.delete(cache.make_key(HEATMAP_KEY))
+        # Held lock: a build is already queued, so nothing is enqueued again
+        cache.set(cache.make_key(HEATMAP_BUILD_LOCK_KEY), 1, ex=60)
+
+        heatmap = get_demand_heatmap(hour=20)
+
+        self.assertTrue(heatmap["building"])
+        self.assertEqual(heatmap["cells"], [])
+        self.assertEqual(heatmap["max_intensity"], 0)
+
+
+def run_tests():
+    """
+    Run all tests and print results
+    Usage: bench execute tuktuk_hailing.tests.test_demand_heatmap.run_tests
+    """
+    suite = unittest.TestLoader().loadTestsFromTestCase(TestDemandHeatmap)
+    result = unittest.TextTestRunner(verbosity=2).run(suite)
+
+    return result.wasSuccessful()
+
+
+if __name__ == "__main__":
+    unittest.main()
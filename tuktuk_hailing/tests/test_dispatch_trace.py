@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+Unit tests for the dispatch funnel report
+
+Run with:
+    bench run-tests --app tuktuk_hailing --module test_dispatch_trace
+"""
+
+import frappe
+import unittest
+from tuktuk_hailing.api.demand_heatmap import encode_geohash
+from tuktuk_hailing.api.dispatch_trace import (
+    ZONE_PRECISION,
+    summarize_dispatch,
+    percentile
+)
+
+DIANI = (-4.2833, 39.5667)
+UKUNDA = (-4.2880, 39.5020)
+
+def ride_rows(ride, location, hour, events):
+    """Report rows for one ride: events is {event: (first ms, drivers notified, count)}"""
+    return [
+        (ride, location[0], location[1], hour, event, elapsed_ms, notified, count)
+        for event, (elapsed_ms, notified, count) in events.items()
+    ]
+
+class TestDispatchTrace(unittest.TestCase):
+    """Test suite for dispatch latency aggregation"""
+
+    def setUp(self):
+        self.rows = (
+            ride_rows("RIDE-1", DIANI, 20, {
+                "Requested": (5, 0, 1),
+                "Notified": (200, 6, 1),
+                "Accepted": (9000, 0, 1),
+                "Accept Lost": (9100, 0, 2),
+                "En Route": (30000, 0, 1)
+            })
+            + ride_rows("RIDE-2", DIANI, 20, {
+                "Requested": (4, 0, 1),
+                "Notified": (400, 4, 1)
+            })
+            + ride_rows("RIDE-3", UKUNDA, 8, {
+                "Requested": (6, 0, 1),
+                "Notified": (100, 2, 1),
+                "Accepted": (3000, 0, 1)
+            })
+        )
+
+    def test_overall_funnel(self):
+        """Counts and percentiles over all rides"""
+        overall = summarize_dispatch(self.rows)["overall"]
+
+        self.assertEqual(overall["rides"], 3)
+        self.assertEqual(overall["accepted"], 2)
+        self.assertEqual(overall["lost_accepts"], 2)
+        self.assertEqual(overall["avg_drivers_notified"], 4.0)
+        self.assertEqual(overall["time_to_notify_ms"]["p50"], 200)
+        self.assertEqual(overall["time_to_accept_ms"]["p95"], 9000)
+        self.assertEqual(overall["time_to_en_route_ms"]["p50"], 30000)
+
+    def test_grouped_by_hour_and_zone(self):
+        """Rides are split by request hour and by pickup zone"""
+        report = summarize_dispatch(self.rows)
+
+        self.assertEqual([row["hour"] for row in report["by_hour"]], [8, 20])
+        self.assertEqual(report["by_hour"][1]["rides"], 2)
+        self.assertEqual(report["by_hour"][1]["accept_rate"], 50.0)
+
+        zones = {row["zone"]: row for row in report["by_zone"]}
+        self.assertEqual(zones[encode_geohash(*DIANI, precision=ZONE_PRECISION)]["rides"], 2)
+        self.assertEqual(zones[encode_geohash(*UKUNDA, precision=ZONE_PRECISION)]["time_to_accept_ms"]["p50"], 3000)
+
+    def test_percentile(self):
+        """Nearest rank, and None without samples"""
+        self.assertEqual(percentile([1, 2, 3, 4], 50), 2)
+        self.assertEqual(percentile([1, 2, 3, 4], 95), 4)
+        self.assertIsNone(percentile([], 50))
+
+
+def run_tests():
+    """
+    Run all tests and print results
+    Usage: bench execute tuktuk_hailing.tests.test_dispatch_trace.run_tests
+    """
+    suite = unittest.TestLoader().loadTestsFromTestCase(TestDispatchTrace)
+    result = unittest.TextTestRunner(verbosity=2).run(suite)
+
+    return result.wasSuccessful()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+Unit tests for the driver stat counters
+
+Run with:
+    bench run-tests --app tuktuk_hailing --module test_driver_stats
+"""
+
+import frappe
+import unittest
+from tuktuk_hailing.api.driver_stats import (
+    STAT_FIELDS,
+    has_stat_fields,
+    record_driver_stats,
+    reconcile_driver_stats
+)
+
+class TestDriverStats(unittest.TestCase):
+    """Test suite for counter updates and reconciliation"""
+
+    @classmethod
+    def setUpClass(cls):
+        if not has_stat_fields():
+            raise unittest.SkipTest("TukTuk Driver has no stat fields")
+
+        cls.driver = frappe.db.get_value("TukTuk Driver", {}, "name")
+        if not cls.driver:
+            raise unittest.SkipTest("No TukTuk Driver to test with")
+
+    def setUp(self):
+        self.original = frappe.db.get_value("TukTuk Driver", self.driver, STAT_FIELDS, as_dict=True)
+
+    def tearDown(self):
+        frappe.db.set_value("TukTuk Driver", self.driver, self.original, update_modified=False)
+
+    def get_stats(self):
+        return frappe.db.get_value("TukTuk Driver", self.driver, STAT_FIELDS, as_dict=True)
+
+    def test_average_uses_rating_count(self):
+        """Unrated trips do not pull the average down"""
+        frappe.db.set_value("TukTuk Driver", self.driver, {field: 0 for field in STAT_FIELDS}, update_modified=False)
+
+        record_driver_stats(self.driver, trips=1)
+        record_driver_stats(self.driver, trips=1, rating_sum=5, ratings=1)
+        record_driver_stats(self.driver, trips=1, rating_sum=4, ratings=1)
+
+        stats = self.get_stats()
+        self.assertEqual(stats.total_hailing_trips, 3)
+        self.assertEqual(stats.hailing_rating_count, 2)
+        self.assertEqual(stats.average_hailing_rating, 4.5)
+
+    def test_rating_change(self):
+        """Changing a rating adjusts the sum without counting it twice"""
+        frappe.db.set_value("TukTuk Driver", self.driver, {field: 0 for field in STAT_FIELDS}, update_modified=False)
+
+        record_driver_stats(self.driver, trips=1, rating_sum=2, ratings=1)
+        record_driver_stats(self.driver, rating_sum=3)
+
+        stats = self.get_stats()
+        self.assertEqual(stats.hailing_rating_count, 1)
+        self.assertEqual(stats.average_hailing_rating, 5)
+
+    def test_reconcile_matches_ride_trips(self):
+        """Reconciliation rebuilds drifted counters from Ride Trip"""
+        frappe.db.set_value("TukTuk Driver", self.driver, {"total_hailing_trips": 999, "hailing_rating_count": 999}, update_modified=False)
+
+        reconcile_driver_stats()
+
+        trips = frappe.db.count("Ride Trip", {"driver": self.driver})
+        ratings = frappe.db.count("Ride Trip", {"driver": self.driver, "customer_rating": [">", 0]})
+
+        stats = self.get_stats()
+        self.assertEqual(stats.total_hailing_trips, trips)
+        self.assertEqual(stats.hailing_rating_count, ratings)
+
+
+def run_tests():
+    """
+    Run all tests and print results
+    Usage: bench execute tuktuk_hailing.tests.test_driver_stats.run_tests
+    """
+    suite = unittest.TestLoader().loadTestsFromTestCase(TestDriverStats)
+    result = unittest.TextTestRunner(verbosity=2).run(suite)
+
+    return result.wasSuccessful()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,232 @@
+#!/usr/bin/env python3
+"""
+Unit tests for the server-side geocoding cache
+
+Nominatim is replaced by a local stub server, so no request leaves the machine.
+
+Run with:
+    bench run-tests --app tuktuk_hailing --module test_geocoding
+"""
+
+import frappe
+import unittest
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from urllib.parse import urlparse, parse_qs
+from tuktuk_hailing.api import geocoding
+from tuktuk_hailing.api.geocoding import (
+    get_query_key,
+    flush_geocode_hits,
+    promote_geocode_entry
+)
+
+# The endpoint without its per-IP rate limit, which needs a web request
+geocode = geocoding.geocode.__wrapped__
+
+STUB_RESULTS = {
+    "kongo mosque": [{
+        "name": "Kongo Mosque",
+        "display_name": "Kongo Mosque, Diani Beach Road, Kwale, Kenya",
+        "lat": "-4.3550",
+        "lon": "39.5750",
+        "category": "amenity",
+        "type": "place_of_worship"
+    }]
+}
+
+class StubNominatimHandler(BaseHTTPRequestHandler):
+    """Answers /search from STUB_RESULTS and counts requests"""
+
+    def do_GET(self):
+        query = parse_qs(urlparse(self.path).query).get("q", [""])[0]
+        self.server.requests.append(query)
+
+        body = json.dumps(STUB_RESULTS.get(query.lower().strip(), [])).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+class TestGeocoding(unittest.TestCase):
+    """Test suite for the geocode cache"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = HTTPServer(("127.0.0.1", 0), StubNominatimHandler)
+        cls.server.requests = []
+        cls.thread = threading.Thread(target=cls.server.serve_forever, daemon=True)
+        cls.thread.start()
+
+        settings = frappe.get_single("Hailing Settings")
+        cls.original_url = settings.geocoding_api_url
+        frappe.db.set_single_value(
+            "Hailing Settings",
+            "geocoding_api_url",
+            f"http://127.0.0.1:{cls.server.server_port}/search"
+        )
+
+        # The stub needs no throttling between requests
+        cls.original_interval = geocoding.GEOCODER_MIN_INTERVAL_MS
+        geocoding.GEOCODER_MIN_INTERVAL_MS = 1
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        geocoding.GEOCODER_MIN_INTERVAL_MS = cls.original_interval
+        frappe.db.set_single_value("Hailing Settings", "geocoding_api_url", cls.original_url)
+
+        if frappe.db.exists("Hailing Place", "Kongo Mosque"):
+            frappe.delete_doc("Hailing Place", "Kongo Mosque", force=True)
+
+        frappe.db.commit()
+
+    def setUp(self):
+        self.clear_cache()
+        self.server.requests.clear()
+
+    def clear_cache(self):
+        cache = frappe.cache()
+        for query_key in ("kongo mosque", "nowhere street 404"):
+            cache.delete(geocoding.get_fast_cache_key(query_key))
+        cache.delete(cache.make_key(geocoding.GEOCODE_HITS_KEY))
+        frappe.db.delete("Geocode Cache", {"query_key": ("in", ["kongo mosque", "nowhere street 404"])})
+
+    def test_query_key_normalization(self):
+        """Case, punctuation and whitespace do not change the key"""
+        self.assertEqual(get_query_key("  Kongo   MOSQUE! "), "kongo mosque")
+        self.assertEqual(get_query_key("Kongo, Mosque."), "kongo mosque")
+        self.assertLessEqual(len(get_query_key("x" * 500)), geocoding.MAX_QUERY_KEY_LENGTH)
+
+    def test_miss_then_hit(self):
+        """Only the first lookup reaches Nominatim"""
+        first = geocode("Kongo Mosque")
+        self.assertEqual(first["source"], "nominatim")
+        self.assertEqual(first["results"][0]["place_name"], "Kongo Mosque")
+        self.assertAlmostEqual(first["results"][0]["lat"], -4.355)
+
+        second = geocode("kongo,  mosque")
+        self.assertEqual(second["source"], "cache")
+        self.assertEqual(second["results"], first["results"])
+        self.assertEqual(len(self.server.requests), 1)
+
+        self.assertTrue(frappe.db.exists("Geocode Cache", "kongo mosque"))
+
+    def test_served_from_database_after_redis_loss(self):
+        """The persistent table answers when Redis was flushed"""
+        geocode("Kongo Mosque")
+        frappe.cache().delete(geocoding.get_fast_cache_key("kongo mosque"))
+
+        response = geocode("Kongo Mosque")
+        self.assertEqual(response["source"], "cache")
+        self.assertEqual(len(self.server.requests), 1)
+
+    def test_negative_caching(self):
+        """Unresolvable queries are remembered"""
+        first = geocode("Nowhere Street 404")
+        self.assertEqual(first["results"], [])
+
+        second = geocode("Nowhere Street 404")
+        self.assertEqual(second["results"], [])
+        self.assertEqual(len(self.server.requests), 1)
+        self.assertEqual(frappe.db.get_value("Geocode Cache", "nowhere street 404", "status"), "Not Found")
+
+    def test_long_query(self):
+        """Queries longer than the query field are stored truncated"""
+        query = "Nowhere Street 404 " * 10
+
+        response = geocode(query)
+        self.assertEqual(response["results"], [])
+        self.assertEqual(
+            frappe.db.get_value("Geocode Cache", get_query_key(query), "query"),
+            query.strip()[:geocoding.MAX_QUERY_LENGTH]
+        )
+
+        frappe.db.delete("Geocode Cache", {"query_key": get_query_key(query)})
+        frappe.cache().delete(geocoding.get_fast_cache_key(get_query_key(query)))
+
+    def test_concurrent_misses_coalesce(self):
+        """Parallel lookups for the same query send one upstream request"""
+        site = frappe.local.site
+        responses = []
+
+        def lookup():
+            frappe.init(site=site)
+            frappe.connect()
+            try:
+                responses.append(geocode("Kongo Mosque"))
+            finally:
+                frappe.destroy()
+
+        threads = [threading.Thread(target=lookup) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        # One lookup got the answer; the others were told to retry, not kept waiting
+        self.assertEqual(len(responses), 4)
+        self.assertTrue(all(response["results"] or response.get("pending") for response in responses))
+        self.assertEqual(len(self.server.requests), 1)
+
+        self.assertEqual(geocode("Kongo Mosque")["source"], "cache")
+
+    def test_lookup_handed_to_one_job(self):
+        """With the upstream slot taken, retries wait for the one queued job"""
+        cache = frappe.cache()
+        throttle_key = cache.make_key(geocoding.GEOCODER_THROTTLE_KEY)
+        lock_key = geocoding.get_geocode_lock_key(get_query_key("Kongo Mosque"))
+        jobs = []
+        enqueue = frappe.enqueue
+
+        frappe.enqueue = lambda method, **kwargs: jobs.append(kwargs)
+        try:
+            cache.set(throttle_key, 1, px=60000)
+            first = geocode("Kongo Mosque")
+            retry = geocode("Kongo Mosque")
+        finally:
+            frappe.enqueue = enqueue
+            cache.delete(throttle_key)
+
+        self.assertTrue(first.get("pending") and retry.get("pending"))
+        self.assertEqual(len(jobs), 1)
+        self.assertTrue(cache.get(lock_key))
+
+        # The job does the lookup and releases the lock
+        geocoding.resolve_geocode_job(jobs[0]["query"], jobs[0]["query_key"])
+        self.assertFalse(cache.get(lock_key))
+        self.assertEqual(len(self.server.requests), 1)
+        self.assertEqual(geocode("Kongo Mosque")["source"], "cache")
+
+    def test_hits_flushed_and_promoted(self):
+        """Hit counts reach the table and popular results become places"""
+        geocode("Kongo Mosque")
+        for _ in range(3):
+            geocode("Kongo Mosque")
+
+        flush_geocode_hits()
+        self.assertEqual(frappe.db.get_value("Geocode Cache", "kongo mosque", "hit_count"), 3)
+
+        result = promote_geocode_entry("kongo mosque")
+        self.assertTrue(result["success"])
+        self.assertTrue(frappe.db.exists("Hailing Place", "Kongo Mosque"))
+        self.assertEqual(frappe.db.get_value("Geocode Cache", "kongo mosque", "promoted_place"), "Kongo Mosque")
+
+
+def run_tests():
+    """
+    Run all tests and print results
+    Usage: bench execute tuktuk_hailing.tests.test_geocoding.run_tests
+    """
+    suite = unittest.TestLoader().loadTestsFromTestCase(TestGeocoding)
+    result = unittest.TextTestRunner(verbosity=2).run(suite)
+
+    return result.wasSuccessful()
+
+
+if __name__ == "__main__":
+    unittest.main()
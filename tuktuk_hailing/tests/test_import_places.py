@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+"""
+Unit tests for the batched place importer
+
+Run with:
+    bench run-tests --app tuktuk_hailing --module test_import_places
+"""
+
+import frappe
+import unittest
+import csv
+import os
+import json
+import tempfile
+from tuktuk_hailing.import_diani_places import import_from_csv
+from tuktuk_hailing import import_osm_places
+from tuktuk_hailing.import_osm_places import import_from_file, get_osm_category, iter_osm_xml, iter_geojson
+
+TEST_CATEGORY = "Import Test Category"
+
+class TestPlaceImport(unittest.TestCase):
+    """Test suite for the CSV, GeoJSON and OSM importers"""
+
+    def setUp(self):
+        self.cleanup()
+        self.files = []
+
+    def tearDown(self):
+        self.cleanup()
+        for path in self.files:
+            os.remove(path)
+
+    def cleanup(self):
+        frappe.db.delete("Hailing Place", {"name": ("like", "Import Test %")})
+        frappe.db.delete("Hailing Place Category", {"name": TEST_CATEGORY})
+        frappe.db.commit()
+
+    def write_file(self, suffix, content):
+        handle, path = tempfile.mkstemp(suffix=suffix)
+        with os.fdopen(handle, "w", encoding="utf-8") as output:
+            output.write(content)
+        self.files.append(path)
+        return path
+
+    def write_csv(self, rows):
+        handle, path = tempfile.mkstemp(suffix=".csv")
+        with os.fdopen(handle, "w", encoding="utf-8", newline="") as csvfile:
+            writer = csv.writer(csvfile)
+            writer.writerow(["Name", "Category", "Address", "Latitude", "Longitude"])
+            writer.writerows(rows)
+        self.files.append(path)
+        return path
+
+    def test_import_creates_places_and_categories(self):
+        """Rows are inserted across several batches with their category"""
+        path = self.write_csv([
+            [f"Import Test Place {n}", TEST_CATEGORY, "Beach Road", -4.3 + n / 1000, 39.57]
+            for n in range(25)
+        ] + [["Import Test Broken", TEST_CATEGORY, "", "", ""]])
+
+        stats = import_from_csv(path, batch_size=10)
+
+        self.assertEqual(stats.created, 25)
+        self.assertEqual(stats.skipped, 1)
+        self.assertTrue(frappe.db.exists("Hailing Place Category", TEST_CATEGORY))
+        self.assertEqual(frappe.db.count("Hailing Place", {"name": ("like", "Import Test Place %")}), 25)
+
+        place = frappe.get_doc("Hailing Place", "Import Test Place 3")
+        self.assertEqual(place.category, TEST_CATEGORY)
+        self.assertEqual(place.description, "Beach Road")
+        self.assertTrue(place.is_active)
+
+    def test_update_policy(self):
+        """Existing places and repeated rows are overwritten by later rows"""
+        import_from_csv(self.write_csv([["Import Test Villa", TEST_CATEGORY, "Old Road", -4.30, 39.57]]))
+
+        stats = import_from_csv(self.write_csv([
+            ["Import Test Villa", TEST_CATEGORY, "", -4.31, 39.58],
+            ["Import Test Villa", TEST_CATEGORY, "", -4.32, 39.59]
+        ]))
+
+        self.assertEqual(stats.updated, 1)
+        self.assertEqual(stats.duplicates, 1)
+
+        place = frappe.db.get_value("Hailing Place", "Import Test Villa", ["latitude", "description"], as_dict=True)
+        self.assertAlmostEqual(place.latitude, -4.32)
+        # An empty address keeps the stored description
+        self.assertEqual(place.description, "Old Road")
+
+    def test_skip_policy(self):
+        """Existing places and the first row for each name are kept"""
+        import_from_csv(self.write_csv([["Import Test Villa", TEST_CATEGORY, "", -4.30, 39.57]]))
+
+        stats = import_from_csv(self.write_csv([
+            ["Import Test Villa", TEST_CATEGORY, "", -4.31, 39.58],
+            ["Import Test Lodge", TEST_CATEGORY, "", -4.33, 39.56],
+            ["Import Test Lodge", TEST_CATEGORY, "", -4.34, 39.55]
+        ]), on_duplicate="skip")
+
+        self.assertEqual(stats.created, 1)
+        self.assertEqual(stats.unchanged, 1)
+        self.assertAlmostEqual(frappe.db.get_value("Hailing Place", "Import Test Villa", "latitude"), -4.30)
+        self.assertAlmostEqual(frappe.db.get_value("Hailing Place", "Import Test Lodge", "latitude"), -4.33)
+
+    def test_dry_run_writes_nothing(self):
+        """Dry run reports without saving"""
+        stats = import_from_csv(
+            self.write_csv([["Import Test Cottage", TEST_CATEGORY, "", -4.30, 39.57]]),
+            dry_run=True
+        )
+
+        self.assertEqual(stats.created, 1)
+        self.assertFalse(frappe.db.exists("Hailing Place", "Import Test Cottage"))
+        self.assertFalse(frappe.db.exists("Hailing Place Category", TEST_CATEGORY))
+
+    def test_osm_category_mapping(self):
+        """Mapped tags win; unmapped POIs only when requested"""
+        self.assertEqual(get_osm_category({"amenity": "fuel"}), "Gas station")
+        self.assertEqual(get_osm_category({"building": "yes", "tourism": "hotel"}), "Hotel")
+        self.assertIsNone(get_osm_category({"amenity": "bench"}))
+        self.assertEqual(get_osm_category({"amenity": "ice_cream"}, include_unmapped=True), "Ice cream")
+
+    def test_osm_xml_way_center(self):
+        """Ways are placed at the center of their nodes"""
+        path = self.write_file(".osm", """<?xml version="1.0" encoding="UTF-8"?>
+<osm version="0.6">
+ <node id="1" lat="-4.30" lon="39.57"><tag k="amenity" v="bar"/><tag k="name" v="Import Test Bar"/></node>
+ <node id="2" lat="-4.31" lon="39.58"/>
+ <node id="3" lat="-4.33" lon="39.58"/>
+ <way id="10"><nd ref="2"/><nd ref="3"/><tag k="tourism" v="hotel"/><tag k="name" v="Import Test Hotel"/></way>
+</osm>""")
+
+        records = {tags["name"]: (lat, lng) for tags, lat, lng in iter_osm_xml(path)}
+
+        self.assertEqual(records["Import Test Bar"], (-4.30, 39.57))
+        self.assertAlmostEqual(records["Import Test Hotel"][0], -4.32)
+        self.assertAlmostEqual(records["Import Test Hotel"][1], 39.58)
+
+    def test_geojson_import(self):
+        """Named, mapped features are upserted; others are ignored"""
+        features = [
+            {"type": "Feature", "properties": {"name": "Import Test Pharmacy", "amenity": "pharmacy"},
+             "geometry": {"type": "Point", "coordinates": [39.57, -4.30]}},
+            {"type": "Feature", "properties": {"tags": {"name": "Import Test Beach", "natural": "beach"}},
+             "geometry": {"type": "LineString", "coordinates": [[39.57, -4.30], [39.59, -4.32]]}},
+            {"type": "Feature", "properties": {"name": "Import Test Road", "highway": "primary"},
+             "geometry": {"type": "Point", "coordinates": [39.57, -4.30]}}
+        ]
+        path = self.write_file(".geojson", json.dumps({"type": "FeatureCollection", "features": features}))
+
+        stats = import_from_file(path, clip_to_service_area=False)
+
+        self.assertEqual(stats.created, 2)
+        self.assertEqual(stats.ignored, 1)
+        self.assertEqual(frappe.db.get_value("Hailing Place", "Import Test Pharmacy", "category"), "Pharmacy")
+        self.assertAlmostEqual(frappe.db.get_value("Hailing Place", "Import Test Beach", "latitude"), -4.31)
+
+    def test_geojson_malformed_feature(self):
+        """A broken feature stops the import with its byte offset instead of truncating it"""
+        good = json.dumps({"type": "Feature", "properties": {"name": "Import Test Pharmacy", "amenity": "pharmacy"},
+                           "geometry": {"type": "Point", "coordinates": [39.57, -4.30]}})
+        prefix = '{"type": "FeatureCollection", "features": [' + good + ', '
+        path = self.write_file(".geojson", prefix + '{"type": "Feature", "properties": {"name": } ' + (good + ", ") * 50 + "]}")
+
+        with self.assertRaises(ValueError) as context:
+            list(iter_geojson(path))
+
+        self.assertIn(f"byte {len(prefix.encode('utf-8'))}", str(context.exception))
+
+    def test_geojson_feature_size_cap(self):
+        """An unterminated feature is not read into memory without bound"""
+        path = self.write_file(".geojson", '{"features": [{"name": "' + "x" * 5000)
+
+        original = import_osm_places.GEOJSON_CHUNK_SIZE, import_osm_places.MAX_GEOJSON_FEATURE_SIZE
+        import_osm_places.GEOJSON_CHUNK_SIZE, import_osm_places.MAX_GEOJSON_FEATURE_SIZE = 64, 1024
+        try:
+            with self.assertRaises(ValueError):
+                list(iter_geojson(path))
+        finally:
+            import_osm_places.GEOJSON_CHUNK_SIZE, import_osm_places.MAX_GEOJSON_FEATURE_SIZE = original
+
+
+if __name__ == "__main__":
+    unittest.main()
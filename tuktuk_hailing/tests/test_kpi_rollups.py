@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+Unit tests for the hailing KPI rollups
+
+Run with:
+    bench run-tests --app tuktuk_hailing --module test_kpi_rollups
+"""
+
+import frappe
+import unittest
+from frappe.utils import get_datetime
+from tuktuk_hailing.api.kpi_rollups import (
+    ROLLUP_FIELDS,
+    TOTAL_KEY,
+    get_transition_changes,
+    get_rollup_key,
+    get_rollup,
+    record_status_change,
+    write_rollup_rows
+)
+
+# A day far from real data, so its rows belong to the test alone
+TEST_TIME = get_datetime("2001-02-03 04:05:30")
+
+class TestKPIRollups(unittest.TestCase):
+    """Test suite for transition counting and rollup rows"""
+
+    def setUp(self):
+        self.original_total = get_rollup(TOTAL_KEY)
+
+    def tearDown(self):
+        frappe.db.delete("Hailing KPI Rollup", {"period_start": ["between", ["2001-02-03", "2001-02-04"]]})
+        write_rollup_rows([(TOTAL_KEY, None, self.original_total)], replace=True)
+
+    def test_transition_changes(self):
+        """Each status change maps to the right counters"""
+        self.assertEqual(get_transition_changes(None, "Pending"), ({"requests": 1}, {"pending": 1}))
+        self.assertEqual(get_transition_changes("Pending", "Accepted"), ({"accepts": 1}, {"pending": -1, "active": 1}))
+        self.assertEqual(get_transition_changes("Accepted", "En Route"), ({}, {}))
+        self.assertEqual(get_transition_changes("En Route", "Completed", 250), ({"completions": 1, "revenue": 250}, {"active": -1}))
+        self.assertEqual(get_transition_changes("Pending", "Expired"), ({}, {"pending": -1}))
+
+    def test_ride_lifecycle(self):
+        """A request that is accepted and completed lands in the minute, day and total rows"""
+        record_status_change(None, "Pending", at=TEST_TIME)
+        record_status_change("Pending", "Accepted", at=TEST_TIME)
+        record_status_change("Accepted", "Completed", 300, at=TEST_TIME)
+
+        minute = get_rollup(get_rollup_key("Minute", TEST_TIME))
+        day = get_rollup(get_rollup_key("Day", TEST_TIME))
+        total = get_rollup(TOTAL_KEY)
+
+        for row in (minute, day):
+            self.assertEqual((row.requests, row.accepts, row.completions), (1, 1, 1))
+            self.assertEqual(row.revenue, 300)
+
+        self.assertEqual(total.requests, self.original_total.requests + 1)
+        self.assertEqual(total.pending, self.original_total.pending)
+        self.assertEqual(total.active, self.original_total.active)
+
+    def test_replace(self):
+        """Rebuilt rows overwrite the counters instead of adding to them"""
+        key = get_rollup_key("Day", TEST_TIME)
+        write_rollup_rows([(key, TEST_TIME, {"requests": 5})])
+        write_rollup_rows([(key, TEST_TIME, {"requests": 2})], replace=True)
+
+        row = get_rollup(key)
+        self.assertEqual(row.requests, 2)
+        self.assertEqual(set(row), set(ROLLUP_FIELDS))
+
+
+def run_tests():
+    """
+    Run all tests and print results
+    Usage: bench execute tuktuk_hailing.tests.test_kpi_rollups.run_tests
+    """
+    suite = unittest.TestLoader().loadTestsFromTestCase(TestKPIRollups)
+    result = unittest.TextTestRunner(verbosity=2).run(suite)
+
+    return result.wasSuccessful()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+Unit tests for the hailing API metrics
+
+Run with:
+    bench run-tests --app tuktuk_hailing --module test_metrics
+"""
+
+import frappe
+import unittest
+from tuktuk_hailing.api.metrics import (
+    METRICS_KEY,
+    instrument,
+    record_cache_lookup,
+    flush_metrics,
+    get_stored_metrics,
+    render_metrics
+)
+
+@instrument
+def run_two_queries():
+    frappe.db.sql("SELECT 1")
+    frappe.db.sql("SELECT 2")
+    record_cache_lookup(True)
+    return {"ok": True}
+
+@instrument
+def add_numbers(a, b=0):
+    return {"total": int(a) + int(b)}
+
+@instrument
+def run_nested():
+    record_cache_lookup(False)
+    return run_two_queries()
+
+ENDPOINT = f"{__name__}.run_two_queries"
+
+class TestMetrics(unittest.TestCase):
+    """Test suite for call recording and the Prometheus output"""
+
+    def setUp(self):
+        flush_metrics()
+        cache = frappe.cache()
+        cache.delete(cache.make_key(METRICS_KEY))
+
+    tearDown = setUp
+
+    def test_call_is_recorded(self):
+        """Queries, cache lookups and response size are counted per call"""
+        run_two_queries()
+        run_two_queries()
+        flush_metrics()
+
+        stats = get_stored_metrics()[ENDPOINT]
+        self.assertEqual(stats["calls"], 2)
+        self.assertEqual(stats["db_queries"], 4)
+        self.assertEqual(stats["cache_hits"], 2)
+        self.assertEqual(stats["response_bytes"], 2 * len('{"ok":true}'))
+
+    def test_nested_call_counts_once(self):
+        """An instrumented call inside another is part of the outer one"""
+        run_nested()
+        flush_metrics()
+
+        metrics = get_stored_metrics()
+        self.assertNotIn(ENDPOINT, metrics)
+
+        stats = metrics[f"{__name__}.run_nested"]
+        self.assertEqual(stats["db_queries"], 2)
+        self.assertEqual(stats["cache_hits"], 1)
+        self.assertEqual(stats["cache_misses"], 1)
+
+    def test_frappe_call_passes_only_own_arguments(self):
+        """Request keys the function does not take are dropped, as without @instrument"""
+        self.assertEqual(frappe.call(add_numbers, a="2", b="3", cmd="add_numbers", _="1"), {"total": 5})
+        self.assertEqual(frappe.call(run_two_queries, cmd="run_two_queries"), {"ok": True})
+
+    def test_render_histogram(self):
+        """Buckets are cumulative and end with +Inf"""
+        text = render_metrics({
+            "app.search": {"calls": 3, "seconds": 0.07, "le:0.005": 1, "le:0.05": 2, "db_queries": 4}
+        })
+
+        self.assertIn('hailing_request_duration_seconds_bucket{endpoint="app.search",le="0.01"} 1', text)
+        self.assertIn('hailing_request_duration_seconds_bucket{endpoint="app.search",le="0.05"} 3', text)
+        self.assertIn('hailing_request_duration_seconds_bucket{endpoint="app.search",le="+Inf"} 3', text)
+        self.assertIn('hailing_request_duration_seconds_sum{endpoint="app.search"} 0.07', text)
+        self.assertIn('hailing_db_queries_total{endpoint="app.search"} 4', text)
+        self.assertIn('hailing_cache_misses_total{endpoint="app.search"} 0', text)
+
+
+def run_tests():
+    """
+    Run all tests and print results
+    Usage: bench execute tuktuk_hailing.tests.test_metrics.run_tests
+    """
+    suite = unittest.TestLoader().loadTestsFromTestCase(TestMetrics)
+    result = unittest.TextTestRunner(verbosity=2).run(suite)
+
+    return result.wasSuccessful()
+
+
+if __name__ == "__main__":
+    unittest.main()
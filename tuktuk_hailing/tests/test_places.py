@@ -15,8 +15,12 @@ from tuktuk_hailing.api.places import (
     search_places,
     search_local_places,
     get_place_suggestions,
-    format_display_name
+    format_display_name,
+    build_fulltext_terms,
+    reverse_lookup
 )
+from tuktuk_hailing.api.place_index import PlaceIndex, normalize, get_search_keys
+from tuktuk_hailing.api.place_popularity import match_place
 
 class TestHailingPlaces(unittest.TestCase):
     """Test suite for Hailing Places functionality"""
@@ -309,6 +313,45 @@ class TestHailingPlaces(unittest.TestCase):
             # First result should be the exact match
             self.assertEqual(result['results'][0]['place_name'], 'Test Beach Resort')
     
+    def test_search_modes_agree_on_exact_match(self):
+        """Every search mode ranks the exact name match first"""
+        
+        for mode in ["Index", "Full Text", "Like"]:
+            results = search_local_places("Test Beach Resort", limit=5, search_mode=mode)
+            
+            self.assertGreater(len(results), 0, f"No results in {mode} mode")
+            self.assertEqual(results[0]['place_name'], 'Test Beach Resort')
+    
+    def test_like_mode_prefix_before_scan(self):
+        """Name prefix matches come from the index; only a short result runs the contains scan"""
+        
+        queries = []
+        original_sql = frappe.db.sql
+        
+        def recording_sql(query, *args, **kwargs):
+            queries.append(query)
+            return original_sql(query, *args, **kwargs)
+        
+        frappe.db.sql = recording_sql
+        try:
+            prefix = search_local_places("Test Beach", limit=1, search_mode="Like")
+            queries_for_prefix = len(queries)
+            contains = search_local_places("Resort", limit=5, search_mode="Like")
+        finally:
+            frappe.db.sql = original_sql
+        
+        self.assertEqual(prefix[0]['place_name'], 'Test Beach Resort')
+        self.assertEqual(queries_for_prefix, 1)
+        self.assertIn("search_key LIKE", queries[-1])
+        self.assertIn('Test Beach Resort', [r['place_name'] for r in contains])
+    
+    def test_build_fulltext_terms(self):
+        """Short words are dropped and operators stripped"""
+        
+        self.assertEqual(build_fulltext_terms("Diani Beach"), "+Diani* +Beach*")
+        self.assertEqual(build_fulltext_terms("the +sea-view"), "+the* +sea* +view*")
+        self.assertIsNone(build_fulltext_terms("Di"))
+    
     def test_cache_functionality(self):
         """Test that caching works for suggestions"""
         
@@ -325,6 +368,43 @@ class TestHailingPlaces(unittest.TestCase):
             self.assertEqual(suggestions1[0]['value'], suggestions2[0]['value'])
 
 
+    def test_reverse_lookup(self):
+        """Reverse lookup names a point next to a place"""
+        
+        result = reverse_lookup(-4.2831, 39.5671, radius_m=100, limit=3)
+        
+        self.assertEqual(result['source'], 'local')
+        self.assertEqual(result['results'][0]['place_name'], 'Test Beach Resort')
+        self.assertLess(result['results'][0]['distance_km'], 0.1)
+        
+        self.assertEqual(reverse_lookup("invalid", 39.5671)['results'], [])
+    
+    def test_cache_invalidated_on_place_change(self):
+        """Editing a place is visible immediately despite cached results"""
+        
+        def found():
+            result = search_places("Test Hotel Paradise", limit=5)
+            return any(r['place_name'] == 'Test Hotel Paradise' for r in result['results'])
+        
+        self.assertTrue(found())
+        self.assertTrue(found())  # served from cache
+        
+        place = frappe.get_doc("Hailing Place", "Test Hotel Paradise")
+        place.is_active = 0
+        place.save(ignore_permissions=True)
+        frappe.db.commit()
+        
+        try:
+            self.assertFalse(found())
+        finally:
+            place.reload()
+            place.is_active = 1
+            place.save(ignore_permissions=True)
+            frappe.db.commit()
+        
+        self.assertTrue(found())
+
+
 class TestHailingPlaceDocType(unittest.TestCase):
     """Test Hailing Place DocType operations"""
     
@@ -346,6 +426,29 @@ class TestHailingPlaceDocType(unittest.TestCase):
         finally:
             frappe.delete_doc("Hailing Place", "Test Create Place", force=1)
     
+    def test_search_keys_set_on_save(self):
+        """Normalized keys follow the name, aliases and category"""
+        
+        place = frappe.get_doc({
+            "doctype": "Hailing Place",
+            "place_name": "Test Café d'Amour",
+            "latitude": -4.300,
+            "longitude": 39.600,
+            "aliases": "Amour, Café",
+            "is_active": 1
+        })
+        
+        place.insert(ignore_permissions=True)
+        
+        try:
+            self.assertEqual(place.name_key, "test cafe damour")
+            self.assertEqual(place.search_key, "test cafe damour | amour / cafe | ")
+            
+            results = search_local_places("CAFE D'AMOUR", limit=5, search_mode="Like")
+            self.assertEqual(results[0]['place_name'], "Test Café d'Amour")
+        finally:
+            frappe.delete_doc("Hailing Place", place.name, force=1)
+    
     def test_unique_place_name(self):
         """Test that place names must be unique"""
         
@@ -395,6 +498,199 @@ class TestHailingPlaceDocType(unittest.TestCase):
             place.insert(ignore_permissions=True)
 
 
+class TestPlaceIndex(unittest.TestCase):
+    """Test the in-memory n-gram place index"""
+    
+    def setUp(self):
+        self.index = PlaceIndex()
+        
+        rows = [
+            ("Diani Beach", "Beach", -4.2797, 39.5946, "Diani"),
+            ("Diani Beach Hospital", "Hospital", -4.3000, 39.5800, "Hospital, DBH"),
+            ("Kinondo Kwetu", "Hotel", -4.3900, 39.5500, "Kinondo, Hotel"),
+            ("Leopard Beach Resort", "5-star hotel", -4.2600, 39.6000, "Leopard, Resort")
+        ]
+        
+        for place_name, category, lat, lng, aliases in rows:
+            self.index.add({
+                "name": place_name,
+                "place_name": place_name,
+                "category": category,
+                "latitude": lat,
+                "longitude": lng,
+                "aliases": aliases,
+                "description": None
+            })
+    
+    def names(self, matches):
+        return [place.place_name for place, _distance in matches]
+    
+    def test_priority_ordering(self):
+        """Exact, prefix, contains, alias, category"""
+        
+        names = self.names(self.index.search("diani beach", limit=10))
+        self.assertEqual(names, ["Diani Beach", "Diani Beach Hospital"])
+        
+        names = self.names(self.index.search("hospital", limit=10))
+        self.assertEqual(names, ["Diani Beach Hospital"])
+        
+        names = self.names(self.index.search("hotel", limit=10))
+        self.assertEqual(names, ["Kinondo Kwetu", "Leopard Beach Resort"])
+    
+    def test_normalized_keys(self):
+        """Case, accents and punctuation are folded"""
+        
+        self.assertEqual(normalize("  Café  d'Amour! "), "cafe damour")
+        self.assertEqual(normalize("Test_Place%50"), "test place 50")
+        self.assertEqual(
+            get_search_keys("Diani Beach", "Diani, beach,, DIANI", "Bed & breakfast"),
+            ("diani beach", "diani beach | diani / beach | bed breakfast")
+        )
+        
+        names = self.names(self.index.search("Díani-Beach", limit=10))
+        self.assertEqual(names, ["Diani Beach", "Diani Beach Hospital"])
+    
+    def test_popularity_breaks_ties(self):
+        """Within a priority, popular places come first"""
+        
+        names = self.names(self.index.search("beach", limit=3))
+        self.assertEqual(names, ["Diani Beach", "Diani Beach Hospital", "Leopard Beach Resort"])
+        
+        self.index.places["Leopard Beach Resort"].popularity_score = 12.5
+        
+        names = self.names(self.index.search("beach", limit=3))
+        self.assertEqual(names, ["Leopard Beach Resort", "Diani Beach", "Diani Beach Hospital"])
+        
+        # Exact matches still win
+        names = self.names(self.index.search("diani beach", limit=1))
+        self.assertEqual(names, ["Diani Beach"])
+    
+    def test_match_ride_endpoint_to_place(self):
+        """Ride addresses match by place name, then by nearby coordinates"""
+        
+        names_by_key = {place.name_key: name for name, place in self.index.places.items()}
+        
+        self.assertEqual(
+            match_place(self.index, names_by_key, "Leopard Beach Resort, 5-star hotel, Diani Beach, Kenya", None, None),
+            "Leopard Beach Resort"
+        )
+        self.assertEqual(
+            match_place(self.index, names_by_key, "Dropped pin", -4.2602, 39.6001),
+            "Leopard Beach Resort"
+        )
+        self.assertIsNone(match_place(self.index, names_by_key, "Dropped pin", -4.2700, 39.6100))
+    
+    def test_category_excluded_for_suggestions(self):
+        """Suggestions do not match on category"""
+        
+        names = self.names(self.index.search("5-star", limit=10, include_category=False))
+        self.assertEqual(names, [])
+    
+    def test_two_character_query(self):
+        """Bigrams serve the minimum query length"""
+        
+        names = self.names(self.index.search("KW", limit=10))
+        self.assertEqual(names, ["Kinondo Kwetu"])
+    
+    def test_remove_and_replace(self):
+        """Incremental updates keep postings consistent"""
+        
+        self.index.remove("Kinondo Kwetu")
+        self.assertEqual(self.names(self.index.search("kinondo", limit=10)), [])
+        
+        self.index.add({
+            "name": "Leopard Beach Resort",
+            "place_name": "Leopard Beach Resort",
+            "category": "Resort hotel",
+            "latitude": -4.26,
+            "longitude": 39.60,
+            "aliases": "LBR",
+            "description": None
+        })
+        self.assertEqual(self.names(self.index.search("lbr", limit=10)), ["Leopard Beach Resort"])
+        # The old category is no longer indexed
+        self.assertEqual(self.names(self.index.search("5-star", limit=10)), [])
+    
+    def test_bounds_and_distance(self):
+        """Bounds filter and distance ordering within a priority"""
+        
+        matches = self.index.search("beach", limit=10, bounds=(-4.31, -4.27, 39.57, 39.60))
+        self.assertEqual(self.names(matches), ["Diani Beach", "Diani Beach Hospital"])
+        
+        matches = self.index.search("beach", limit=10, origin=(-4.30, 39.58))
+        self.assertEqual(self.names(matches)[0], "Diani Beach Hospital")
+        self.assertLess(matches[0][1], 0.1)
+        
+        matches = self.index.search("beach", limit=1, origin=(-4.26, 39.60))
+        self.assertEqual(self.names(matches), ["Leopard Beach Resort"])
+        self.assertAlmostEqual(matches[0][1], 0.0, places=3)
+    
+    def test_nearby(self):
+        """Reverse lookup returns places within the radius, nearest first"""
+        
+        matches = self.index.nearby(-4.2797, 39.5946, 2500, limit=5)
+        self.assertEqual(self.names(matches), ["Diani Beach", "Leopard Beach Resort"])
+        self.assertAlmostEqual(matches[0][1], 0.0, places=3)
+        
+        self.assertEqual(self.index.nearby(-4.2797, 39.5946, 50, limit=5)[0][0].place_name, "Diani Beach")
+        self.assertEqual(self.index.nearby(-4.5, 39.7, 500, limit=5), [])
+        
+        self.index.remove("Diani Beach")
+        matches = self.index.nearby(-4.2797, 39.5946, 50, limit=5)
+        self.assertEqual(matches, [])
+    
+    def test_fuzzy_misspellings(self):
+        """Common misspellings resolve to the intended place"""
+        
+        self.assertEqual(self.index.search("Leopord Beach", limit=5), [])
+        
+        names = self.names(self.index.fuzzy_search("Leopord Beach", limit=5))
+        self.assertEqual(names, ["Leopard Beach Resort"])
+        
+        names = self.names(self.index.fuzzy_search("Kinondo Kweto", limit=5))
+        self.assertEqual(names, ["Kinondo Kwetu"])
+        
+        names = self.names(self.index.fuzzy_search("Kinnondo Kwet", limit=5))
+        self.assertEqual(names, ["Kinondo Kwetu"])
+    
+    def test_fuzzy_ranks_by_typos(self):
+        """Fewer typos rank first and unrelated words do not match"""
+        
+        names = self.names(self.index.fuzzy_search("Dianni Beach", limit=5))
+        self.assertEqual(names, ["Diani Beach", "Diani Beach Hospital"])
+        
+        self.assertEqual(self.index.fuzzy_search("Mombasa", limit=5), [])
+    
+    def test_fuzzy_after_remove(self):
+        """Removed places drop out of the deletion dictionary"""
+        
+        self.index.remove("Leopard Beach Resort")
+        self.assertEqual(self.index.fuzzy_search("Leopord", limit=5), [])
+        self.assertNotIn("leopard", self.index.fuzzy.word_places)
+    
+    def test_copy_leaves_original_unchanged(self):
+        """Changes to a copy never touch the index searches are reading"""
+        
+        updated = self.index.copy(version=2)
+        updated.remove("Leopard Beach Resort")
+        updated.add({
+            "name": "Leopard Point",
+            "place_name": "Leopard Point",
+            "category": "Hotel",
+            "latitude": -4.2600,
+            "longitude": 39.6000,
+            "aliases": None,
+            "description": None
+        })
+        
+        self.assertEqual(self.names(self.index.search("leopard", limit=5)), ["Leopard Beach Resort"])
+        self.assertEqual(self.names(self.index.fuzzy_search("Leopord", limit=5)), ["Leopard Beach Resort"])
+        self.assertEqual(self.names(self.index.nearby(-4.2600, 39.6000, 50)), ["Leopard Beach Resort"])
+        
+        self.assertEqual(self.names(updated.search("leopard", limit=5)), ["Leopard Point"])
+        self.assertEqual(updated.version, 2)
+
+
 def run_tests():
     """
     Helper function to run tests
@@ -410,6 +706,7 @@ def run_tests():
     
     suite.addTests(loader.loadTestsFromTestCase(TestHailingPlaces))
     suite.addTests(loader.loadTestsFromTestCase(TestHailingPlaceDocType))
+    suite.addTests(loader.loadTestsFromTestCase(TestPlaceIndex))
     
     # Run tests
     runner = unittest.TextTestRunner(verbosity=2)
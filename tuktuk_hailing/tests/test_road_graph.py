@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+"""
+Unit tests for the built-in road graph router
+
+Run with:
+    bench run-tests --app tuktuk_hailing --module test_road_graph
+"""
+
+import frappe
+import unittest
+import os
+import tempfile
+from tuktuk_hailing.api import road_graph
+from tuktuk_hailing.api.road_graph import RoadGraph
+from tuktuk_hailing.build_road_graph import build_from_file, get_road_speed, get_directions
+
+# 3 x 3 grid of nodes about 550 m apart:
+#
+#   1 === 2 === 3      === primary road
+#   |     :     |      --> one way (west to east)
+#   4 --> 5 --> 6      :   footway (not drivable)
+#   |     :     |
+#   7 --- 8 --- 9
+#
+# Nodes 20 and 21 form a separate road that is not connected to the grid.
+SPACING = 0.005
+
+def grid_node(row, column):
+    return -4.30 - row * SPACING, 39.57 + column * SPACING
+
+def grid_xml():
+    nodes = "\n".join(
+        ' <node id="{}" lat="{}" lon="{}"/>'.format(row * 3 + column + 1, *grid_node(row, column))
+        for row in range(3) for column in range(3)
+    )
+
+    def way(way_id, refs, **tags):
+        return ' <way id="{}">{}{}</way>'.format(
+            way_id,
+            "".join(f'<nd ref="{ref}"/>' for ref in refs),
+            "".join(f'<tag k="{key}" v="{value}"/>' for key, value in tags.items())
+        )
+
+    return "\n".join([
+        '<?xml version="1.0" encoding="UTF-8"?>',
+        '<osm version="0.6">',
+        nodes,
+        ' <node id="20" lat="-4.40" lon="39.60"/>',
+        ' <node id="21" lat="-4.41" lon="39.60"/>',
+        way(100, [1, 2, 3], highway="primary"),
+        way(101, [4, 5, 6], highway="residential", oneway="yes"),
+        way(102, [7, 8, 9], highway="residential"),
+        way(103, [1, 4, 7], highway="residential"),
+        way(104, [3, 6, 9], highway="residential"),
+        way(105, [2, 5, 8], highway="footway"),
+        way(106, [20, 21], highway="residential"),
+        '</osm>'
+    ])
+
+class TestRoadGraph(unittest.TestCase):
+    """Test suite for building and querying the road graph"""
+
+    @classmethod
+    def setUpClass(cls):
+        handle, cls.osm_path = tempfile.mkstemp(suffix=".osm")
+        with os.fdopen(handle, "w", encoding="utf-8") as output:
+            output.write(grid_xml())
+
+        handle, cls.graph_path = tempfile.mkstemp(suffix=".bin")
+        os.close(handle)
+
+        cls.graph = build_from_file(cls.osm_path, output=cls.graph_path, clip_to_service_area=False)
+
+    @classmethod
+    def tearDownClass(cls):
+        os.remove(cls.osm_path)
+        os.remove(cls.graph_path)
+
+    def route(self, start, end, graph=None):
+        return (graph or self.graph).route(*grid_node(*start), *grid_node(*end))
+
+    def test_tag_rules(self):
+        """Road classes, access and one-way tags"""
+        self.assertEqual(get_road_speed({"highway": "primary_link"}), get_road_speed({"highway": "primary"}))
+        self.assertIsNone(get_road_speed({"highway": "footway"}))
+        self.assertIsNone(get_road_speed({"highway": "residential", "access": "private"}))
+        self.assertEqual(get_directions({"oneway": "-1"}), (False, True))
+        self.assertEqual(get_directions({"junction": "roundabout"}), (True, False))
+
+    def test_graph_keeps_connected_roads(self):
+        """The grid is kept and the unconnected road is dropped"""
+        self.assertEqual(self.graph.node_count, 9)
+        # 4 two-way ways of 2 segments each, plus the one-way row
+        self.assertEqual(len(self.graph.targets), 4 * 2 * 2 + 2)
+
+    def test_one_way_respected(self):
+        """The middle row is only driven west to east"""
+        east = self.route((1, 0), (1, 2))
+        west = self.route((1, 2), (1, 0))
+
+        self.assertTrue(east["success"])
+        self.assertEqual(east["source"], "offline")
+        self.assertAlmostEqual(east["distance_km"], 1.11, delta=0.02)
+        self.assertGreater(west["distance_km"], 2.1)
+
+    def test_footway_not_used(self):
+        """Going from top middle to bottom middle goes around the footway"""
+        route = self.route((0, 1), (2, 1))
+        self.assertGreater(route["distance_km"], 2.1)
+
+    def test_fastest_route_prefers_faster_road(self):
+        """Equal-length detours are decided by road speed"""
+        # 6 -> 4 can go round the top (primary) or the bottom (residential)
+        route = self.route((1, 2), (1, 0))
+        latitudes = [lat for _lng, lat in route["geometry"]["coordinates"]]
+        self.assertAlmostEqual(max(latitudes), grid_node(0, 0)[0])
+
+    def test_far_point_not_routed(self):
+        """Points far from every road get no route"""
+        self.assertIsNone(self.graph.route(-4.30, 39.57, -4.60, 39.90))
+
+    def test_save_and_load(self):
+        """A loaded graph answers the same as the built one"""
+        loaded = RoadGraph.load(self.graph_path)
+
+        self.assertEqual(loaded.node_count, self.graph.node_count)
+        self.assertEqual(self.route((0, 0), (2, 2), loaded), self.route((0, 0), (2, 2)))
+
+    def test_broken_file_keeps_loaded_graph(self):
+        """A graph file that cannot be read leaves the site's previous graph in use"""
+        handle, broken_path = tempfile.mkstemp(suffix=".bin")
+        os.close(handle)
+
+        get_path = road_graph.get_road_graph_path
+        saved = dict(road_graph._graphs)
+
+        try:
+            road_graph._graphs.clear()
+
+            road_graph.get_road_graph_path = lambda: self.graph_path
+            self.assertEqual(road_graph.get_road_graph().node_count, self.graph.node_count)
+
+            with open(broken_path, "wb") as output:
+                output.write(b"truncated")
+            road_graph.get_road_graph_path = lambda: broken_path
+            self.assertEqual(road_graph.get_road_graph().node_count, self.graph.node_count)
+
+            # Another site served by the same worker does not get this site's graph
+            site = frappe.local.site
+            try:
+                frappe.local.site = f"{site}-other"
+                self.assertIsNone(road_graph.get_road_graph())
+            finally:
+                frappe.local.site = site
+
+            road_graph._graphs.clear()
+            self.assertIsNone(road_graph.get_road_graph())
+        finally:
+            road_graph.get_road_graph_path = get_path
+            road_graph._graphs.clear()
+            road_graph._graphs.update(saved)
+            os.remove(broken_path)
+
+    def test_eta_matrix_matches_routes(self):
+        """Matrix cells equal single routes, searching from either side"""
+        points = [grid_node(1, 0), grid_node(1, 2), grid_node(2, 1)]
+
+        # One source, several destinations: forward searches
+        row = self.graph.eta_matrix(points[:1], points[1:])[0]
+        # Several sources, one destination: reverse searches
+        column = [cells[0] for cells in self.graph.eta_matrix(points[1:], points[:1])]
+
+        for cell, end in zip(row, points[1:]):
+            route = self.graph.route(*points[0], *end)
+            self.assertEqual(cell["distance_km"], route["distance_km"])
+            self.assertEqual(cell["duration_minutes"], route["duration_minutes"])
+
+        for cell, start in zip(column, points[1:]):
+            route = self.graph.route(*start, *points[0])
+            self.assertEqual(cell["distance_km"], route["distance_km"])
+            self.assertEqual(cell["duration_minutes"], route["duration_minutes"])
+
+
+def run_tests():
+    """
+    Run all tests and print results
+    Usage: bench execute tuktuk_hailing.tests.test_road_graph.run_tests
+    """
+    suite = unittest.TestLoader().loadTestsFromTestCase(TestRoadGraph)
+    result = unittest.TextTestRunner(verbosity=2).run(suite)
+
+    return result.wasSuccessful()
+
+
+if __name__ == "__main__":
+    unittest.main()
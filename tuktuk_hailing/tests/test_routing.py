@@ -0,0 +1,302 @@
+#!/usr/bin/env python3
+"""
+Unit tests for the cached OSRM routing client and ETA matrix
+
+OSRM is replaced by a local stub server, so no request leaves the machine.
+
+Run with:
+    bench run-tests --app tuktuk_hailing --module test_routing
+"""
+
+import frappe
+import unittest
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+from tuktuk_hailing.api import routing
+from tuktuk_hailing.api.routing import get_route, get_eta_matrix, get_circuit_state
+from tuktuk_hailing.api.location import calculate_distance
+
+# The stub's roads are 1.2 times the straight line, driven at 18 km/h
+STUB_ROAD_FACTOR = 1.2
+STUB_SPEED_MS = 5.0
+
+class StubOSRMHandler(BaseHTTPRequestHandler):
+    """
+    Answers /route with a straight line and /table from the straight-line
+    distance, or fails when server.failing is set
+    """
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        self.server.requests.append(url.path)
+        time.sleep(self.server.delay)
+
+        if self.server.failing:
+            self.send_response(503)
+            self.end_headers()
+            return
+
+        coordinates = [
+            [float(value) for value in point.split(",")]
+            for point in url.path.rsplit("/", 1)[-1].split(";")
+        ]
+
+        if "/table/" in url.path:
+            self.send_table(coordinates, parse_qs(url.query))
+        else:
+            self.send_route(coordinates)
+
+    def send_table(self, coordinates, params):
+        sources = [coordinates[int(n)] for n in params["sources"][0].split(";")]
+        destinations = [coordinates[int(n)] for n in params["destinations"][0].split(";")]
+        distances = [
+            [calculate_distance(s[1], s[0], d[1], d[0]) * 1000 * STUB_ROAD_FACTOR for d in destinations]
+            for s in sources
+        ]
+        self.send_json({
+            "code": "Ok",
+            "distances": distances,
+            "durations": [[distance / STUB_SPEED_MS for distance in row] for row in distances]
+        })
+
+    def send_route(self, coordinates):
+        self.send_json({
+            "code": "Ok",
+            "routes": [{
+                "distance": 2400.0,
+                "duration": 360.0,
+                "geometry": {"type": "LineString", "coordinates": coordinates}
+            }]
+        })
+
+    def send_json(self, data):
+        body = json.dumps(data).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+class TestRouting(unittest.TestCase):
+    """Test suite for the routing client"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(("127.0.0.1", 0), StubOSRMHandler)
+        cls.server.requests = []
+        cls.thread = threading.Thread(target=cls.server.serve_forever, daemon=True)
+        cls.thread.start()
+        cls.api_url = f"http://127.0.0.1:{cls.server.server_port}/route/v1/driving/"
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        routing.record_routing_success()
+
+    def setUp(self):
+        self.server.requests.clear()
+        self.server.failing = False
+        self.server.delay = 0
+        routing.record_routing_success()
+        self.clear_routes()
+
+    def clear_routes(self):
+        cache = frappe.cache()
+        for pattern in ("route:*", "eta:*"):
+            for key in cache.keys(cache.make_key(pattern)):
+                cache.delete(key)
+
+    def test_route_cached_within_grid(self):
+        """A route a few metres away is answered from the cache"""
+        first = get_route(-4.3000, 39.5700, -4.3200, 39.5800, self.api_url)
+        self.assertTrue(first["success"])
+        self.assertEqual(first["source"], "osrm")
+        self.assertEqual(first["distance_km"], 2.4)
+        self.assertEqual(first["duration_minutes"], 6.0)
+
+        # About 5 m further along
+        second = get_route(-4.30004, 39.57003, -4.3200, 39.5800, self.api_url)
+        self.assertEqual(second["source"], "cache")
+        self.assertEqual(second["distance_km"], first["distance_km"])
+        self.assertEqual(len(self.server.requests), 1)
+
+        # About 100 m away is a different route
+        get_route(-4.3009, 39.5700, -4.3200, 39.5800, self.api_url)
+        self.assertEqual(len(self.server.requests), 2)
+
+    def test_concurrent_requests_coalesce(self):
+        """Parallel requests for the same route send one upstream request"""
+        self.server.delay = 0.3
+        site = frappe.local.site
+        responses = []
+
+        def request_route():
+            frappe.init(site=site)
+            frappe.connect()
+            try:
+                responses.append(get_route(-4.3100, 39.5600, -4.3300, 39.5700, self.api_url))
+            finally:
+                frappe.destroy()
+
+        threads = [threading.Thread(target=request_route) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(responses), 4)
+        self.assertTrue(all(response["success"] for response in responses))
+        self.assertEqual(len(self.server.requests), 1)
+
+    def test_circuit_breaker(self):
+        """Repeated failures stop calls to OSRM until a probe succeeds"""
+        self.server.failing = True
+
+        for n in range(routing.CIRCUIT_FAILURE_THRESHOLD):
+            response = get_route(-4.30 - n / 100, 39.57, -4.35, 39.58, self.api_url)
+            self.assertFalse(response["success"])
+
+        self.assertEqual(get_circuit_state(), "open")
+        self.assertEqual(len(self.server.requests), routing.CIRCUIT_FAILURE_THRESHOLD)
+
+        # Open circuit: failing fast without reaching OSRM
+        response = get_route(-4.29, 39.57, -4.35, 39.58, self.api_url)
+        self.assertFalse(response["success"])
+        self.assertEqual(len(self.server.requests), routing.CIRCUIT_FAILURE_THRESHOLD)
+
+        # After the cooldown a successful probe closes the circuit
+        original_cooldown = routing.CIRCUIT_COOLDOWN
+        routing.CIRCUIT_COOLDOWN = 0
+        try:
+            self.server.failing = False
+            response = get_route(-4.29, 39.57, -4.35, 39.58, self.api_url)
+        finally:
+            routing.CIRCUIT_COOLDOWN = original_cooldown
+
+        self.assertTrue(response["success"])
+        self.assertEqual(get_circuit_state(), "closed")
+
+    def test_failures_not_cached(self):
+        """A failed request is retried on the next call"""
+        self.server.failing = True
+        self.assertFalse(get_route(-4.30, 39.57, -4.33, 39.58, self.api_url)["success"])
+
+        self.server.failing = False
+        self.assertTrue(get_route(-4.30, 39.57, -4.33, 39.58, self.api_url)["success"])
+        self.assertEqual(len(self.server.requests), 2)
+
+    def test_eta_matrix_single_request(self):
+        """All drivers x pickups come from one table request and are then cached"""
+        drivers = [(-4.3000, 39.5700), (-4.2800, 39.5900), (-4.3300, 39.5600)]
+        pickups = [(-4.3100, 39.5750), (-4.2790, 39.5950)]
+
+        matrix = get_eta_matrix(drivers, pickups, self.api_url)
+        self.assertEqual(len(matrix), 3)
+        self.assertEqual(len(matrix[0]), 2)
+        self.assertEqual(len(self.server.requests), 1)
+        self.assertIn("/table/v1/driving/", self.server.requests[0])
+
+        expected_km = calculate_distance(-4.3000, 39.5700, -4.3100, 39.5750) * STUB_ROAD_FACTOR
+        self.assertAlmostEqual(matrix[0][0]["distance_km"], expected_km, delta=0.01)
+        self.assertAlmostEqual(matrix[0][0]["duration_minutes"], expected_km * 1000 / STUB_SPEED_MS / 60, delta=0.1)
+        self.assertFalse(matrix[0][0]["estimated"])
+
+        # Nearest pickup for the second driver is the second one
+        self.assertLess(matrix[1][1]["duration_minutes"], matrix[1][0]["duration_minutes"])
+
+        self.assertEqual(get_eta_matrix(drivers, pickups, self.api_url), matrix)
+        self.assertEqual(len(self.server.requests), 1)
+
+    def test_eta_matrix_fetches_only_missing_cells(self):
+        """A new pickup is requested alone; cached cells are reused"""
+        drivers = [(-4.3000, 39.5700), (-4.2800, 39.5900)]
+        get_eta_matrix(drivers, [(-4.3100, 39.5750)], self.api_url)
+
+        matrix = get_eta_matrix(drivers, [(-4.3100, 39.5750), (-4.3200, 39.5650)], self.api_url)
+        self.assertEqual(len(self.server.requests), 2)
+        self.assertEqual(self.server.requests[1].count(";"), 2)  # 2 drivers + 1 pickup
+        self.assertTrue(all(not cell["estimated"] for row in matrix for cell in row))
+
+    def test_eta_matrix_time_budget(self):
+        """A slow OSRM cannot stall the matrix; chunks answered in time are kept"""
+        original = routing.TABLE_CHUNK_SIZE, routing.ETA_FETCH_BUDGET_SECONDS
+        routing.TABLE_CHUNK_SIZE, routing.ETA_FETCH_BUDGET_SECONDS = 1, 0.5
+        self.server.delay = 0.3
+
+        try:
+            started = time.monotonic()
+            matrix = get_eta_matrix(
+                [(-4.3000, 39.5700)],
+                [(-4.3100, 39.5750), (-4.3200, 39.5650), (-4.3300, 39.5600)],
+                self.api_url
+            )
+            elapsed = time.monotonic() - started
+        finally:
+            routing.TABLE_CHUNK_SIZE, routing.ETA_FETCH_BUDGET_SECONDS = original
+
+        self.assertLess(elapsed, 1.5)
+        self.assertEqual(len(matrix[0]), 3)
+        self.assertFalse(matrix[0][0]["estimated"])
+        self.assertLessEqual(len(self.server.requests), 2)
+
+    def test_eta_matrix_other_provider_not_asked(self):
+        """A Routing API URL left over from OSRM is not called for another provider"""
+        settings = frappe.db.get_value(
+            "Hailing Settings", "Hailing Settings", ["routing_api_provider", "routing_api_url"], as_dict=True
+        )
+
+        try:
+            frappe.db.set_single_value("Hailing Settings", "routing_api_url", self.api_url)
+            frappe.db.set_single_value("Hailing Settings", "routing_api_provider", "Built-in")
+            built_in = get_eta_matrix([(-4.3000, 39.5700)], [(-4.3100, 39.5750)])
+
+            frappe.db.set_single_value("Hailing Settings", "routing_api_provider", "OSRM")
+            osrm = get_eta_matrix([(-4.3000, 39.5700)], [(-4.3100, 39.5750)])
+        finally:
+            frappe.db.set_single_value("Hailing Settings", "routing_api_provider", settings.routing_api_provider)
+            frappe.db.set_single_value("Hailing Settings", "routing_api_url", settings.routing_api_url)
+
+        self.assertEqual(len(built_in[0]), 1)
+        self.assertFalse(osrm[0][0]["estimated"])
+        self.assertEqual(len([path for path in self.server.requests if "/table/" in path]), 1)
+
+    def test_eta_matrix_fallback(self):
+        """Without OSRM cells are estimated from the straight-line distance"""
+        self.server.failing = True
+
+        matrix = get_eta_matrix([(-4.3000, 39.5700)], [(-4.3100, 39.5750)], self.api_url)
+        cell = matrix[0][0]
+
+        straight_km = calculate_distance(-4.3000, 39.5700, -4.3100, 39.5750)
+        self.assertTrue(cell["estimated"])
+        self.assertAlmostEqual(cell["distance_km"], straight_km * routing.ETA_ROAD_FACTOR, delta=0.01)
+        self.assertAlmostEqual(
+            cell["duration_minutes"],
+            straight_km * routing.ETA_ROAD_FACTOR / routing.ETA_FALLBACK_SPEED_KMH * 60,
+            delta=0.1
+        )
+
+        # Estimates are not cached
+        self.server.failing = False
+        self.assertFalse(get_eta_matrix([(-4.3000, 39.5700)], [(-4.3100, 39.5750)], self.api_url)[0][0]["estimated"])
+
+
+def run_tests():
+    """
+    Run all tests and print results
+    Usage: bench execute tuktuk_hailing.tests.test_routing.run_tests
+    """
+    suite = unittest.TestLoader().loadTestsFromTestCase(TestRouting)
+    result = unittest.TextTestRunner(verbosity=2).run(suite)
+
+    return result.wasSuccessful()
+
+
+if __name__ == "__main__":
+    unittest.main()
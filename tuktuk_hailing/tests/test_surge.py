@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+Unit tests for surge pricing
+
+Run with:
+    bench run-tests --app tuktuk_hailing --module test_surge
+"""
+
+import frappe
+import unittest
+from tuktuk_hailing.api import surge
+from tuktuk_hailing.api.surge import (
+    compute_surge_multipliers,
+    store_surge_multipliers,
+    get_surge_multiplier,
+    get_surge_cell
+)
+from tuktuk_hailing.tuktuk_hailing.doctype.ride_request.ride_request import calculate_fare
+
+PICKUP = (-4.2950, 39.5750)
+DESTINATION = (-4.3150, 39.5750)
+
+class TestSurgePricing(unittest.TestCase):
+    """Test suite for the surge engine and fare lookup"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.original_enabled = frappe.db.get_single_value("Hailing Settings", "surge_pricing_enabled")
+
+    @classmethod
+    def tearDownClass(cls):
+        frappe.db.set_single_value("Hailing Settings", "surge_pricing_enabled", cls.original_enabled)
+        store_surge_multipliers({})
+
+    def setUp(self):
+        store_surge_multipliers({})
+
+    def test_ratio_to_multiplier(self):
+        """Busy cells surge, quiet or well-served cells do not"""
+        demand = {(0, 0): 9, (5, 5): 2, (9, 9): 4}
+        supply = {(0, 0): 1, (0, 1): 2, (9, 9): 4}
+
+        multipliers = compute_surge_multipliers(demand, supply, max_multiplier=3.0)
+
+        # 9 requests for 1 driver plus half of 2 neighbours: ratio 4.5
+        self.assertEqual(multipliers["0:0"], round(1 + surge.SURGE_STEP_PER_RATIO * 3.5, 1))
+        self.assertNotIn("5:5", multipliers)  # Too few requests
+        self.assertNotIn("9:9", multipliers)  # One driver per request
+
+    def test_multiplier_capped(self):
+        """No cell goes above the configured maximum"""
+        multipliers = compute_surge_multipliers({(0, 0): 100}, {}, max_multiplier=1.5)
+        self.assertEqual(multipliers["0:0"], 1.5)
+
+    def test_lookup(self):
+        """The pickup cell's multiplier is found; other cells are 1.0"""
+        store_surge_multipliers({get_surge_cell(*PICKUP): 1.8})
+
+        self.assertEqual(get_surge_multiplier(*PICKUP), 1.8)
+        self.assertEqual(get_surge_multiplier(-4.40, 39.50), 1.0)
+
+    def test_cell_boundary(self):
+        """Points on a cell edge fall in the same cell as the FLOOR() in the queries"""
+        self.assertEqual(get_surge_cell(-4.28, 39.57), "-428:3957")
+        self.assertEqual(get_surge_cell(-4.2850, 39.5750), "-429:3957")
+
+    def test_fare_applies_surge_only_when_enabled(self):
+        """calculate_fare multiplies by the pickup cell's surge"""
+        frappe.db.set_single_value("Hailing Settings", "surge_pricing_enabled", 0)
+        normal_fare, distance = calculate_fare(*PICKUP, *DESTINATION)
+
+        store_surge_multipliers({get_surge_cell(*PICKUP): 1.5})
+        self.assertEqual(calculate_fare(*PICKUP, *DESTINATION)[0], normal_fare)
+
+        frappe.db.set_single_value("Hailing Settings", "surge_pricing_enabled", 1)
+        surge_fare, surge_distance = calculate_fare(*PICKUP, *DESTINATION)
+
+        self.assertAlmostEqual(surge_fare, normal_fare * 1.5, delta=0.02)
+        self.assertEqual(surge_distance, distance)
+
+        # Surge depends on where the ride starts
+        self.assertEqual(calculate_fare(*DESTINATION, *PICKUP)[0], normal_fare)
+
+
+def run_tests():
+    """
+    Run all tests and print results
+    Usage: bench execute tuktuk_hailing.tests.test_surge.run_tests
+    """
+    suite = unittest.TestLoader().loadTestsFromTestCase(TestSurgePricing)
+    result = unittest.TextTestRunner(verbosity=2).run(suite)
+
+    return result.wasSuccessful()
+
+
+if __name__ == "__main__":
+    unittest.main()
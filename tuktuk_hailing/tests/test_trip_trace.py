@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+Unit tests for encoded trip route traces
+
+Run with:
+    bench run-tests --app tuktuk_hailing --module test_trip_trace
+"""
+
+import unittest
+import math
+from tuktuk_hailing.api.trip_trace import (
+    simplify_trace,
+    encode_polyline,
+    decode_polyline,
+    build_trip_trace
+)
+from tuktuk_hailing.api.location import calculate_distance
+
+# Example from the polyline format documentation
+REFERENCE_POINTS = [(38.5, -120.2), (40.7, -120.95), (43.252, -126.453)]
+REFERENCE_ENCODED = "_p~iF~ps|U_ulLnnqC_mqNvxq`@"
+
+def l_shaped_trip(step=0.0001, jitter=0.00002):
+    """Drive 1 km south, then 1 km east, with a few metres of GPS wobble"""
+    points = []
+    for n in range(100):
+        points.append((-4.30 - n * step, 39.57 + (jitter if n % 2 else -jitter)))
+    for n in range(100):
+        points.append((-4.31 + (jitter if n % 2 else -jitter), 39.57 + n * step))
+    return points
+
+class TestTripTrace(unittest.TestCase):
+    """Test suite for trace simplification and encoding"""
+
+    def test_reference_encoding(self):
+        """Encoding matches the published example and decodes back"""
+        self.assertEqual(encode_polyline(REFERENCE_POINTS), REFERENCE_ENCODED)
+        self.assertEqual(decode_polyline(REFERENCE_ENCODED), REFERENCE_POINTS)
+
+    def test_round_trip_precision(self):
+        """Decoded points are within about a metre of the originals"""
+        points = l_shaped_trip()
+        for original, decoded in zip(points, decode_polyline(encode_polyline(points))):
+            self.assertLess(calculate_distance(*original, *decoded) * 1000, 1.2)
+
+    def test_simplification_keeps_the_shape(self):
+        """Wobble is dropped; the start, the corner and the end stay"""
+        points = l_shaped_trip()
+        simplified = simplify_trace(points, 10)
+
+        self.assertLessEqual(len(simplified), 5)
+        self.assertEqual(simplified[0], points[0])
+        self.assertEqual(simplified[-1], points[-1])
+
+        # The corner of the L is one of the kept points
+        corner = min(simplified, key=lambda point: math.hypot(point[0] + 4.31, point[1] - 39.57))
+        self.assertLess(calculate_distance(*corner, -4.31, 39.57) * 1000, 15)
+
+    def test_zero_tolerance_keeps_everything(self):
+        """A tolerance of zero disables simplification"""
+        points = l_shaped_trip()
+        self.assertEqual(simplify_trace(points, 0), points)
+
+    def test_trace_is_compact(self):
+        """A 2 km trip with 200 pings fits in a few dozen bytes"""
+        encoded, count = build_trip_trace(l_shaped_trip(), tolerance_m=10)
+
+        self.assertEqual(count, len(decode_polyline(encoded)))
+        self.assertLess(len(encoded), 60)
+
+
+def run_tests():
+    """
+    Run all tests and print results
+    Usage: bench execute tuktuk_hailing.tests.test_trip_trace.run_tests
+    """
+    suite = unittest.TestLoader().loadTestsFromTestCase(TestTripTrace)
+    result = unittest.TextTestRunner(verbosity=2).run(suite)
+
+    return result.wasSuccessful()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+Unit tests for trip distance tracking from GPS pings
+
+Run with:
+    bench run-tests --app tuktuk_hailing --module test_trip_tracking
+"""
+
+import frappe
+import unittest
+from tuktuk_hailing.api.trip_tracking import (
+    advance_track,
+    start_trip_tracking,
+    stop_trip_tracking,
+    record_trip_ping,
+    finish_trip_tracking
+)
+from tuktuk_hailing.api.location import calculate_distance
+
+PICKUP = (-4.3000, 39.5700)
+
+# Roughly 111 m of latitude
+STEP = 0.001
+
+def empty_track():
+    return frappe._dict(pickup_lat=PICKUP[0], pickup_lng=PICKUP[1], distance_m=0, trip_distance_m=0, picked_up=0, rejected=0, pings=0)
+
+def apply(state, update):
+    if update:
+        state.update(update)
+    return state
+
+class TestTripTracking(unittest.TestCase):
+    """Test suite for the per-ping distance accumulator"""
+
+    def test_distance_counts_after_pickup(self):
+        """The drive to the pickup is not part of the trip distance"""
+        state = empty_track()
+        t = 0
+
+        # Drive 3 steps north to the pickup, then 5 steps south with the customer
+        for n in range(3, -6, -1):
+            t += 30
+            apply(state, advance_track(state, PICKUP[0] + n * STEP, PICKUP[1], 5, t))
+
+        self.assertTrue(state.picked_up)
+        self.assertAlmostEqual(state.distance_m, 8 * STEP * 111195, delta=5)
+        self.assertAlmostEqual(state.trip_distance_m, 5 * STEP * 111195, delta=5)
+
+    def test_jitter_ignored(self):
+        """Small wobble around a parked position adds nothing"""
+        state = empty_track()
+        apply(state, advance_track(state, *PICKUP, 5, 0))
+
+        for n in range(20):
+            offset = 0.00005 if n % 2 else -0.00005  # About 5 m either way
+            apply(state, advance_track(state, PICKUP[0] + offset, PICKUP[1], 5, n * 5))
+
+        self.assertEqual(state.distance_m, 0)
+
+    def test_slow_movement_adds_up(self):
+        """Moves below the noise threshold are kept until they add up"""
+        state = empty_track()
+        apply(state, advance_track(state, *PICKUP, 5, 0))
+
+        for n in range(1, 11):
+            apply(state, advance_track(state, PICKUP[0] + n * 0.00005, PICKUP[1], 5, n * 5))
+
+        self.assertAlmostEqual(state.distance_m, calculate_distance(*PICKUP, PICKUP[0] + 0.0005, PICKUP[1]) * 1000, delta=10)
+
+    def test_inaccurate_ping_dropped(self):
+        """Pings with a large accuracy radius change nothing"""
+        state = empty_track()
+        self.assertIsNone(advance_track(state, *PICKUP, 500, 0))
+
+    def test_gps_jump_rejected_then_accepted(self):
+        """A single jump is ignored; a jump that persists becomes the new position"""
+        state = empty_track()
+        apply(state, advance_track(state, *PICKUP, 5, 0))
+
+        far = (PICKUP[0] - 0.05, PICKUP[1])  # About 5.5 km in 10 s
+        apply(state, advance_track(state, *far, 5, 10))
+        self.assertEqual(state.lat, PICKUP[0])
+        self.assertEqual(state.distance_m, 0)
+
+        apply(state, advance_track(state, *far, 5, 20))
+        apply(state, advance_track(state, *far, 5, 30))
+        self.assertEqual(state.lat, far[0])
+        self.assertEqual(state.distance_m, 0)
+
+    def test_pings_through_redis(self):
+        """Pings for the driver's active ride reach the track and its total"""
+        ride = frappe._dict(
+            name="TEST-TRACK-RIDE",
+            accepted_by_driver="TEST-TRACK-DRIVER",
+            pickup_latitude=PICKUP[0],
+            pickup_longitude=PICKUP[1]
+        )
+        start_trip_tracking(ride)
+
+        try:
+            for n in range(6):
+                record_trip_ping(ride.accepted_by_driver, PICKUP[0] - n * STEP, PICKUP[1], 5, timestamp=n * 30)
+
+            # Pings after the ride ends are not counted
+            stop_trip_tracking(ride.accepted_by_driver)
+            record_trip_ping(ride.accepted_by_driver, PICKUP[0] - 10 * STEP, PICKUP[1], 5, timestamp=300)
+
+            tracked = finish_trip_tracking(ride.name)
+        finally:
+            stop_trip_tracking(ride.accepted_by_driver, ride.name)
+
+        self.assertTrue(tracked.picked_up)
+        self.assertEqual(tracked.pings, 6)
+        self.assertAlmostEqual(tracked.trip_distance_km, 0.56, delta=0.01)
+        # The pickup ping and the 5 moves with the customer
+        self.assertEqual(len(tracked.points), 6)
+        self.assertAlmostEqual(tracked.points[-1][0], PICKUP[0] - 5 * STEP)
+        self.assertIsNone(finish_trip_tracking(ride.name))
+
+
+def run_tests():
+    """
+    Run all tests and print results
+    Usage: bench execute tuktuk_hailing.tests.test_trip_tracking.run_tests
+    """
+    suite = unittest.TestLoader().loadTestsFromTestCase(TestTripTracking)
+    result = unittest.TextTestRunner(verbosity=2).run(suite)
+
+    return result.wasSuccessful()
+
+
+if __name__ == "__main__":
+    unittest.main()
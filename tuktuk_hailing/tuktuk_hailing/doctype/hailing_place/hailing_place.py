@@ -3,6 +3,21 @@
 
 import frappe
 from frappe.model.document import Document
+from tuktuk_hailing.api.place_index import queue_place_change, get_search_keys
 
 class HailingPlace(Document):
-    pass
+    def validate(self):
+        """Keep the normalized search keys in step with the searchable fields"""
+        self.name_key, self.search_key = get_search_keys(self.place_name, self.aliases, self.category)
+
+    def on_update(self):
+        """Sync search indexes with the saved place"""
+        queue_place_change(self.name)
+
+    def on_trash(self):
+        """Remove the place from search indexes"""
+        queue_place_change(self.name)
+
+    def after_rename(self, old_name, new_name, merge=False):
+        """Re-index under the new name"""
+        queue_place_change(old_name, new_name)
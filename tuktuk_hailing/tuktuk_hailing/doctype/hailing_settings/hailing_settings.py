@@ -4,6 +4,7 @@
 import frappe
 from frappe.model.document import Document
 import json
+from tuktuk_hailing.api.metrics import instrument
 
 class HailingSettings(Document):
     def validate(self):
@@ -70,6 +71,7 @@ class HailingSettings(Document):
             return "<p>Invalid coordinates format. Cannot preview map.</p>"
 
 @frappe.whitelist(allow_guest=True)
+@instrument
 def get_hailing_settings():
     """Get hailing settings - used by client apps"""
     if not frappe.db.exists("Hailing Settings", "Hailing Settings"):
@@ -94,6 +96,7 @@ def get_hailing_settings():
     }
 
 @frappe.whitelist()
+@instrument
 def is_location_in_service_area(latitude, longitude):
     """Check if a location is within the service area"""
     settings = frappe.get_single("Hailing Settings")
@@ -0,0 +1,8 @@
+# Copyright (c) 2024, Sunny Tuktuk and contributors
+# For license information, please see license.txt
+
+import frappe
+from frappe.model.document import Document
+
+class RideDispatchEvent(Document):
+    pass
@@ -5,6 +5,9 @@ import frappe
 from frappe.model.document import Document
 from frappe.utils import now, add_to_date, get_datetime
 from datetime import datetime, timedelta
+from tuktuk_hailing.api.kpi_rollups import record_status_change
+from tuktuk_hailing.api.dispatch_trace import record_dispatch_event, record_status_event
+from tuktuk_hailing.api.metrics import instrument
 
 class RideRequest(Document):
     def before_insert(self):
@@ -46,6 +49,10 @@ class RideRequest(Document):
     def on_update(self):
         """Handle status changes"""
         if self.has_value_changed("status"):
+            before = self.get_doc_before_save()
+            record_status_change(before.status if before else None, self.status, self.actual_fare)
+            record_status_event(self, before.status if before else None)
+            
             if self.status == "Accepted":
                 self.on_accept()
             elif self.status == "Cancelled":
@@ -62,6 +69,10 @@ class RideRequest(Document):
         if self.accepted_by_driver:
             driver = frappe.get_doc("TukTuk Driver", self.accepted_by_driver)
             driver.db_set("hailing_status", "En Route", update_modified=False)
+            
+            # Count the driver's location pings towards this ride's distance
+            from tuktuk_hailing.api.trip_tracking import start_trip_tracking
+            start_trip_tracking(self)
     
     def on_cancel(self):
         """Called when request is cancelled"""
@@ -76,6 +87,9 @@ class RideRequest(Document):
         if self.accepted_by_driver:
             driver = frappe.get_doc("TukTuk Driver", self.accepted_by_driver)
             driver.db_set("hailing_status", "Available", update_modified=False)
+            
+            from tuktuk_hailing.api.trip_tracking import stop_trip_tracking
+            stop_trip_tracking(self.accepted_by_driver, self.name)
     
     def on_complete(self):
         """Called when ride is completed"""
@@ -83,6 +97,10 @@ class RideRequest(Document):
         if self.accepted_by_driver:
             driver = frappe.get_doc("TukTuk Driver", self.accepted_by_driver)
             driver.db_set("hailing_status", "Available", update_modified=False)
+            
+            # Keep the track: create_ride_trip_from_request reads its distance
+            from tuktuk_hailing.api.trip_tracking import stop_trip_tracking
+            stop_trip_tracking(self.accepted_by_driver)
     
     def calculate_cancellation_fee(self):
         """Calculate if cancellation fee should be charged"""
@@ -101,6 +119,7 @@ class RideRequest(Document):
             self.cancellation_fee_charged = settings.cancellation_fee or 0
 
 @frappe.whitelist()
+@instrument
 def create_ride_request(customer_phone, pickup_address, pickup_lat, pickup_lng, 
                        destination_address, dest_lat, dest_lng, customer_name=None,
                        passenger_count=1, group_booking=None, tuktuk_number=None):
@@ -138,14 +157,21 @@ def create_ride_request(customer_phone, pickup_address, pickup_lat, pickup_lng,
     })
     
     ride_request.insert(ignore_permissions=True)
-    frappe.db.commit()
     
-    # Notify available drivers
-    notify_drivers(ride_request.name)
+    # Notify available drivers from a worker once the request is committed
+    frappe.enqueue(
+        "tuktuk_hailing.tuktuk_hailing.doctype.ride_request.ride_request.notify_drivers",
+        queue="short",
+        enqueue_after_commit=True,
+        request_id=ride_request.name
+    )
+    
+    frappe.db.commit()
     
     return ride_request.name
 
 @frappe.whitelist()
+@instrument
 def accept_ride_request(request_id, driver_id):
     """Driver accepts a ride request"""
 
@@ -155,6 +181,10 @@ def accept_ride_request(request_id, driver_id):
 
         # Check if request is still pending
         if ride_request.status != "Pending":
+            if ride_request.accepted_by_driver and ride_request.accepted_by_driver != driver_id:
+                # Lost the race to another driver
+                record_dispatch_event(ride_request, "Accept Lost", driver=driver_id)
+
             return {
                 "success": False,
                 "error": "This ride request is no longer available"
@@ -209,6 +239,14 @@ def accept_ride_request(request_id, driver_id):
             "status": ride_request.status
         }
 
+    except frappe.TimestampMismatchError:
+        # Another driver saved the request between our read and save
+        record_dispatch_event({"name": request_id, "requested_at": ride_request.requested_at}, "Accept Lost", driver=driver_id)
+        return {
+            "success": False,
+            "error": "This ride request is no longer available"
+        }
+
     except Exception as e:
         frappe.log_error(f"Error accepting ride request: {str(e)}", "Accept Ride Error")
         return {
@@ -217,6 +255,7 @@ def accept_ride_request(request_id, driver_id):
         }
 
 @frappe.whitelist()
+@instrument
 def mark_en_route(request_id):
     """Mark that driver is en route to pickup"""
     ride_request = frappe.get_doc("Ride Request", request_id)
@@ -236,6 +275,7 @@ def mark_en_route(request_id):
     return {"success": True}
 
 @frappe.whitelist()
+@instrument
 def complete_ride(request_id, actual_fare):
     """Complete a ride and process payment"""
     ride_request = frappe.get_doc("Ride Request", request_id)
@@ -262,6 +302,7 @@ def complete_ride(request_id, actual_fare):
     }
 
 @frappe.whitelist()
+@instrument
 def cancel_ride_request(request_id, cancelled_by, reason=None):
     """Cancel a ride request"""
     ride_request = frappe.get_doc("Ride Request", request_id)
@@ -310,6 +351,11 @@ def calculate_fare(pickup_lat, pickup_lng, dest_lat, dest_lng):
     if fare < float(settings.minimum_fare):
         fare = float(settings.minimum_fare)
     
+    # Surge multiplier for the pickup cell (precomputed by the surge job)
+    if settings.surge_pricing_enabled:
+        from tuktuk_hailing.api.surge import get_surge_multiplier
+        fare *= get_surge_multiplier(pickup_lat, pickup_lng)
+    
     return round(fare, 2), round(distance, 2)
 
 def update_group_booking_status(group_booking_id, ride_request_id):
@@ -330,8 +376,15 @@ def update_group_booking_status(group_booking_id, ride_request_id):
     except Exception as e:
         frappe.log_error(f"Error updating group booking status: {str(e)}", "Group Booking Status Update")
 
-def notify_drivers(request_id):
-    """Notify available drivers about new ride request"""
+def notify_drivers(request_id, wave=1):
+    """
+    Notify available drivers about new ride request
+    Runs as a background job on the short queue (see create_ride_request)
+
+    Args:
+        request_id: Ride Request
+        wave: Notification round for this request, recorded in the dispatch trace
+    """
     # Get all available drivers (online and available for rides)
     available_drivers = frappe.get_all("TukTuk Driver",
         filters={
@@ -362,8 +415,10 @@ def notify_drivers(request_id):
     }
 
     # Send real-time notification to each available driver
+    notified = 0
     for driver in available_drivers:
         if driver.user_account:
+            notified += 1
             frappe.logger().info(f"   📤 Sending event to driver {driver.driver_name} (user: {driver.user_account})")
             frappe.publish_realtime(
                 event="new_ride_request",
@@ -373,6 +428,8 @@ def notify_drivers(request_id):
         else:
             frappe.logger().info(f"   ⚠️ Driver {driver.driver_name} has no user_account, skipping")
 
+    record_dispatch_event(ride_request, "Notified", wave=wave, drivers_notified=notified)
+
     frappe.logger().info(f"✅ Notified {len(available_drivers)} drivers about ride request {request_id}")
 
 def expire_old_requests():
@@ -3,7 +3,9 @@
 
 import frappe
 from frappe.model.document import Document
-from frappe.utils import now, get_datetime, time_diff_in_seconds
+from frappe.utils import now, get_datetime, time_diff_in_seconds, flt
+from tuktuk_hailing.api.driver_stats import record_driver_stats, has_stat_fields
+from tuktuk_hailing.api.metrics import instrument
 
 class RideTrip(Document):
     def validate(self):
@@ -12,29 +14,29 @@ class RideTrip(Document):
             duration_seconds = time_diff_in_seconds(self.completed_at, self.started_at)
             self.duration_minutes = int(duration_seconds / 60)
     
-    def on_submit(self):
-        """Update driver statistics when trip is submitted"""
-        self.update_driver_stats()
-    
-    def update_driver_stats(self):
-        """Update driver's hailing statistics"""
-        driver = frappe.get_doc("TukTuk Driver", self.driver)
-        
-        # Update total hailing trips count (if field exists)
-        if hasattr(driver, 'total_hailing_trips'):
-            driver.total_hailing_trips = (driver.total_hailing_trips or 0) + 1
+    def on_update(self):
+        """Count the trip and its rating on the driver's counters"""
+        before = self.get_doc_before_save()
+        old_rating = flt(before.customer_rating) if before else 0
+        new_rating = flt(self.customer_rating)
         
-        # Update average rating (if rating provided and field exists)
-        if self.customer_rating and hasattr(driver, 'average_hailing_rating'):
-            current_avg = driver.average_hailing_rating or 0
-            current_count = driver.total_hailing_trips or 1
-            
-            new_avg = ((current_avg * (current_count - 1)) + self.customer_rating) / current_count
-            driver.average_hailing_rating = round(new_avg, 2)
+        if before and old_rating == new_rating:
+            return
         
-        driver.save(ignore_permissions=True)
+        record_driver_stats(
+            self.driver,
+            trips=0 if before else 1,
+            rating_sum=new_rating - old_rating,
+            ratings=(1 if new_rating else 0) - (1 if old_rating else 0)
+        )
+    
+    def on_trash(self):
+        """Take the trip and its rating off the driver's counters"""
+        rating = flt(self.customer_rating)
+        record_driver_stats(self.driver, trips=-1, rating_sum=-rating, ratings=-1 if rating else 0)
 
 @frappe.whitelist()
+@instrument
 def create_ride_trip_from_request(request_id):
     """Create a Ride Trip record from a completed Ride Request"""
     
@@ -48,6 +50,25 @@ def create_ride_trip_from_request(request_id):
     if existing:
         return existing
     
+    # Distance driven with the customer, accumulated from the driver's GPS pings
+    from tuktuk_hailing.api.trip_tracking import finish_trip_tracking
+    
+    tracked = finish_trip_tracking(request_id)
+    
+    if tracked and tracked.picked_up:
+        distance_traveled_km = tracked.trip_distance_km
+    else:
+        # No usable trace (pickup never reached or tracking unavailable)
+        distance_traveled_km = ride_request.estimated_distance_km
+    
+    # Simplified route, kept after the Driver Location rows are cleaned up
+    route_trace, route_trace_points = None, 0
+    
+    if tracked and len(tracked.points) >= 2:
+        from tuktuk_hailing.api.trip_trace import build_trip_trace
+        
+        route_trace, route_trace_points = build_trip_trace(tracked.points)
+    
     # Create trip record
     ride_trip = frappe.get_doc({
         "doctype": "Ride Trip",
@@ -59,10 +80,13 @@ def create_ride_trip_from_request(request_id):
         "pickup_address": ride_request.pickup_address,
         "destination_address": ride_request.destination_address,
         "started_at": ride_request.accepted_at,
-        "completed_at": now(),
-        "distance_traveled_km": ride_request.estimated_distance_km,
+        # Usually created in a background job: the request's last change is the completion
+        "completed_at": ride_request.modified,
+        "distance_traveled_km": distance_traveled_km,
         "fare_charged": ride_request.actual_fare,
-        "payment_status": "Pending"
+        "payment_status": "Pending",
+        "route_trace": route_trace,
+        "route_trace_points": route_trace_points
     })
     
     ride_trip.insert(ignore_permissions=True)
@@ -71,6 +95,7 @@ def create_ride_trip_from_request(request_id):
     return ride_trip.name
 
 @frappe.whitelist()
+@instrument
 def submit_customer_rating(trip_id, rating, comment=None):
     """Submit customer rating for a trip"""
     
@@ -102,11 +127,11 @@ def check_driver_rating_threshold(driver_id):
     if not settings.enable_customer_ratings:
         return
     
-    driver = frappe.get_doc("TukTuk Driver", driver_id)
-    
-    if not hasattr(driver, 'average_hailing_rating'):
+    if not has_stat_fields():
         return
     
+    driver = frappe.db.get_value("TukTuk Driver", driver_id, ["average_hailing_rating", "user"], as_dict=True)
+    
     if driver.average_hailing_rating and driver.average_hailing_rating < settings.minimum_rating_threshold:
         # Send warning to driver and management
         frappe.publish_realtime(
@@ -126,6 +151,7 @@ def check_driver_rating_threshold(driver_id):
         )
 
 @frappe.whitelist()
+@instrument
 def update_payment_status(trip_id, status, transaction_id=None):
     """Update payment status for a trip"""
     
@@ -0,0 +1,66 @@
+# Copyright (c) 2024, Sunny Tuktuk and contributors
+# For license information, please see license.txt
+
+import frappe
+from frappe.custom.doctype.custom_field.custom_field import create_custom_fields
+from tuktuk_hailing.api.driver_stats import reconcile_driver_stats
+
+STAT_FIELDS = [
+    {
+        "fieldname": "total_hailing_trips",
+        "label": "Total Hailing Trips",
+        "fieldtype": "Int",
+        "default": "0",
+        "read_only": 1
+    },
+    {
+        "fieldname": "average_hailing_rating",
+        "label": "Average Hailing Rating",
+        "fieldtype": "Float",
+        "precision": "2",
+        "read_only": 1
+    },
+    {
+        "fieldname": "hailing_rating_sum",
+        "label": "Hailing Rating Sum",
+        "fieldtype": "Float",
+        "default": "0",
+        "read_only": 1,
+        "hidden": 1
+    },
+    {
+        "fieldname": "hailing_rating_count",
+        "label": "Hailing Rating Count",
+        "fieldtype": "Int",
+        "default": "0",
+        "read_only": 1,
+        "hidden": 1
+    }
+]
+
+def execute():
+    """Add the driver stat counters to TukTuk Driver and fill them from Ride Trip"""
+
+    if not frappe.db.exists("DocType", "TukTuk Driver"):
+        return
+
+    frappe.reload_doc("tuktuk_hailing", "doctype", "ride_trip")
+
+    # Fields added earlier through Customize Form are left as they are
+    meta = frappe.get_meta("TukTuk Driver")
+    missing = []
+    insert_after = meta.fields[-1].fieldname if meta.fields else None
+
+    for field in STAT_FIELDS:
+        if meta.has_field(field["fieldname"]):
+            insert_after = field["fieldname"]
+            continue
+
+        missing.append(dict(field, insert_after=insert_after))
+        insert_after = field["fieldname"]
+
+    if missing:
+        create_custom_fields({"TukTuk Driver": missing}, update=True)
+        frappe.clear_cache(doctype="TukTuk Driver")
+
+    reconcile_driver_stats()
@@ -0,0 +1,16 @@
+# Copyright (c) 2024, Sunny Tuktuk and contributors
+# For license information, please see license.txt
+
+import frappe
+from tuktuk_hailing.api.kpi_rollups import rebuild_kpi_rollups
+
+def execute():
+    """Fill the day and total KPI rollups from existing Ride Requests"""
+
+    frappe.reload_doc("tuktuk_hailing", "doctype", "hailing_kpi_rollup")
+    frappe.reload_doc("tuktuk_hailing", "number_card", "total_ride_requests")
+    frappe.reload_doc("tuktuk_hailing", "number_card", "pending_requests")
+    frappe.reload_doc("tuktuk_hailing", "number_card", "active_rides")
+    frappe.reload_doc("tuktuk_hailing", "number_card", "completed_trips")
+
+    rebuild_kpi_rollups(days=None)
@@ -0,0 +1,29 @@
+# Copyright (c) 2024, Sunny Tuktuk and contributors
+# For license information, please see license.txt
+
+import frappe
+from tuktuk_hailing.api.place_index import get_search_keys, invalidate_place_index
+
+BATCH_SIZE = 500
+
+def execute():
+    """Fill name_key and search_key for places saved before the columns existed"""
+
+    frappe.reload_doc("tuktuk_hailing", "doctype", "hailing_place")
+
+    places = frappe.get_all(
+        "Hailing Place",
+        fields=["name", "place_name", "aliases", "category"]
+    )
+
+    for start in range(0, len(places), BATCH_SIZE):
+        updates = {}
+
+        for place in places[start:start + BATCH_SIZE]:
+            name_key, search_key = get_search_keys(place.place_name, place.aliases, place.category)
+            updates[place.name] = {"name_key": name_key, "search_key": search_key}
+
+        frappe.db.bulk_update("Hailing Place", updates, update_modified=False)
+
+    frappe.db.commit()
+    invalidate_place_index()